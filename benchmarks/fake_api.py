@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+
+"""
+Local stand-in for the Google Tasks API served over HTTP.
+
+Requests are answered from the in-memory backend of taskstodo and are not
+authenticated.
+"""
+
+import json
+import threading
+import http.server
+import urllib.parse
+
+from taskstodo import memory
+
+
+class RequestHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Handle HTTP requests with state of server.
+    """
+
+    protocol_version = 'HTTP/1.1'
+    # Headers and body are written separately, which would otherwise wait
+    # for delayed acknowledgements
+    disable_nagle_algorithm = True
+
+    def handle_request(self):
+        api = self.server.api
+        with api.lock:
+            api.http_requests += 1
+
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length) if length else b''
+        url = urllib.parse.urlsplit(self.path)
+        path = urllib.parse.unquote(url.path)
+
+        if path == memory.BATCH_PATH and self.command == 'POST':
+            content = api.call_batch(self.headers['Content-Type'],
+                                     body).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'multipart/mixed; boundary=' +
+                             memory.BOUNDARY)
+        else:
+            query = dict(urllib.parse.parse_qsl(url.query))
+            status, result = api.call(self.command, path, query,
+                                      json.loads(body) if body else None,
+                                      self.headers.get('If-Match'))
+            content = json.dumps(result).encode() if result is not None \
+                else b''
+            self.send_response(status)
+            self.send_header('Content-Type',
+                             'application/json; charset=UTF-8')
+
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port=0):
+    """
+    Start server on local port in background thread.
+
+    Return server, whose api attribute holds state of server and whose URL
+    is http://127.0.0.1:<server.server_port>/.
+    """
+
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port),
+                                             RequestHandler)
+    server.daemon_threads = True
+    server.api = memory.MemoryTasks()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+
+"""
+Time common operations of taskstodo against a local stand-in Tasks API
+server, or the in-memory backend, and write results as JSON.
+
+Run from root of repository:
+
+    python -m benchmarks.run [-m] [-s SIZE ...] [-o FILE] [-b BASELINE]
+"""
+
+import os
+import sys
+import io
+import json
+import time
+import argparse
+import platform
+import tempfile
+import contextlib
+
+from . import fake_api
+
+SIZES = [10, 1000, 10000]
+
+# Number of calcurse tasks added to Google by sync benchmark
+SYNC_NEW_TASKS = 10
+
+TITLE = 'benchmark'
+
+
+def seed_tasklist(api, num_tasks):
+    """
+    Create task list with tasks directly on server.
+    """
+
+    with api.lock:
+        tasklist = api.add_tasklist(TITLE)
+        for i in reversed(range(num_tasks)):
+            api.add_task(tasklist['id'], {'title': 'task {0}'.format(i)})
+        api.reset_counters()
+
+
+def bench_cache_rebuild(env, num_tasks):
+    seed_tasklist(env['api'], num_tasks)
+    return lambda: env['tasklists'].create_tasklist_cache(None)
+
+
+def bench_get_tasklist(env, num_tasks):
+    seed_tasklist(env['api'], num_tasks)
+    env['tasklists'].create_tasklist_cache(None)
+    return lambda: env['tasklists'].get_tasklist(None, TITLE, None)
+
+
+def run_task_commands(env, argv):
+    """
+    Get function that runs task commands like the batch command.
+    """
+
+    taskstodo = env['taskstodo']
+    commands = [taskstodo.parse_args(a) for a in argv]
+
+    def run():
+        with env['tasklists'].deferred_cache_refresh(None):
+            env['batch'].run_commands(None, commands, taskstodo.run_command)
+
+    return run
+
+
+def bench_bulk_create(env, num_tasks):
+    seed_tasklist(env['api'], 0)
+    env['tasklists'].create_tasklist_cache(None)
+    return run_task_commands(env, [['task', '-c', 'new task {0}'.format(i),
+                                    TITLE] for i in range(num_tasks)])
+
+
+def bench_bulk_delete(env, num_tasks):
+    seed_tasklist(env['api'], num_tasks)
+    env['tasklists'].create_tasklist_cache(None)
+    return run_task_commands(env, [['task', '-d', '-t', '1', TITLE]
+                                   for i in range(num_tasks)])
+
+
+def bench_sync(env, num_tasks):
+    seed_tasklist(env['api'], num_tasks)
+    env['tasklists'].create_tasklist_cache(None)
+
+    t_data_dir = tempfile.mkdtemp(dir=env['home'])
+    c_data_dir = tempfile.mkdtemp(dir=env['home'])
+    with open(os.path.join(c_data_dir, 'todo'), 'w') as f:
+        for i in range(SYNC_NEW_TASKS):
+            f.write('[0] calcurse task {0}\n'.format(i))
+
+    return lambda: env['calcurse'].sync_tasks(None, TITLE, None, False,
+                                              t_data_dir, c_data_dir)
+
+
+BENCHMARKS = [
+    ('cache_rebuild', bench_cache_rebuild),
+    ('get_tasklist', bench_get_tasklist),
+    ('bulk_create', bench_bulk_create),
+    ('bulk_delete', bench_bulk_delete),
+    ('sync_calcurse', bench_sync),
+]
+
+
+def run_benchmarks(sizes, names=None, in_memory=False):
+    """
+    Run benchmarks with each number of tasks, sending requests over HTTP
+    to a local server or answering them in memory.
+
+    Return list of dictionaries of results.
+    """
+
+    # Keep cache and sync files of benchmarks away from real ones
+    home = tempfile.mkdtemp()
+    os.environ['HOME'] = home
+    os.environ['TASKSTODO_NO_DAEMON'] = '1'
+
+    server = None
+    if in_memory:
+        os.environ['TASKSTODO_BACKEND'] = 'memory'
+    else:
+        server = fake_api.start_server()
+        os.environ['TASKSTODO_API_ENDPOINT'] = \
+            'http://127.0.0.1:{0}/'.format(server.server_port)
+
+    from taskstodo import batch
+    from taskstodo import calcurse
+    from taskstodo import memory
+    from taskstodo import tasklists
+    from taskstodo import taskstodo
+
+    store = server.api if server else memory.get_store()
+    env = {'api': store, 'home': home, 'batch': batch,
+           'calcurse': calcurse, 'tasklists': tasklists,
+           'taskstodo': taskstodo}
+
+    results = []
+    for name, setup in BENCHMARKS:
+        if names and name not in names:
+            continue
+        for size in sizes:
+            store.reset()
+            # Output of commands is not part of results
+            with contextlib.redirect_stdout(io.StringIO()):
+                func = setup(env, size)
+                store.reset_counters()
+                start = time.perf_counter()
+                func()
+                seconds = time.perf_counter() - start
+
+            result = {'name': name, 'tasks': size, 'seconds': seconds,
+                      'api_calls': store.api_calls,
+                      'http_requests': store.http_requests}
+            results.append(result)
+            print('{0:<16} {1:>6} {2:>10.3f} {3:>10} {4:>10}'.format(
+                name, size, seconds, result['api_calls'],
+                result['http_requests']), flush=True)
+
+    if server:
+        server.shutdown()
+    return results
+
+
+def compare_results(results, baseline):
+    """
+    Print change of time and API calls relative to baseline results.
+    """
+
+    old = {(r['name'], r['tasks']): r for r in baseline['results']}
+    print('\nChange from baseline:')
+    for r in results:
+        b = old.get((r['name'], r['tasks']))
+        if not b:
+            continue
+        print('{0:<16} {1:>6} {2:>+9.1%} {3:>+10}'.format(
+            r['name'], r['tasks'], r['seconds'] / b['seconds'] - 1,
+            r['api_calls'] - b['api_calls']))
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Run benchmarks against local stand-in Tasks API')
+    parser.add_argument('-m', '--memory', action='store_true',
+                        help='answer requests with in-memory backend '
+                        'instead of local server')
+    parser.add_argument('-s', '--sizes', metavar='number', nargs='+',
+                        type=int, default=SIZES,
+                        help='numbers of tasks (default: %(default)s)')
+    parser.add_argument('-n', '--name', metavar='name', nargs='+',
+                        choices=[b[0] for b in BENCHMARKS], dest='names',
+                        help='benchmarks to run (default: all)')
+    parser.add_argument('-o', '--output', metavar='file',
+                        default='benchmark-results.json',
+                        help='file to write results to (default: %(default)s)')
+    parser.add_argument('-b', '--baseline', metavar='file',
+                        help='results of earlier run to compare with')
+    args = parser.parse_args()
+
+    print('{0:<16} {1:>6} {2:>10} {3:>10} {4:>10}'.format(
+        'Benchmark', 'Tasks', 'Seconds', 'API calls', 'HTTP'))
+    results = run_benchmarks(args.sizes, args.names, args.memory)
+
+    with open(args.output, 'w') as f:
+        json.dump({'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                   'backend': 'memory' if args.memory else 'http',
+                   'python': platform.python_version(),
+                   'platform': platform.platform(),
+                   'results': results}, f, indent=4)
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            compare_results(results, json.load(f))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,225 @@
+#!/usr/bin/env python3
+
+"""
+Keep credentials, caches and sync state of several Google accounts apart,
+and sync task lists of several accounts in parallel.
+
+The default account uses the configuration and data directories of earlier
+versions, while named accounts use subdirectories of them.
+"""
+
+import os
+import re
+import sys
+
+CFG_DIR = os.path.expanduser('~/.config/taskstodo')
+DATA_DIR = os.path.expanduser('~/.local/share/taskstodo')
+
+# Account names, which are used as directory names
+ACCOUNT_RE = re.compile(r'^[\w@+-][\w.@+-]*$')
+
+# Account whose directories modules currently use
+_account = None
+
+
+def check_account(account):
+    """
+    Check if account name can be used as directory name.
+
+    Return account name, so it can be used as argument type.
+    """
+
+    if not ACCOUNT_RE.match(account):
+        raise ValueError('Invalid account name: {0}'.format(account))
+    return account
+
+
+def get_dirs(account):
+    """
+    Get configuration and data directories of account.
+    """
+
+    if account is None:
+        return CFG_DIR, DATA_DIR
+
+    check_account(account)
+    return (os.path.join(CFG_DIR, 'accounts', account),
+            os.path.join(DATA_DIR, 'accounts', account))
+
+
+def get_account():
+    return _account
+
+
+def use_account(account):
+    """
+    Use credentials, task list cache, search index, queued changes and sync
+    state of account.
+
+    Paths of modules are only changed when switching accounts, so commands
+    of the same account keep cached task lists loaded.
+    """
+
+    global _account
+
+    if account == _account:
+        return
+
+    from . import engine
+    from . import outbox
+    from . import search
+    from . import tasklists
+    from . import transfer
+
+    data_dir = get_dirs(account)[1]
+
+    tasklists.DATA_DIR = data_dir
+    tasklists.CACHE_FILE = os.path.join(data_dir, 'tasklists.json')
+    tasklists._loaded_cache = None
+
+    search.DATA_DIR = data_dir
+    search.CACHE_FILE = tasklists.CACHE_FILE
+    search.INDEX_FILE = os.path.join(data_dir, 'search.db')
+
+    transfer.DATA_DIR = data_dir
+    transfer.STATE_FILE = os.path.join(data_dir, 'import.state')
+
+    outbox.DATA_DIR = data_dir
+    outbox.OUTBOX_FILE = os.path.join(data_dir, 'outbox.jsonl')
+    outbox.LOG_FILE = os.path.join(data_dir, 'outbox.log')
+
+    engine.TASKSTODO_DIR = data_dir
+
+    _account = account
+
+
+def parse_job(spec):
+    """
+    Get account and task list title of sync job given as
+    [account:]list_title.
+    """
+
+    account, sep, list_title = spec.partition(':')
+    if not sep:
+        return None, spec
+    return check_account(account) if account else None, list_title
+
+
+def get_sync_argv(spec, calcurse_dir=None, verbose=False):
+    """
+    Get command line arguments of calcurse sync of job.
+
+    Calcurse directory may contain {account}, which is replaced by name of
+    account of job.
+    """
+
+    account, list_title = parse_job(spec)
+    argv = ['sync-calcurse', list_title]
+    if account:
+        argv = ['--account', account] + argv
+    if calcurse_dir:
+        argv += ['--calcurse-dir', os.path.expanduser(
+            calcurse_dir.format(account=account or 'default'))]
+    if verbose:
+        argv.append('--verbose')
+    return argv
+
+
+def group_jobs(jobs):
+    """
+    Group sync jobs, given as command line arguments, that must not run at
+    the same time, as they share an account or a calcurse directory.
+
+    Return list of groups, each a list of job numbers in order, in order
+    of their first job.
+    """
+
+    from .taskstodo import parse_args
+    from . import calcurse
+
+    groups = []
+    for job_num, argv in enumerate(jobs):
+        args = parse_args(argv)
+        keys = {('account', args.account),
+                ('calcurse', os.path.abspath(args.calcurse_dir or
+                                             calcurse.CALCURSE_DIR))}
+        job_nums = [job_num]
+        for other in [g for g in groups if g[0] & keys]:
+            groups.remove(other)
+            keys |= other[0]
+            job_nums = other[1] + job_nums
+        groups.append((keys, job_nums))
+
+    return sorted(sorted(job_nums) for _, job_nums in groups)
+
+
+def run_jobs(jobs, isolated=False):
+    """
+    Run commands of sync jobs in sequence and capture their output.
+
+    Return list of responses with output and exit status of each job, and
+    metric samples of jobs if run isolated in a worker process.
+    """
+
+    from .taskstodo import run_command, parse_args
+    from . import daemon
+    from . import metrics
+
+    if isolated:
+        # Only count samples of jobs, not those inherited from parent
+        metrics.reset()
+
+    responses = []
+    for argv in jobs:
+        request = {'argv': argv, 'cwd': os.getcwd()}
+        responses.append(daemon.run_request(
+            request, lambda argv: run_command(parse_args(argv))))
+
+    return responses, metrics.get_samples() if isolated else None
+
+
+def sync_all(jobs, workers=None):
+    """
+    Run sync jobs, each given as command line arguments, in a pool of
+    worker processes and print their output in given order.
+
+    Jobs sharing an account or calcurse directory run in sequence in the
+    same worker. If only one worker is used, jobs run in this process.
+
+    Return whether all jobs succeeded.
+    """
+
+    import concurrent.futures
+
+    from . import metrics
+
+    groups = group_jobs(jobs)
+    workers = min(workers or os.cpu_count() or 1, len(groups))
+
+    responses = {}
+    if workers <= 1:
+        for job_nums in groups:
+            group_responses, _ = run_jobs([jobs[i] for i in job_nums])
+            responses.update(zip(job_nums, group_responses))
+    else:
+        with concurrent.futures.ProcessPoolExecutor(workers) as executor:
+            futures = {executor.submit(run_jobs, [jobs[i] for i in job_nums],
+                                       True): job_nums
+                       for job_nums in groups}
+            for future in concurrent.futures.as_completed(futures):
+                group_responses, samples = future.result()
+                responses.update(zip(futures[future], group_responses))
+                metrics.add_samples(samples)
+
+    success = True
+    for job_num, argv in enumerate(jobs):
+        response = responses[job_num]
+        print('==> {0} <=='.format(' '.join(argv)))
+        sys.stdout.write(response['stdout'])
+        sys.stderr.write(response['stderr'])
+        if response['status']:
+            print('Sync failed with exit status {0}.'.format(
+                response['status']), file=sys.stderr)
+            success = False
+
+    return success
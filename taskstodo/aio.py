@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+"""
+Send API requests concurrently from asyncio code, with a bounded number of
+requests in flight.
+"""
+
+import os
+import asyncio
+import threading
+import concurrent.futures
+
+from . import api
+
+DEFAULT_CONCURRENCY = 8
+
+# Threads that send requests, shared by all clients of the process
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_concurrency():
+    """
+    Get number of requests sent at the same time, set with
+    TASKSTODO_CONCURRENCY.
+    """
+
+    return max(1, int(os.environ.get('TASKSTODO_CONCURRENCY') or
+                      DEFAULT_CONCURRENCY))
+
+
+def get_executor():
+    """
+    Get pool of threads that send requests.
+
+    Each thread keeps its own service and connections, so they are reused
+    by later requests and commands of long-running processes.
+    """
+
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = concurrent.futures.ThreadPoolExecutor(
+                max_workers=get_concurrency(),
+                thread_name_prefix='taskstodo-api')
+        return _executor
+
+
+class Client:
+    """
+    Client of the Tasks API whose methods are coroutines.
+
+    Requests wait for a free thread of the shared pool, so no more than
+    the concurrency limit are sent at once however many are awaited.
+    Requests that were not sent yet are dropped when their coroutine is
+    cancelled.
+    """
+
+    def __init__(self, creds):
+        self.creds = creds
+
+    async def call(self, func):
+        """
+        Call func with service of a thread from the pool and return its
+        result.
+        """
+
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_executor(), lambda: func(api.build_service(self.creds)))
+
+    async def execute(self, build_request):
+        """
+        Execute request built by build_request with a service.
+        """
+
+        return await self.call(lambda service: build_request(service)
+                               .execute())
+
+    async def list_tasklists(self):
+        from . import tasklists
+
+        return await self.call(lambda service: list(
+            tasklists.list_tasklists(service)))
+
+    async def list_tasks(self, tasklist_id, show_hidden=False):
+        from . import tasklists
+
+        return await self.call(lambda service: list(
+            tasklists.list_tasks(service, tasklist_id, show_hidden)))
+
+    async def get_task(self, tasklist_id, task_id):
+        return await self.execute(lambda service: service.tasks().get(
+            tasklist=tasklist_id, task=task_id))
+
+    async def insert_task(self, tasklist_id, body, parent=None,
+                          previous=None):
+        return await self.execute(lambda service: service.tasks().insert(
+            tasklist=tasklist_id, body=body, parent=parent,
+            previous=previous))
+
+    async def patch_task(self, tasklist_id, task_id, body):
+        return await self.execute(lambda service: service.tasks().patch(
+            tasklist=tasklist_id, task=task_id, body=body))
+
+    async def move_task(self, tasklist_id, task_id, parent=None,
+                        previous=None):
+        return await self.execute(lambda service: service.tasks().move(
+            tasklist=tasklist_id, task=task_id, parent=parent,
+            previous=previous))
+
+    async def delete_task(self, tasklist_id, task_id):
+        return await self.execute(lambda service: service.tasks().delete(
+            tasklist=tasklist_id, task=task_id))
+
+
+async def gather(*aws):
+    """
+    Wait for awaitables to finish and return their results in order.
+
+    If one fails, the others are cancelled and its exception is raised.
+    """
+
+    futures = [asyncio.ensure_future(aw) for aw in aws]
+    try:
+        return await asyncio.gather(*futures)
+    except BaseException:
+        for future in futures:
+            future.cancel()
+        await asyncio.gather(*futures, return_exceptions=True)
+        raise
+
+
+def run(coro):
+    """
+    Run coroutine in a new event loop and return its result.
+    """
+
+    return asyncio.run(coro)
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+
+"""
+Build services to access the Google Tasks API.
+"""
+
+import os
+import threading
+
+from . import trace
+
+# Services are not thread safe, so each thread keeps its own services
+_local = threading.local()
+
+ROOT_URL = 'https://tasks.googleapis.com/'
+
+BACKENDS = ['google', 'memory']
+
+
+class EndpointHttp:
+    """
+    HTTP client that sends requests for the Tasks API to another server,
+    such as a local stand-in server used by benchmarks.
+    """
+
+    def __init__(self, http, endpoint):
+        self.http = http
+        self.endpoint = endpoint.rstrip('/') + '/'
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, *args, **kwargs):
+        if uri.startswith(ROOT_URL):
+            uri = self.endpoint + uri[len(ROOT_URL):]
+        return self.http.request(uri, *args, **kwargs)
+
+
+def get_backend():
+    """
+    Get name of backend that answers API requests, set with
+    TASKSTODO_BACKEND.
+    """
+
+    backend = os.environ.get('TASKSTODO_BACKEND') or BACKENDS[0]
+    if backend not in BACKENDS:
+        raise ValueError('Unknown backend: ' + backend)
+    return backend
+
+
+def uses_credentials():
+    """
+    Check if API requests need user credentials.
+    """
+
+    return (get_backend() == 'google'
+            and not os.environ.get('TASKSTODO_API_ENDPOINT')
+            and not os.environ.get('TASKSTODO_REPLAY'))
+
+
+def build_service(creds):
+    """
+    Build Tasks API service with user credentials.
+
+    Services are reused for the same credentials within a thread. The API
+    client is imported on first use, so commands that do not access the
+    network do not pay for loading it. Services built while tracing record
+    their requests.
+
+    If TASKSTODO_API_ENDPOINT is set, requests are sent to that server
+    without credentials. With the memory backend, requests are answered by
+    a store in this process.
+
+    If TASKSTODO_RECORD is set, requests and responses are recorded to that
+    directory. If TASKSTODO_REPLAY is set, requests are answered from the
+    recording in that directory instead, after the recorded latency or
+    TASKSTODO_REPLAY_LATENCY milliseconds.
+    """
+
+    services = getattr(_local, 'services', None)
+    if services is None:
+        services = _local.services = {}
+
+    key = (id(creds), trace.is_enabled(), get_backend())
+    trace.record_cache('service', key in services)
+    if key not in services:
+        from googleapiclient.discovery import build
+
+        from googleapiclient.http import build_http
+
+        kwargs = {}
+        endpoint = os.environ.get('TASKSTODO_API_ENDPOINT')
+        replay_dir = os.environ.get('TASKSTODO_REPLAY')
+        record_dir = os.environ.get('TASKSTODO_RECORD')
+        if replay_dir:
+            from . import replay
+
+            latency = os.environ.get('TASKSTODO_REPLAY_LATENCY')
+            kwargs['http'] = replay.get_replay(
+                replay_dir, float(latency) / 1000 if latency else None)
+        elif get_backend() == 'memory':
+            from . import memory
+
+            kwargs['http'] = memory.MemoryHttp(memory.get_store())
+        elif endpoint:
+            kwargs['http'] = EndpointHttp(build_http(), endpoint)
+
+        if record_dir and not replay_dir:
+            from . import replay
+
+            http = kwargs.get('http')
+            if http is None:
+                import google_auth_httplib2
+
+                # Record outside of authorization so tokens are not seen
+                http = google_auth_httplib2.AuthorizedHttp(
+                    creds, http=build_http())
+            kwargs['http'] = replay.RecordingHttp(http, record_dir)
+
+        if trace.is_enabled():
+            kwargs.update(trace.build_args(creds, kwargs.get('http')))
+        elif 'http' not in kwargs:
+            kwargs['credentials'] = creds
+        service = build('tasks', 'v1', **kwargs)
+        # Keep credentials with service so their ID is not reused
+        services[key] = (creds, service)
+
+    return services[key][1]
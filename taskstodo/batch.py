@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+
+"""
+Run many commands in one process and combine task changes into batch
+requests.
+"""
+
+from . import api
+from . import models
+from . import tasklists
+from .tasks import print_duplicate_tasks
+
+from googleapiclient.errors import HttpError
+
+# Max number of requests sent in one batch request
+BATCH_SIZE = 50
+
+
+def is_batchable(args):
+    """
+    Check if command only creates or changes single tasks.
+
+    Tasks created at a given place are not batched, as their place depends
+    on tasks created before them.
+    """
+
+    if args.command != 'task' or args.background:
+        return False
+    if args.create:
+        return (args.position is None and args.after is None and
+                args.parent is None)
+    return bool(args.delete or args.update or args.note)
+
+
+def queue_task_change(service, list_id, tasks, args, queue):
+    """
+    Add request for task change to queue and apply it to local list of tasks.
+
+    Return False if local list of tasks has to be reloaded first.
+    """
+
+    if not args.create:
+        if args.task_id is not None or args.match is not None:
+            if args.task_id is not None:
+                matches = [t for t in tasks if t.id == args.task_id]
+            else:
+                matches = [t for t in tasks if t.title == args.match]
+            if any(t.id is None for t in matches):
+                # Task may be created by queued request
+                return False
+            if not matches:
+                print('Task does not exist')
+                return True
+            if len(matches) > 1:
+                print_duplicate_tasks([t.id for t in matches])
+                return True
+            task = matches[0]
+        elif (args.task_num is None or args.task_num < 0
+                or args.task_num > len(tasks) - 1):
+            print('Invalid task number')
+            return True
+        else:
+            task = tasks[args.task_num]
+        if task.id is None:
+            # Task is created by queued request
+            return False
+
+    if args.create:
+        task_id = None
+        task = {'title': args.create}
+        if args.note:
+            task['notes'] = args.note
+        request = service.tasks().insert(tasklist=list_id, body=task)
+        # New tasks are added to top of task list
+        tasks.insert(0, models.Task(args.create))
+    elif args.delete:
+        task_id = task.id
+        request = service.tasks().delete(tasklist=list_id, task=task.id)
+        tasks.remove(task)
+    elif args.update:
+        task_id = task.id
+        request = service.tasks().patch(tasklist=list_id, task=task.id,
+                                        body={'title': args.update})
+        tasks[tasks.index(task)] = task.replace(title=args.update)
+    else:
+        task_id = task.id
+        # Accept new line character
+        note = args.note.replace('\\n', '\n')
+        request = service.tasks().patch(tasklist=list_id, task=task.id,
+                                        body={'notes': note})
+
+    queue.append((request, args, list_id, task_id))
+    return True
+
+
+def order_created_tasks(service, list_id, task_ids):
+    """
+    Move tasks created in batch requests to top of task list, with the task
+    created last first, as if they were created one at a time.
+
+    Return number of moved tasks.
+    """
+
+    expected = list(reversed(task_ids))
+    items = [item for item in tasklists.list_tasks(service, list_id)
+             if not item.get('parent')]
+    items.sort(key=lambda item: item['position'])
+    actual = [item['id'] for item in items]
+
+    moved = 0
+    for i, task_id in enumerate(expected):
+        if i < len(actual) and actual[i] == task_id:
+            continue
+        service.tasks().move(tasklist=list_id, task=task_id,
+                             previous=expected[i - 1] if i else None).execute()
+        if task_id in actual:
+            actual.remove(task_id)
+        actual.insert(i, task_id)
+        moved += 1
+
+    return moved
+
+
+def send_batch(creds, service, queue):
+    """
+    Send queued requests in batch requests and empty queue.
+
+    The server may run requests of a batch request in any order, so tasks
+    created in them are moved into order afterwards. Changes are applied to
+    cache file right away, as its refresh may be deferred until all
+    commands of a batch ran.
+    """
+
+    if not queue:
+        return
+
+    # IDs of created tasks by task list and number of their request
+    created = {}
+    # Results of successful requests by their number
+    results = {}
+
+    def callback(request_id, response, err):
+        args, list_id = queue[int(request_id)][1:3]
+        if err:
+            if args.verbose:
+                print(err)
+            else:
+                print(err._get_reason())
+            return
+        results[int(request_id)] = response
+        if args.create:
+            created.setdefault(list_id, {})[int(request_id)] = response['id']
+
+    for start in range(0, len(queue), BATCH_SIZE):
+        batch = service.new_batch_http_request(callback=callback)
+        for i in range(start, min(start + BATCH_SIZE, len(queue))):
+            batch.add(queue[i][0], request_id=str(i))
+        batch.execute()
+
+    for list_id, task_ids in created.items():
+        if len(task_ids) > 1:
+            try:
+                order_created_tasks(service, list_id, [
+                    task_ids[i] for i in sorted(task_ids)])
+            except HttpError as err:
+                print(err._get_reason())
+
+    # New tasks are added to top of cached task list in order of requests,
+    # like on server
+    with tasklists.deferred_cache_writes():
+        for i, (_, args, list_id, task_id) in enumerate(queue):
+            if i not in results:
+                continue
+            if args.delete:
+                tasklists.update_cached_task(list_id, deleted_id=task_id)
+            else:
+                tasklists.update_cached_task(list_id, results[i])
+
+    queue.clear()
+
+    # Update cache file
+    tasklists.refresh_tasklist_cache(creds)
+
+
+def run_commands(creds, commands, run_command):
+    """
+    Run parsed commands in order.
+
+    Consecutive task changes on the same task list are resolved against a
+    local copy of the task list and sent together in batch requests. Other
+    commands are passed to run_command once queued changes are sent.
+    """
+
+    service = api.build_service(creds)
+    tasklist = None
+    tasklist_key = None
+    # Tasks of task list with queued changes applied
+    tasks = None
+    queue = []
+
+    for args in commands:
+        if not is_batchable(args):
+            send_batch(creds, service, queue)
+            tasklist = None
+            tasklist_key = None
+            run_command(args)
+            continue
+
+        key = (args.list_title, args.list_num)
+        if key != tasklist_key:
+            send_batch(creds, service, queue)
+            tasklist = tasklists.get_tasklist(creds, args.list_title,
+                                              args.list_num)
+            tasklist_key = key
+            tasks = list(tasklist.tasks) if tasklist else None
+        if not tasklist:
+            tasklist_key = None
+            continue
+
+        if not queue_task_change(service, tasklist.id, tasks, args, queue):
+            # Send queued requests to get IDs of created tasks
+            send_batch(creds, service, queue)
+            tasklist = tasklists.get_tasklist(creds, args.list_title,
+                                              args.list_num)
+            if tasklist:
+                tasks = list(tasklist.tasks)
+                queue_task_change(service, tasklist.id, tasks, args, queue)
+
+        if len(queue) >= BATCH_SIZE:
+            send_batch(creds, service, queue)
+
+    send_batch(creds, service, queue)
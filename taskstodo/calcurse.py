@@ -5,18 +5,26 @@ Synchronize Google Tasks and calcurse TODO lists.
 """
 
 import os
-import sys
+import re
+import shutil
 import hashlib
-import threading
-import time
-import json
-import pprint
+import collections
 
-from . import tasklists
-from . import tasks
+from . import models
+from . import sync
 
 CALCURSE_DIR = os.path.expanduser('~/.local/share/calcurse')
-TASKSTODO_DIR = os.path.expanduser('~/.local/share/taskstodo')
+
+# Note references of todo items and of appointments or events
+TODO_NOTE_RE = re.compile(r'^\[-?\d+\]>([0-9a-f]{40}) ')
+NOTE_RE = re.compile(r'>([0-9a-f]{40})')
+
+# Todo items, which calcurse marks as completed with a negative priority
+TODO_RE = re.compile(r'^\[(-?)(\d+)\](?:>([0-9a-f]{40}))? ?(.*)$')
+
+# Priority of completed tasks without priority, as a priority of 0 cannot
+# be negative. Tasks with this priority are reopened without priority.
+COMPLETED_PRIORITY = 9
 
 
 def get_calcurse_tasks(data_dir=CALCURSE_DIR):
@@ -28,194 +36,230 @@ def get_calcurse_tasks(data_dir=CALCURSE_DIR):
         task_lines = f.readlines()
 
     tasks = []
-    task_slice = slice(4, -1)
 
     for task_line in task_lines:
-        task = {}
+        match = TODO_RE.match(task_line.rstrip('\n'))
+        if not match:
+            continue
+        completed = bool(match.group(1))
 
         # Check for task note
-        if task_line[3] == '>':
-            note_id = task_line.split()[0][4:]
-            task_line = task_line[task_slice].split()[1:]
-            task_line = ' '.join(task_line)
+        note_id = match.group(3)
+        if note_id:
             with open(os.path.join(data_dir, 'notes', note_id)) as f:
                 note = f.read().rstrip('\n')
 
-            task['title'] = task_line
-            task['note'] = note
+            task = models.Task(' '.join(match.group(4).split()), note,
+                               completed=completed)
         else:
-            task['title'] = task_line[task_slice]
+            task = models.Task(match.group(4), completed=completed)
 
         tasks.append(task)
 
     return tasks
 
 
-def add_calcurse_tasks(new_tasks, data_dir=CALCURSE_DIR):
+def set_completed(task_line, completed):
     """
-    Add tasks to calcurse.
+    Change completion status of line of todo file by sign of its priority.
     """
 
-    with open(os.path.join(data_dir, 'todo'), 'a') as f:
-        for task in new_tasks:
-            if task.get('note'):
-                # Compute and add hash of note
-                note_bytes = bytes(f"{task['note']}\n", 'utf-8')
-                note_hash = hashlib.sha1(note_bytes).hexdigest()
-                f.write(f"[0]>{note_hash} {task['title']}\n")
+    match = TODO_RE.match(task_line)
+    priority = int(match.group(2))
+    if completed and not priority:
+        priority = COMPLETED_PRIORITY
+    elif (not completed and match.group(1) and
+            priority == COMPLETED_PRIORITY):
+        priority = 0
+    return '[{0}{1}]{2}'.format('-' if completed else '', priority,
+                                task_line[match.end(2) + 1:])
 
-                with open(os.path.join(data_dir, 'notes', note_hash), 'w') as n:
-                    n.write(task['note'] + '\n')
-            else:
-                f.write(f"[0] {task['title']}\n")
 
+def get_note_hash(note):
+    """
+    Get hash that calcurse stores note under, or None if there is no note.
+    """
 
-def delete_calcurse_tasks(old_tasks, data_dir=CALCURSE_DIR):
+    if not note:
+        return None
+    return hashlib.sha1(bytes(f"{note}\n", 'utf-8')).hexdigest()
+
+
+def get_note_refs(data_dir=CALCURSE_DIR, files=('todo', 'apts')):
     """
-    Delete tasks from calcurse.
+    Count references to notes from calcurse todo and appointment files.
+
+    Return counter of note hashes.
     """
 
-    todo_file = os.path.join(data_dir, 'todo')
-    with open(todo_file, 'r') as f:
-        cur_tasks = f.readlines()
+    refs = collections.Counter()
+    for name in files:
+        note_re = TODO_NOTE_RE if name == 'todo' else NOTE_RE
+        try:
+            with open(os.path.join(data_dir, name)) as f:
+                for line in f:
+                    match = note_re.search(line)
+                    if match:
+                        refs[match.group(1)] += 1
+        except FileNotFoundError:
+            pass
 
-    old_tasks = [t['title'] for t in old_tasks]
-    with open(todo_file, 'w') as f:
-        for task in cur_tasks:
-            task_string = ' '.join(task.split()[1:])
-            if task_string not in old_tasks:
-                f.write(task)
+    return refs
+
+
+def delete_notes(note_hashes, data_dir=CALCURSE_DIR):
+    """
+    Delete note files.
+    """
+
+    for note_hash in note_hashes:
+        try:
+            os.remove(os.path.join(data_dir, 'notes', note_hash))
+        except FileNotFoundError:
+            pass
+
+
+def delete_unused_notes(data_dir=CALCURSE_DIR, verbose=False):
+    """
+    Delete note files not referenced by any calcurse todo or appointment.
+    """
+
+    refs = get_note_refs(data_dir)
+
+    notes_dir = os.path.join(data_dir, 'notes')
+    if not os.path.exists(notes_dir):
+        return
 
+    note_hashes = []
+    for name in os.listdir(notes_dir):
+        if re.fullmatch('[0-9a-f]{40}', name) and name not in refs:
+            note_hashes.append(name)
 
-def get_google_tasks(creds, list_title, list_num):
+    delete_notes(note_hashes, data_dir)
+
+    if verbose:
+        for note_hash in note_hashes:
+            print('Deleted note: {0}'.format(note_hash))
+        print('Deleted {0} unused notes'.format(len(note_hashes)))
+
+
+def update_calcurse_tasks(old_tasks, new_tasks, data_dir=CALCURSE_DIR,
+                          status_tasks=()):
     """
-    Get Google Tasks from server and return tasks as list.
+    Delete and add calcurse tasks, and change completion status of tasks to
+    that of status tasks with the same title and note, in a single pass over
+    the todo file.
+
+    The updated todo file is written to a temporary file that then replaces
+    the original, so calcurse never reads a partially written todo file.
+    Notes are only written if they are not already stored, and notes of
+    deleted tasks are removed once nothing refers to them.
+    """
+
+    todo_file = os.path.join(data_dir, 'todo')
+    temp_file = todo_file + '.tmp'
+    old_titles = {t.title for t in old_tasks}
+    statuses = {(t.title, get_note_hash(t.note)): t.completed
+                for t in status_tasks}
+
+    # Reference counts of notes used by updated todo file
+    refs = collections.Counter()
+    old_note_hashes = set()
+
+    with open(todo_file, 'r') as f, open(temp_file, 'w') as temp:
+        for task in f:
+            match = TODO_NOTE_RE.match(task)
+            task_string = ' '.join(task.split()[1:])
+            status_key = (task_string, match and match.group(1))
+            if status_key in statuses:
+                task = set_completed(task, statuses[status_key])
+            if task_string not in old_titles:
+                temp.write(task)
+                if match:
+                    refs[match.group(1)] += 1
+            elif match:
+                old_note_hashes.add(match.group(1))
+
+        for task in new_tasks:
+            priority = f'-{COMPLETED_PRIORITY}' if task.completed else '0'
+            if task.note:
+                # Compute and add hash of note
+                note_hash = get_note_hash(task.note)
+                temp.write(f"[{priority}]>{note_hash} {task.title}\n")
+
+                note_file = os.path.join(data_dir, 'notes', note_hash)
+                if not refs[note_hash] and not os.path.exists(note_file):
+                    with open(note_file, 'w') as n:
+                        n.write(task.note + '\n')
+                refs[note_hash] += 1
+            else:
+                temp.write(f"[{priority}] {task.title}\n")
+
+        temp.flush()
+        os.fsync(temp.fileno())
+
+    shutil.copymode(todo_file, temp_file)
+    os.replace(temp_file, todo_file)
 
-    Formats data to allow for comparison with calcurse.
+    # Delete notes of deleted tasks unless still in use
+    unused = {h for h in old_note_hashes if not refs[h]}
+    if unused:
+        unused -= set(get_note_refs(data_dir, ('apts',)))
+        delete_notes(unused, data_dir)
+
+
+def add_calcurse_tasks(new_tasks, data_dir=CALCURSE_DIR):
     """
+    Add tasks to calcurse.
+    """
+
+    update_calcurse_tasks([], new_tasks, data_dir)
+
 
-    tasks = tasklists.get_tasklist(creds, list_title, list_num)
-    if tasks:
-        tasks = tasks['tasks']
-        for task in tasks:
-            task.pop('id')
-            task.pop('updated')
-            task.pop('position')
-            if not task['note']:
-                task.pop('note')
+def delete_calcurse_tasks(old_tasks, data_dir=CALCURSE_DIR):
+    """
+    Delete tasks from calcurse.
+    """
 
-        return tasks
+    update_calcurse_tasks(old_tasks, [], data_dir)
 
 
-def delete_google_tasks(creds, list_title, old_tasks):
+class Adapter(sync.SyncAdapter):
     """
-    Delete tasks from Google.
+    Sync adapter of calcurse todo list.
     """
 
-    cur_tasks = tasklists.get_tasklist(creds, list_title, None)['tasks']
-    cur_tasks = [t['title'] for t in cur_tasks]
-    old_tasks = [t['title'] for t in old_tasks]
+    name = 'calcurse'
+    data_dir = CALCURSE_DIR
 
-    # Delete tasks in reverse order to prevent shifting index
-    for task in reversed(old_tasks):
-        if task in cur_tasks:
-            task_num = cur_tasks.index(task)
-            tasks.delete_task(creds, list_title, task_num, None, False)
+    def read_tasks(self):
+        return get_calcurse_tasks(self.data_dir)
 
+    def apply_changes(self, old_tasks, new_tasks, status_tasks):
+        update_calcurse_tasks(old_tasks, new_tasks, self.data_dir,
+                              status_tasks)
 
-def add_google_tasks(creds, list_title, list_num, new_tasks):
+
+def print_sync_plan(creds, list_title, list_num, verbose,
+                    t_data_dir=None, c_data_dir=CALCURSE_DIR):
     """
-    Add tasks to Google Tasks.
+    Print out operations a sync with calcurse would perform and their
+    estimated cost without changing any tasks.
     """
 
-    for t, new_task in enumerate(list(reversed(new_tasks))):
-        t = threading.Thread(target=tasks.create_task,
-                             args=(creds, list_title, new_task['title'],
-                                   new_task.get('note'), list_num, False))
-        time.sleep(0.1)  # Helps keep insertion order of tasks
-        t.start()
+    from . import engine
+
+    engine.print_sync_plan(creds, list_title, list_num, verbose,
+                           Adapter(c_data_dir), t_data_dir)
 
 
 def sync_tasks(creds, list_title, list_num, verbose,
-               t_data_dir=TASKSTODO_DIR, c_data_dir=CALCURSE_DIR):
+               t_data_dir=None, c_data_dir=CALCURSE_DIR):
     """
     Sync Google and calcurse tasks.
     """
 
-    if not os.path.exists(t_data_dir):
-        os.mkdir(t_data_dir)
-
-    # Check for or create lock file to prevent multiple running instances
-    lock = os.path.join(t_data_dir, 'lock')
-    if os.path.exists(lock):
-        print('An existing instance is already running or lock was not' +
-              'released.', file=sys.stderr)
-        sys.exit(1)
-    else:
-        os.mknod(lock, mode=0o644)
-
-    # Read in synced task list if available
-    sync_file = os.path.join(t_data_dir, 'calcurse-sync.json')
-    synced_tasks = []
-    try:
-        with open(sync_file, 'r') as f:
-            synced_tasks = json.load(f)
-    except FileNotFoundError:
-        pass
-
-    try:
-        # Read in Google Tasks list
-        g_tasks = get_google_tasks(creds, list_title, list_num)
-        if g_tasks is None:
-            return
-
-        # Read in calcurse todo list
-        c_tasks = get_calcurse_tasks(c_data_dir)
-
-        # Compare Google Tasks to calcurse and get tasks to add or delete
-        new_c_tasks = []
-        old_g_tasks = []
-        for g_task in g_tasks:
-            if g_task not in c_tasks:
-                if g_task not in synced_tasks:
-                    new_c_tasks.append(g_task)
-                else:
-                    old_g_tasks.append(g_task)
-
-        delete_google_tasks(creds, list_title, old_g_tasks)
-        add_calcurse_tasks(new_c_tasks, c_data_dir)
-
-        # Compare calcurse to Google Tasks and get tasks to add or delete
-        new_g_tasks = []
-        old_c_tasks = []
-        for c_task in c_tasks:
-            if c_task not in g_tasks:
-                if c_task not in synced_tasks:
-                    new_g_tasks.append(c_task)
-                else:
-                    old_c_tasks.append(c_task)
-
-        delete_calcurse_tasks(old_c_tasks, c_data_dir)
-        add_google_tasks(creds, list_title, list_num, new_g_tasks)
-
-        # Updated synced tasks
-        synced_tasks = get_calcurse_tasks(c_data_dir)
-
-        with open(sync_file, 'w') as f:
-            json.dump(synced_tasks, f)
-    finally:
-        os.remove(lock)
+    from . import engine
 
-    if verbose:
-        print('Google tasks:')
-        pprint.pp(g_tasks)
-        print('\ncalcurse tasks:')
-        pprint.pp(c_tasks)
-        print('\ncalcurse tasks added:')
-        pprint.pp(new_c_tasks)
-        print('\nGoogle tasks added:')
-        pprint.pp(new_g_tasks)
-        print('\ncalcurse tasks deleted:')
-        pprint.pp(old_c_tasks)
-        print('\nGoogle tasks deleted:')
-        pprint.pp(old_g_tasks)
+    engine.sync_tasks(creds, list_title, list_num, verbose,
+                      Adapter(c_data_dir), t_data_dir)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+
+"""
+Run commands in a long-running process that clients reach over a Unix
+socket, so credentials, API services and cached task lists stay loaded.
+"""
+
+import os
+import sys
+import io
+import json
+import socket
+import signal
+import contextlib
+import traceback
+
+RUNTIME_DIR = (os.environ.get('XDG_RUNTIME_DIR') or
+               os.path.expanduser('~/.local/share/taskstodo'))
+SOCKET_FILE = os.path.join(RUNTIME_DIR, 'taskstodo.sock')
+
+
+def send_command(argv, stdin=None):
+    """
+    Forward command line arguments to running daemon and print its output.
+
+    Return exit status of command, or None if no daemon is running.
+    """
+
+    if not os.path.exists(SOCKET_FILE):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(SOCKET_FILE)
+    except (ConnectionRefusedError, FileNotFoundError):
+        # Daemon is not running but left its socket behind
+        sock.close()
+        return None
+
+    request = {'argv': argv, 'cwd': os.getcwd(), 'stdin': stdin}
+    with sock, sock.makefile('rwb') as f:
+        f.write(json.dumps(request).encode('utf-8') + b'\n')
+        f.flush()
+        response = f.readline()
+
+    if not response:
+        print('Daemon stopped before command finished.', file=sys.stderr)
+        return 1
+
+    response = json.loads(response)
+    sys.stdout.write(response['stdout'])
+    sys.stderr.write(response['stderr'])
+    return response['status']
+
+
+def is_running():
+    """
+    Check if daemon is running.
+    """
+
+    return send_command(None) is not None
+
+
+def run_request(request, run_argv):
+    """
+    Run command of request and capture its output.
+
+    Return dictionary of response.
+    """
+
+    stdout = io.StringIO()
+    stderr = io.StringIO()
+    status = 0
+
+    cwd = os.getcwd()
+    stdin = sys.stdin
+    try:
+        os.chdir(request['cwd'])
+        sys.stdin = io.StringIO(request.get('stdin') or '')
+        with contextlib.redirect_stdout(stdout), \
+                contextlib.redirect_stderr(stderr):
+            try:
+                run_argv(request['argv'])
+            except SystemExit as err:
+                if isinstance(err.code, int):
+                    status = err.code
+                elif err.code is not None:
+                    print(err.code, file=sys.stderr)
+                    status = 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+    finally:
+        os.chdir(cwd)
+        sys.stdin = stdin
+
+    return {'stdout': stdout.getvalue(), 'stderr': stderr.getvalue(),
+            'status': status}
+
+
+def handle_request(line, run_argv, verbose=False):
+    """
+    Run command of request line received from client.
+
+    Return dictionary of response, which reports malformed requests as
+    failed commands instead of raising errors.
+    """
+
+    try:
+        request = json.loads(line)
+        if request['argv'] is None:
+            # Check if daemon is running
+            return {'stdout': '', 'stderr': '', 'status': 0}
+        if verbose:
+            print('Running: {0}'.format(' '.join(request['argv'])),
+                  flush=True)
+        return run_request(request, run_argv)
+    except (ValueError, KeyError, TypeError, OSError) as err:
+        return {'stdout': '',
+                'stderr': 'Invalid request: {0!r}\n'.format(err),
+                'status': 1}
+
+
+def serve(run_argv, verbose):
+    """
+    Serve commands on Unix socket until interrupted.
+
+    Commands are run one at a time by calling run_argv with their command
+    line arguments.
+    """
+
+    if not os.path.exists(RUNTIME_DIR):
+        os.makedirs(RUNTIME_DIR)
+
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(SOCKET_FILE)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    # Only allow current user to connect
+    umask = os.umask(0o177)
+    try:
+        server.bind(SOCKET_FILE)
+    finally:
+        os.umask(umask)
+    server.listen()
+
+    # Remove socket when daemon is stopped
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+
+    if verbose:
+        print('Listening on {0}'.format(SOCKET_FILE), flush=True)
+
+    try:
+        while True:
+            conn, _ = server.accept()
+            with conn, conn.makefile('rwb') as f:
+                request = f.readline()
+                if not request:
+                    continue
+                response = handle_request(request, run_argv, verbose)
+                try:
+                    f.write(json.dumps(response).encode('utf-8') + b'\n')
+                    f.flush()
+                except BrokenPipeError:
+                    pass
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(SOCKET_FILE)
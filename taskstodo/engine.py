@@ -0,0 +1,660 @@
+#!/usr/bin/env python3
+
+"""
+Sync Google Tasks with local task stores through adapters.
+
+Adapters read and change tasks of a local store, while planning changes,
+sync state, journals, locking and changes on Google are shared by all of
+them.
+"""
+
+import os
+import sys
+import json
+import time
+import pprint
+import importlib
+import collections
+
+from . import aio
+from . import api
+from . import metrics
+from . import models
+from . import tasklists
+from . import sync
+
+from googleapiclient.errors import HttpError
+
+TASKSTODO_DIR = os.path.expanduser('~/.local/share/taskstodo')
+
+# Modules of adapters, each with an Adapter class derived from
+# sync.SyncAdapter
+ADAPTERS = ['calcurse']
+
+# Kinds of operations on local tasks in journals of earlier versions
+LEGACY_OP_KINDS = {'add_calcurse': 'add_local',
+                   'delete_calcurse': 'delete_local',
+                   'status_calcurse': 'status_local'}
+
+# Change counted in metrics for each kind of sync operation
+OP_CHANGES = {
+    'add_google': 'added',
+    'delete_google': 'deleted',
+    'status_google': 'status',
+    'add_local': 'added',
+    'delete_local': 'deleted',
+    'status_local': 'status',
+}
+
+# Default Tasks API quota of requests per day
+DAILY_QUOTA = 50000
+
+# Seconds before start of last sync that tasks completed since are read
+# from, as clocks of server and this host may differ
+SYNC_TIME_MARGIN = 3600
+
+
+def get_adapter(name, data_dir=None):
+    """
+    Get adapter of local store by name.
+    """
+
+    if name not in ADAPTERS:
+        raise ValueError('Unknown sync adapter: ' + name)
+    module = importlib.import_module('.' + name, __package__)
+    return module.Adapter(data_dir)
+
+
+def get_google_tasks(creds, list_title, list_num, completed_min=None):
+    """
+    Get Google Tasks from server and return tasks as list.
+
+    Completed tasks are included, but not those hidden from the task list,
+    so history of completed tasks is not downloaded by every sync. Apps of
+    Google hide tasks as soon as they are completed, so hidden tasks
+    completed since completed_min, an RFC 3339 timestamp, are included too.
+    """
+
+    tasklist = tasklists.get_tasklist(creds, list_title, list_num)
+    if not tasklist:
+        return None
+
+    g_tasks = list(tasklist.tasks)
+    if completed_min:
+        task_ids = {t.id for t in g_tasks}
+        service = api.build_service(creds)
+        try:
+            task_items = list(tasklists.list_tasks(
+                service, tasklist.id, show_hidden=True,
+                completed_min=completed_min))
+        except HttpError as err:
+            print(err._get_reason())
+            return None
+        task_items.sort(key=lambda item: item['position'])
+        g_tasks.extend(models.Task.from_item(item) for item in task_items
+                       if item['id'] not in task_ids
+                       and item.get('status') == 'completed')
+
+    return g_tasks
+
+
+def delete_google_tasks(creds, list_title, old_tasks, done=None):
+    """
+    Delete tasks from Google, several at the same time.
+
+    Call done with index of each task in old_tasks once it is deleted.
+    """
+
+    tasklist = tasklists.get_tasklist(creds, list_title, None)
+    if not tasklist:
+        return
+
+    # Tasks with the same title are deleted once each
+    cur_ids = collections.defaultdict(list)
+    for task in tasklist.tasks:
+        cur_ids[task.title].append(task.id)
+
+    client = aio.Client(creds)
+
+    async def delete_task(task_num, task_id):
+        try:
+            await client.delete_task(tasklist.id, task_id)
+        except HttpError as err:
+            print(err._get_reason())
+            return
+        tasklists.update_cached_task(tasklist.id, deleted_id=task_id)
+        if done:
+            done(task_num)
+
+    async def delete_all():
+        deletions = []
+        for i, old_task in enumerate(old_tasks):
+            if cur_ids[old_task.title]:
+                task_id = cur_ids[old_task.title].pop(0)
+                deletions.append(delete_task(i, task_id))
+            elif done:
+                # Task was already deleted
+                done(i)
+        await aio.gather(*deletions)
+
+    aio.run(delete_all())
+
+
+def add_google_tasks(creds, list_title, list_num, new_tasks, done=None):
+    """
+    Add tasks to top of Google Tasks list, several at the same time.
+
+    Tasks that were created out of order are moved back in order
+    afterwards. Call done with index of each task in new_tasks once it is
+    created.
+    """
+
+    tasklist_id = tasklists.get_tasklist_id(creds, list_title, list_num)
+    if tasklist_id is None:
+        return
+
+    client = aio.Client(creds)
+
+    async def create_task(task_num, new_task):
+        task = {'title': new_task.title}
+        if new_task.note:
+            task['notes'] = new_task.note
+        if new_task.completed:
+            # Tasks completed before they were synced stay completed
+            task['status'] = 'completed'
+        try:
+            result = await client.insert_task(tasklist_id, task)
+        except HttpError as err:
+            print(err._get_reason())
+            return
+        tasklists.update_cached_task(tasklist_id, result)
+        if done:
+            done(task_num)
+        return result['id']
+
+    async def create_all():
+        # Last task is sent first, as each task is created at top
+        task_ids = await aio.gather(*(create_task(i, new_tasks[i]) for i in
+                                      reversed(range(len(new_tasks)))))
+        task_ids = [task_id for task_id in reversed(task_ids) if task_id]
+
+        items = await aio.gather(*(client.get_task(tasklist_id, task_id)
+                                   for task_id in task_ids))
+        actual = [item['id'] for item in
+                  sorted(items, key=lambda item: item['position'])]
+        for i, task_id in enumerate(task_ids):
+            if actual[i] == task_id:
+                continue
+            previous = task_ids[i - 1] if i else None
+            result = await client.move_task(tasklist_id, task_id,
+                                            previous=previous)
+            tasklists.update_cached_task(tasklist_id, result, moved=True,
+                                         previous_id=previous)
+            actual.remove(task_id)
+            actual.insert(i, task_id)
+
+    try:
+        aio.run(create_all())
+    except HttpError as err:
+        # Tasks were created, but may be out of order
+        print(err._get_reason())
+
+
+def status_key(task):
+    """
+    Get key of task and its completion status, to check if a status change
+    was already applied.
+    """
+
+    return (sync.fingerprint(task), task.completed)
+
+
+def update_google_status(creds, list_title, list_num, status_tasks, g_tasks,
+                         done=None):
+    """
+    Change completion status of Google Tasks to that of status tasks with
+    the same title and note, several at the same time.
+
+    IDs of tasks are looked up in g_tasks, and tasks with the same title
+    and note are changed once each. Call done with index of each task in
+    status_tasks once it is changed.
+    """
+
+    tasklist_id = tasklists.get_tasklist_id(creds, list_title, list_num)
+    if tasklist_id is None:
+        return
+
+    # Tasks with the other status are changed
+    cur_ids = collections.defaultdict(list)
+    for task in g_tasks:
+        cur_ids[(sync.fingerprint(task), not task.completed)].append(task.id)
+
+    client = aio.Client(creds)
+
+    async def update_task(task_num, task_id, completed):
+        if completed:
+            body = {'status': 'completed'}
+        else:
+            body = {'status': 'needsAction', 'completed': None}
+        try:
+            result = await client.patch_task(tasklist_id, task_id, body)
+        except HttpError as err:
+            print(err._get_reason())
+            return
+        tasklists.update_cached_task(tasklist_id, result)
+        if done:
+            done(task_num)
+
+    async def update_all():
+        updates = []
+        for i, task in enumerate(status_tasks):
+            if cur_ids[status_key(task)]:
+                task_id = cur_ids[status_key(task)].pop(0)
+                updates.append(update_task(i, task_id, task.completed))
+            elif done:
+                # Task was deleted since
+                done(i)
+        await aio.gather(*updates)
+
+    aio.run(update_all())
+
+
+def plan_sync(g_tasks, l_tasks, synced, fingerprint=sync.fingerprint):
+    """
+    Compare Google and local tasks to previously synced tasks by their
+    fingerprints.
+
+    Tasks on both sides whose completion status differs are completed or
+    reopened on the side that did not change since the last sync, which is
+    told by completion fingerprints in the sync state. Completed tasks
+    cleared from Google are kept locally.
+
+    Return tuple of operations to perform and changes to sync state.
+    """
+
+    g_fps = [fingerprint(t) for t in g_tasks]
+    l_fps = [fingerprint(t) for t in l_tasks]
+    g_set = set(g_fps)
+    l_set = set(l_fps)
+
+    # Compare Google Tasks to local tasks and get tasks to add or delete
+    new_l_tasks = []
+    old_g_tasks = []
+    for g_task, g_fp in zip(g_tasks, g_fps):
+        if g_fp not in l_set:
+            if g_fp not in synced:
+                new_l_tasks.append(g_task)
+            else:
+                old_g_tasks.append(g_task)
+
+    # Compare local tasks to Google Tasks and get tasks to add or delete
+    new_g_tasks = []
+    old_l_tasks = []
+    for l_task, l_fp in zip(l_tasks, l_fps):
+        if l_fp not in g_set:
+            if l_fp not in synced:
+                new_g_tasks.append(l_task)
+            elif not (l_task.completed and
+                      sync.completion_fingerprint(l_task) in synced):
+                old_l_tasks.append(l_task)
+
+    # Compare completion status of tasks on both sides
+    g_by_fp = dict(zip(g_fps, g_tasks))
+    status_g_tasks = []
+    status_l_tasks = []
+    for l_task, l_fp in zip(l_tasks, l_fps):
+        g_task = g_by_fp.get(l_fp)
+        if g_task is None or g_task.completed == l_task.completed:
+            continue
+        was_completed = sync.completion_fingerprint(l_task) in synced
+        if g_task.completed != was_completed:
+            status_l_tasks.append(l_task.replace(
+                completed=g_task.completed))
+        else:
+            status_g_tasks.append(g_task.replace(
+                completed=l_task.completed))
+
+    # Synced tasks are local tasks once changes are applied
+    old_l_fps = {fingerprint(t) for t in old_l_tasks}
+    statuses = {fingerprint(t): t.completed for t in status_l_tasks}
+    new_synced = ((l_set - old_l_fps)
+                  | {fingerprint(t) for t in new_l_tasks})
+    for task, fp in zip(l_tasks, l_fps):
+        if fp not in old_l_fps and statuses.get(fp, task.completed):
+            new_synced.add(sync.completion_fingerprint(task))
+    new_synced.update(sync.completion_fingerprint(t) for t in new_l_tasks
+                      if t.completed)
+    state = {'add': sorted(new_synced - synced),
+             'remove': sorted(synced - new_synced)}
+
+    ops = ([['delete_google', t] for t in old_g_tasks] +
+           [['add_local', t] for t in new_l_tasks] +
+           [['delete_local', t] for t in old_l_tasks] +
+           [['status_local', t] for t in status_l_tasks] +
+           [['add_google', t] for t in new_g_tasks] +
+           [['status_google', t] for t in status_g_tasks])
+
+    return ops, state
+
+
+def estimate_sync_cost(ops, read_completed=False):
+    """
+    Estimate API requests and file writes needed to perform operations.
+
+    If read_completed is True, tasks completed since the last sync are read
+    in an extra request.
+
+    Return dictionary of estimated costs.
+    """
+
+    kinds = collections.Counter(op[0] for op in ops)
+    num_g_changes = (kinds['delete_google'] + kinds['add_google'] +
+                     kinds['status_google'])
+
+    # Reading task list and its tasks
+    requests = 3 if read_completed else 2
+    if kinds['delete_google']:
+        # Task list is read again to look up task IDs for deletion
+        requests += 2
+    # Every change on Google is a single request, sent concurrently instead
+    # of in batch requests, and its result is written to the task list
+    # cache. Added tasks are read again to check their order, which is
+    # assumed to be kept
+    requests += num_g_changes + kinds['add_google']
+
+    note_hashes = {sync.fingerprint(t) for k, t in ops
+                   if k == 'add_local' and t.note}
+    file_writes = num_g_changes + len(note_hashes)
+    if kinds['add_local'] or kinds['delete_local'] or kinds['status_local']:
+        file_writes += 1
+    if ops:
+        # Journal, completed operations and sync state
+        file_writes += 1 + len(ops) + 1
+
+    return {'requests': requests, 'file_writes': file_writes,
+            'quota': requests / DAILY_QUOTA}
+
+
+def get_sync_files(adapter, t_data_dir):
+    """
+    Get paths of state file, journal file, file of time of last sync and
+    synced task list of earlier versions of adapter.
+    """
+
+    prefix = os.path.join(t_data_dir, adapter.name + '-sync')
+    return (prefix + '.state', prefix + '.journal', prefix + '.time',
+            prefix + '.json')
+
+
+def get_completed_min(time_file):
+    """
+    Get RFC 3339 timestamp that tasks completed since the last sync are read
+    from, or None if no sync was completed.
+    """
+
+    sync_time = sync.load_sync_time(time_file)
+    if sync_time is None:
+        return None
+    return time.strftime('%Y-%m-%dT%H:%M:%S.000Z',
+                         time.gmtime(sync_time - SYNC_TIME_MARGIN))
+
+
+def load_journal_ops(journal_file):
+    """
+    Read journal and convert its operations to task models.
+
+    Return tuple of operations, sync state changes and set of completed
+    operation numbers, or None if there is no journal.
+    """
+
+    journal = sync.load_journal(journal_file)
+    if not journal:
+        return None
+
+    ops, state, done = journal
+    ops = [[LEGACY_OP_KINDS.get(kind, kind), models.Task.from_dict(task)]
+           for kind, task in ops]
+    return ops, state, done
+
+
+def print_sync_plan(creds, list_title, list_num, verbose, adapter,
+                    t_data_dir=None):
+    """
+    Print out operations a sync would perform and their estimated cost
+    without changing any tasks.
+    """
+
+    if t_data_dir is None:
+        t_data_dir = TASKSTODO_DIR
+
+    state_file, journal_file, time_file, sync_file = get_sync_files(
+        adapter, t_data_dir)
+    completed_min = get_completed_min(time_file)
+
+    g_tasks = get_google_tasks(creds, list_title, list_num, completed_min)
+    if g_tasks is None:
+        return
+
+    l_tasks = adapter.read_tasks()
+
+    if os.path.exists(sync_file) and not os.path.exists(state_file):
+        with open(sync_file, 'r') as f:
+            synced = {sync.fingerprint(t) for t in json.load(f)}
+    else:
+        synced = sync.load_state(state_file)
+
+    journal = load_journal_ops(journal_file)
+    if journal:
+        print('Resuming interrupted sync\n')
+        ops, state, done = journal
+        ops = [op for i, op in enumerate(ops) if i not in done]
+    else:
+        ops, state = plan_sync(g_tasks, l_tasks, synced, adapter.fingerprint)
+
+    op_names = {'delete_google': 'Delete from Google',
+                'add_local': 'Add to {0}',
+                'delete_local': 'Delete from {0}',
+                'add_google': 'Add to Google',
+                'status_local': '{1} in {0}',
+                'status_google': '{1} on Google'}
+
+    print('Planned operations:')
+    if not ops:
+        print('- None')
+    for kind, task in ops:
+        op_name = op_names[kind].format(
+            adapter.name, 'Complete' if task.completed else 'Reopen')
+        print('- {0}: {1}'.format(op_name, task.title))
+        if verbose and task.note:
+            print('  Note: {0}'.format(
+                task.note.replace('\n', '\n        ')))
+
+    cost = estimate_sync_cost(ops, bool(completed_min))
+    print('\nEstimated cost:')
+    print('API requests: {0}'.format(cost['requests']))
+    print('File writes: {0}'.format(cost['file_writes']))
+    print('Quota use: {0:.2%} of {1} daily requests'.format(
+        cost['quota'], DAILY_QUOTA))
+
+
+def sync_tasks(creds, list_title, list_num, verbose, adapter,
+               t_data_dir=None):
+    """
+    Sync Google Tasks and tasks of local store of adapter.
+
+    Planned changes are written to a journal before they are applied, so an
+    interrupted sync is resumed on the next run instead of being recomputed.
+
+    Result and duration of the run and tasks it changed are counted in
+    metrics.
+    """
+
+    start_time = time.perf_counter()
+    sync_time = time.time()
+
+    if t_data_dir is None:
+        t_data_dir = TASKSTODO_DIR
+    if not os.path.exists(t_data_dir):
+        os.makedirs(t_data_dir)
+
+    # Check for or create lock file to prevent multiple running instances
+    lock = os.path.join(t_data_dir, 'lock')
+    if os.path.exists(lock):
+        print('An existing instance is already running or lock was not' +
+              'released.', file=sys.stderr)
+        metrics.inc('taskstodo_sync_runs_total', result='locked')
+        sys.exit(1)
+    else:
+        os.mknod(lock, mode=0o644)
+
+    state_file, journal_file, time_file, sync_file = get_sync_files(
+        adapter, t_data_dir)
+
+    result = 'failed'
+    try:
+        # Convert synced task list of earlier versions to fingerprints
+        if os.path.exists(sync_file) and not os.path.exists(state_file):
+            with open(sync_file, 'r') as f:
+                synced = {sync.fingerprint(t) for t in json.load(f)}
+            sync.update_state(state_file, set(), synced, [])
+            os.remove(sync_file)
+
+        # Read in Google Tasks list
+        g_tasks = get_google_tasks(creds, list_title, list_num,
+                                   get_completed_min(time_file))
+        if g_tasks is None:
+            return
+
+        # Read in local tasks
+        l_tasks = adapter.read_tasks()
+
+        # Read in fingerprints of synced tasks
+        synced = sync.load_state(state_file)
+
+        g_set = {adapter.fingerprint(t) for t in g_tasks}
+        l_set = {adapter.fingerprint(t) for t in l_tasks}
+
+        journal = load_journal_ops(journal_file)
+        if journal:
+            # Resume operations of interrupted sync
+            ops, state, done = journal
+        else:
+            ops, state = plan_sync(g_tasks, l_tasks, synced,
+                                   adapter.fingerprint)
+            done = set()
+            sync.create_journal(journal_file, [[kind, task.content()]
+                                               for kind, task in ops], state)
+
+        # Completed operations are recorded in journal once per step, as
+        # operations performed before an interruption are detected when
+        # resuming
+        completed = []
+
+        def mark_done(op_num):
+            completed.append(op_num)
+            done.add(op_num)
+            kind = ops[op_num][0]
+            side = 'google' if kind.endswith('_google') else adapter.name
+            metrics.inc('taskstodo_sync_tasks_total', side=side,
+                        change=OP_CHANGES[kind])
+
+        def record_done():
+            if completed:
+                sync.mark_done(journal_file, *completed)
+                completed.clear()
+
+        def pending(kind, applied=(), key=adapter.fingerprint):
+            """
+            Return numbers and tasks of operations still to be performed.
+            """
+            op_nums = []
+            op_tasks = []
+            for i, (op_kind, task) in enumerate(ops):
+                if op_kind != kind or i in done:
+                    continue
+                if key(task) in applied:
+                    # Performed before sync was interrupted
+                    mark_done(i)
+                else:
+                    op_nums.append(i)
+                    op_tasks.append(task)
+            return op_nums, op_tasks
+
+        # Changes on Google are written to task list cache at once
+        with tasklists.deferred_cache_writes():
+            try:
+                old_g_nums, old_g_tasks = pending('delete_google')
+                if old_g_tasks:
+                    delete_google_tasks(creds, list_title, old_g_tasks,
+                                        lambda i: mark_done(old_g_nums[i]))
+                record_done()
+
+                new_l_nums, new_l_tasks = pending('add_local', l_set)
+                old_l_nums, old_l_tasks = pending('delete_local')
+                status_l_nums, status_l_tasks = pending(
+                    'status_local', {status_key(t) for t in l_tasks},
+                    status_key)
+                if new_l_tasks or old_l_tasks or status_l_tasks:
+                    adapter.apply_changes(old_l_tasks, new_l_tasks,
+                                          status_l_tasks)
+                    for op_num in new_l_nums + old_l_nums + status_l_nums:
+                        mark_done(op_num)
+                record_done()
+
+                new_g_nums, new_g_tasks = pending('add_google', g_set)
+                if new_g_tasks:
+                    add_google_tasks(creds, list_title, list_num,
+                                     new_g_tasks,
+                                     lambda i: mark_done(new_g_nums[i]))
+                record_done()
+
+                status_g_nums, status_g_tasks = pending(
+                    'status_google', {status_key(t) for t in g_tasks},
+                    status_key)
+                if status_g_tasks:
+                    update_google_status(
+                        creds, list_title, list_num, status_g_tasks, g_tasks,
+                        lambda i: mark_done(status_g_nums[i]))
+            finally:
+                record_done()
+
+        if len(done) < len(ops):
+            print('Sync was not completed, run again to resume.',
+                  file=sys.stderr)
+            result = 'incomplete'
+            return
+
+        # Update synced tasks
+        sync.update_state(state_file, synced, state['add'], state['remove'])
+        sync.save_sync_time(time_file, sync_time)
+
+        sync.remove_journal(journal_file)
+        result = 'success'
+    finally:
+        os.remove(lock)
+        metrics.inc('taskstodo_sync_runs_total', result=result)
+        metrics.observe('taskstodo_sync_duration_seconds',
+                        time.perf_counter() - start_time)
+        if result == 'success':
+            metrics.set_gauge('taskstodo_sync_last_success_timestamp_seconds',
+                              time.time())
+
+    if verbose:
+        if journal:
+            print('Resumed interrupted sync\n')
+        print('Google tasks:')
+        pprint.pp([t.content() for t in g_tasks])
+        print('\n{0} tasks:'.format(adapter.name))
+        pprint.pp([t.content() for t in l_tasks])
+        print('\n{0} tasks added:'.format(adapter.name))
+        pprint.pp([t.content() for t in new_l_tasks])
+        print('\nGoogle tasks added:')
+        pprint.pp([t.content() for t in new_g_tasks])
+        print('\n{0} tasks deleted:'.format(adapter.name))
+        pprint.pp([t.content() for t in old_l_tasks])
+        print('\nGoogle tasks deleted:')
+        pprint.pp([t.content() for t in old_g_tasks])
+        print('\n{0} tasks completed or reopened:'.format(adapter.name))
+        pprint.pp([t.content() for t in status_l_tasks])
+        print('\nGoogle tasks completed or reopened:')
+        pprint.pp([t.content() for t in status_g_tasks])
@@ -0,0 +1,443 @@
+#!/usr/bin/env python3
+
+"""
+In-memory backend for the Tasks API.
+
+Task lists, tasks, positions, ETags, paging and batch requests behave like
+the real API closely enough to run taskstodo offline. Requests are answered
+in the same process by an HTTP client that the API client sends them to, so
+all other code runs as it does against Google.
+"""
+
+import re
+import json
+import time
+import threading
+import itertools
+import email.parser
+import http.client
+import urllib.parse
+
+BATCH_PATH = '/batch'
+BOUNDARY = 'batch_taskstodo_memory'
+
+# Store shared by all services of the process
+_store = None
+_store_lock = threading.Lock()
+
+
+class NotFound(Exception):
+    pass
+
+
+class PreconditionFailed(Exception):
+    pass
+
+
+class MemoryTasks:
+    """
+    State of task lists and tasks, and counts of requests made to them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """
+        Delete all task lists and reset counters.
+        """
+
+        with self.lock:
+            self.ids = itertools.count(1)
+            # Task list items by ID
+            self.tasklists = {}
+            # IDs of tasks by task list and parent, in position order
+            self.children = {}
+            # Task items by ID
+            self.tasks = {}
+            # Listed task IDs by request, until tasks are changed
+            self.listings = {}
+            # Run calls of batch requests in reverse order, as the server
+            # may run them in any order
+            self.reverse_batches = False
+            self.reset_counters()
+
+    def reset_counters(self):
+        """
+        Reset counts of API calls and HTTP requests.
+        """
+
+        self.api_calls = 0
+        self.http_requests = 0
+
+    def new_id(self, prefix):
+        return '{0}{1:08d}'.format(prefix, next(self.ids))
+
+    def now(self):
+        return time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime())
+
+    def add_tasklist(self, title):
+        """
+        Create task list and return its item.
+        """
+
+        self.listings.clear()
+        tasklist_id = self.new_id('L')
+        item = {'kind': 'tasks#taskList', 'id': tasklist_id,
+                'etag': '"1"', 'title': title, 'updated': self.now(),
+                'selfLink': '/tasks/v1/users/@me/lists/' + tasklist_id}
+        self.tasklists[tasklist_id] = item
+        self.children[tasklist_id] = {None: []}
+        return item
+
+    def add_task(self, tasklist_id, body, parent=None, previous=None):
+        """
+        Create task after previous sibling, or first among its siblings,
+        and return its item.
+        """
+
+        self.listings.clear()
+        siblings = self.get_siblings(tasklist_id, parent)
+        index = siblings.index(previous) + 1 if previous else 0
+        task_id = self.new_id('T')
+        item = {'kind': 'tasks#task', 'id': task_id, 'etag': '"1"',
+                'title': body.get('title', ''), 'updated': self.now(),
+                'status': body.get('status', 'needsAction'),
+                'selfLink': '/tasks/v1/lists/{0}/tasks/{1}'.format(
+                    tasklist_id, task_id)}
+        for field in ['notes', 'due', 'completed']:
+            if body.get(field):
+                item[field] = body[field]
+        if parent:
+            item['parent'] = parent
+        self.tasks[task_id] = item
+        siblings.insert(index, task_id)
+        self.children[tasklist_id][task_id] = []
+        return item
+
+    def get_tasklist(self, tasklist_id):
+        if tasklist_id not in self.tasklists:
+            raise NotFound('Task list not found.')
+        return self.tasklists[tasklist_id]
+
+    def get_siblings(self, tasklist_id, parent):
+        self.get_tasklist(tasklist_id)
+        if parent not in self.children[tasklist_id]:
+            raise NotFound('Task not found.')
+        return self.children[tasklist_id][parent]
+
+    def get_task(self, tasklist_id, task_id):
+        self.get_tasklist(tasklist_id)
+        if task_id not in self.children[tasklist_id]:
+            raise NotFound('Task not found.')
+        return self.tasks[task_id]
+
+    def task_item(self, tasklist_id, task_id, index=None):
+        """
+        Get copy of task item with its position among siblings.
+        """
+
+        item = dict(self.tasks[task_id])
+        if index is None:
+            siblings = self.children[tasklist_id][item.get('parent')]
+            index = siblings.index(task_id)
+        item['position'] = '{0:020d}'.format(index)
+        return item
+
+    def walk_tasks(self, tasklist_id, parent=None):
+        """
+        Yield IDs of tasks and their index among siblings, with parents
+        before their children.
+        """
+
+        children = self.children[tasklist_id]
+        for i, task_id in enumerate(children[parent]):
+            yield task_id, i
+            if children[task_id]:
+                yield from self.walk_tasks(tasklist_id, task_id)
+
+    def remove_task(self, tasklist_id, task_id):
+        for child_id in list(self.children[tasklist_id][task_id]):
+            self.remove_task(tasklist_id, child_id)
+        item = self.tasks.pop(task_id)
+        self.children[tasklist_id][item.get('parent')].remove(task_id)
+        del self.children[tasklist_id][task_id]
+
+    def page(self, items, query, default_size):
+        """
+        Get page of items selected by page token and max results.
+        """
+
+        size = min(int(query.get('maxResults', default_size)), 100)
+        start = int(query.get('pageToken', 0))
+        result = {'items': items[start:start + size]}
+        if start + size < len(items):
+            result['nextPageToken'] = str(start + size)
+        return result
+
+    def check_etag(self, item, if_match):
+        """
+        Check that item was not changed since it had ETag of If-Match
+        header.
+        """
+
+        if if_match and if_match not in ('*', item['etag']):
+            raise PreconditionFailed('Precondition Failed')
+
+    def touch(self, item):
+        """
+        Give changed item new time of update and ETag.
+        """
+
+        item['updated'] = self.now()
+        item['etag'] = '"{0}"'.format(int(item['etag'][1:-1]) + 1)
+
+    def call(self, method, path, query, body, if_match=None):
+        """
+        Run API call and return tuple of status and response item.
+        """
+
+        try:
+            with self.lock:
+                self.api_calls += 1
+                if method != 'GET':
+                    self.listings.clear()
+                return self.route(method, path, query, body, if_match)
+        except NotFound as err:
+            return 404, {'error': {'code': 404, 'message': str(err),
+                                   'errors': [{'reason': 'notFound',
+                                               'message': str(err)}]}}
+        except PreconditionFailed as err:
+            return 412, {'error': {'code': 412, 'message': str(err),
+                                   'errors': [{'reason': 'conditionNotMet',
+                                               'message': str(err)}]}}
+        except (KeyError, ValueError) as err:
+            return 400, {'error': {'code': 400, 'message': str(err)}}
+
+    def route(self, method, path, query, body, if_match=None):
+        m = re.fullmatch(r'/tasks/v1/users/@me/lists(?:/([^/]+))?', path)
+        if m:
+            return self.route_tasklist(method, m.group(1), query, body,
+                                       if_match)
+
+        m = re.fullmatch(r'/tasks/v1/lists/([^/]+)/clear', path)
+        if m and method == 'POST':
+            tasklist_id = m.group(1)
+            self.get_tasklist(tasklist_id)
+            for task_id, _ in self.walk_tasks(tasklist_id):
+                if self.tasks[task_id]['status'] == 'completed':
+                    self.tasks[task_id]['hidden'] = True
+            return 204, None
+
+        m = re.fullmatch(r'/tasks/v1/lists/([^/]+)/tasks(?:/([^/]+))?'
+                         r'(/move)?', path)
+        if m:
+            return self.route_task(method, m.group(1), m.group(2),
+                                   bool(m.group(3)), query, body, if_match)
+
+        raise NotFound('Not found.')
+
+    def route_tasklist(self, method, tasklist_id, query, body,
+                       if_match=None):
+        if tasklist_id is None:
+            if method == 'GET':
+                items = list(self.tasklists.values())
+                return 200, dict(self.page(items, query, 20),
+                                 kind='tasks#taskLists')
+            if method == 'POST':
+                return 200, self.add_tasklist(body['title'])
+
+        item = self.get_tasklist(tasklist_id)
+        if method == 'GET':
+            return 200, item
+        self.check_etag(item, if_match)
+        if method in ('PATCH', 'PUT'):
+            item['title'] = body.get('title', item['title'])
+            self.touch(item)
+            return 200, item
+        if method == 'DELETE':
+            del self.tasklists[tasklist_id]
+            for task_id, _ in list(self.walk_tasks(tasklist_id)):
+                del self.tasks[task_id]
+            del self.children[tasklist_id]
+            return 204, None
+
+        raise NotFound('Not found.')
+
+    def route_task(self, method, tasklist_id, task_id, move, query, body,
+                   if_match=None):
+        if task_id is None:
+            if method == 'GET':
+                show_completed = query.get('showCompleted', 'true') == 'true'
+                show_hidden = query.get('showHidden', 'false') == 'true'
+                completed_min = query.get('completedMin')
+                key = (tasklist_id, show_completed, show_hidden,
+                       completed_min)
+                if key not in self.listings:
+                    self.get_tasklist(tasklist_id)
+                    self.listings[key] = [
+                        (task_id, i)
+                        for task_id, i in self.walk_tasks(tasklist_id)
+                        if (show_completed or
+                            self.tasks[task_id]['status'] != 'completed')
+                        and (show_hidden or
+                             not self.tasks[task_id].get('hidden'))
+                        and (not completed_min or
+                             self.tasks[task_id].get('completed', '') >=
+                             completed_min)]
+                task_ids = self.listings[key]
+                result = self.page(task_ids, query, 20)
+                result['items'] = [self.task_item(tasklist_id, *t)
+                                   for t in result['items']]
+                return 200, dict(result, kind='tasks#tasks')
+            if method == 'POST':
+                item = self.add_task(tasklist_id, body, query.get('parent'),
+                                     query.get('previous'))
+                return 200, self.task_item(tasklist_id, item['id'])
+            raise NotFound('Not found.')
+
+        item = self.get_task(tasklist_id, task_id)
+        if method != 'GET':
+            self.check_etag(item, if_match)
+        if move and method == 'POST':
+            parent = query.get('parent')
+            previous = query.get('previous')
+            self.children[tasklist_id][item.get('parent')].remove(task_id)
+            siblings = self.get_siblings(tasklist_id, parent)
+            index = siblings.index(previous) + 1 if previous else 0
+            siblings.insert(index, task_id)
+            item.pop('parent', None)
+            if parent:
+                item['parent'] = parent
+        elif method == 'GET':
+            pass
+        elif method in ('PATCH', 'PUT'):
+            for field in ['title', 'notes', 'status', 'due', 'completed']:
+                if field in body:
+                    if body[field] is None:
+                        item.pop(field, None)
+                    else:
+                        item[field] = body[field]
+            if item['status'] == 'needsAction':
+                item.pop('completed', None)
+            elif 'completed' not in item:
+                item['completed'] = self.now()
+            if 'status' in body:
+                # Like apps of Google, hide tasks once completed
+                if item['status'] == 'completed':
+                    item['hidden'] = True
+                else:
+                    item.pop('hidden', None)
+        elif method == 'DELETE':
+            self.remove_task(tasklist_id, task_id)
+            return 204, None
+        else:
+            raise NotFound('Not found.')
+
+        if method != 'GET':
+            self.touch(item)
+        return 200, self.task_item(tasklist_id, task_id)
+
+    def call_batch(self, content_type, body):
+        """
+        Run API calls of batch request and return multipart response body.
+        """
+
+        message = email.parser.BytesParser().parsebytes(
+            b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+
+        requests = message.get_payload()
+        if self.reverse_batches:
+            requests = reversed(requests)
+
+        parts = []
+        for part in requests:
+            payload = part.get_payload()
+            head, _, part_body = payload.replace('\r\n', '\n').partition(
+                '\n\n')
+            request_line, _, part_head = head.partition('\n')
+            method, uri, _ = request_line.split(' ', 2)
+            headers = email.parser.Parser().parsestr(part_head,
+                                                     headersonly=True)
+            url = urllib.parse.urlsplit(uri)
+            query = dict(urllib.parse.parse_qsl(url.query))
+            status, result = self.call(method,
+                                       urllib.parse.unquote(url.path), query,
+                                       json.loads(part_body)
+                                       if part_body.strip() else None,
+                                       headers.get('If-Match'))
+
+            content = json.dumps(result) if result is not None else ''
+            parts.append(
+                '--{0}\r\nContent-Type: application/http\r\n'
+                'Content-ID: <response-{1}\r\n\r\n'
+                'HTTP/1.1 {2} {3}\r\n'
+                'Content-Type: application/json; charset=UTF-8\r\n'
+                'Content-Length: {4}\r\n\r\n{5}\r\n'.format(
+                    BOUNDARY, part['Content-ID'][1:], status,
+                    http.HTTPStatus(status).phrase, len(content.encode()),
+                    content))
+
+        return ''.join(parts) + '--{0}--\r\n'.format(BOUNDARY)
+
+
+class MemoryHttp:
+    """
+    HTTP client that answers requests of the API client from a store in
+    memory instead of sending them.
+    """
+
+    def __init__(self, store):
+        self.store = store
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        import httplib2
+
+        with self.store.lock:
+            self.store.http_requests += 1
+
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if isinstance(body, str):
+            body = body.encode()
+        url = urllib.parse.urlsplit(uri)
+
+        if url.path == BATCH_PATH and method == 'POST':
+            content = self.store.call_batch(headers['content-type'], body)
+            resp = httplib2.Response({
+                'status': 200,
+                'content-type': 'multipart/mixed; boundary=' + BOUNDARY})
+            return resp, content.encode()
+
+        query = dict(urllib.parse.parse_qsl(url.query))
+        status, result = self.store.call(method,
+                                         urllib.parse.unquote(url.path),
+                                         query,
+                                         json.loads(body) if body else None,
+                                         headers.get('if-match'))
+        resp = httplib2.Response({
+            'status': status,
+            'content-type': 'application/json; charset=UTF-8'})
+        resp.reason = http.HTTPStatus(status).phrase
+        content = json.dumps(result).encode() if result is not None else b''
+        return resp, content
+
+    def close(self):
+        pass
+
+
+def get_store():
+    """
+    Get store of task lists and tasks shared by all services of this
+    process.
+
+    The store starts empty and lasts as long as the process, so commands
+    forwarded to a daemon share it.
+    """
+
+    global _store
+
+    with _store_lock:
+        if _store is None:
+            _store = MemoryTasks()
+        return _store
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+"""
+Count sync runs, API requests and cache use, and expose them in the
+Prometheus text format.
+"""
+
+import os
+import re
+import fcntl
+import threading
+import http.server
+
+from . import trace
+
+# Type, help and histogram buckets of metrics
+METRICS = {
+    'taskstodo_sync_runs_total': (
+        'counter', 'Sync runs by result.', None),
+    'taskstodo_sync_duration_seconds': (
+        'histogram', 'Duration of sync runs.',
+        [0.5, 1, 2.5, 5, 10, 30, 60, 120, 300]),
+    'taskstodo_sync_last_success_timestamp_seconds': (
+        'gauge', 'Time of last completed sync.', None),
+    'taskstodo_sync_tasks_total': (
+        'counter', 'Tasks added or deleted by syncs on each side.', None),
+    'taskstodo_api_requests_total': (
+        'counter', 'API requests of syncs by method and status code.', None),
+    'taskstodo_api_retries_total': (
+        'counter', 'Retried API requests of syncs by method.', None),
+    'taskstodo_api_request_duration_seconds': (
+        'histogram', 'Latency of API requests of syncs by method.',
+        [0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10]),
+    'taskstodo_cache_write_bytes_total': (
+        'counter', 'Bytes written to task list cache.', None),
+    'taskstodo_lock_wait_seconds': (
+        'histogram', 'Time waited for locks.',
+        [0.001, 0.01, 0.1, 1, 10]),
+}
+
+HISTOGRAM_SUFFIXES = ['_bucket', '_sum', '_count']
+
+SAMPLE_RE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)(?:\{(.*)\})?\s+(\S+)')
+LABEL_RE = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+# Values of samples by name and labels
+_samples = {}
+_lock = threading.Lock()
+
+# Samples already added to each metrics file by this process
+_written = {}
+
+
+def add(name, value, labels):
+    key = (name, tuple(sorted(labels.items())))
+    _samples[key] = _samples.get(key, 0) + value
+
+
+def inc(name, value=1, **labels):
+    """
+    Increase counter by value.
+    """
+
+    with _lock:
+        add(name, value, labels)
+
+
+def set_gauge(name, value, **labels):
+    """
+    Set gauge to value.
+    """
+
+    with _lock:
+        _samples[(name, tuple(sorted(labels.items())))] = value
+
+
+def observe(name, value, **labels):
+    """
+    Add observed value to histogram.
+    """
+
+    with _lock:
+        for bound in METRICS[name][2]:
+            if value <= bound:
+                add(name + '_bucket', 1, dict(labels, le=str(bound)))
+        add(name + '_bucket', 1, dict(labels, le='+Inf'))
+        add(name + '_sum', value, labels)
+        add(name + '_count', 1, labels)
+
+
+def get_samples():
+    """
+    Get copy of current samples.
+    """
+
+    with _lock:
+        return dict(_samples)
+
+
+def add_samples(samples):
+    """
+    Add samples of another process, such as a worker of a process pool.
+    Gauges are replaced, while counters and histograms are increased.
+    """
+
+    with _lock:
+        for key, value in samples.items():
+            if METRICS[get_metric(key[0])][0] == 'gauge':
+                _samples[key] = value
+            else:
+                _samples[key] = _samples.get(key, 0) + value
+
+
+def reset():
+    """
+    Remove all samples, such as those a forked process inherited.
+    """
+
+    with _lock:
+        _samples.clear()
+
+
+def get_metric(sample_name):
+    """
+    Get name of metric that sample belongs to.
+    """
+
+    if sample_name in METRICS:
+        return sample_name
+    for suffix in HISTOGRAM_SUFFIXES:
+        name = sample_name[:-len(suffix)]
+        if sample_name.endswith(suffix) and name in METRICS:
+            return name
+
+
+def record_requests(func):
+    """
+    Call func while tracing its API requests and count them.
+    """
+
+    started = trace.start()
+    offset = len(trace.get_records())
+    try:
+        return func()
+    finally:
+        records = trace.get_records()[offset:]
+        if started:
+            trace.stop()
+
+        for r in records:
+            if r['type'] != 'request':
+                continue
+            inc('taskstodo_api_requests_total', method=r['method'],
+                code=str(r['status'] or 'error'))
+            if r['retry']:
+                inc('taskstodo_api_retries_total', method=r['method'])
+            observe('taskstodo_api_request_duration_seconds', r['latency'],
+                    method=r['method'])
+
+
+def format_value(value):
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def escape(value):
+    return (value.replace('\\', '\\\\').replace('"', '\\"')
+            .replace('\n', '\\n'))
+
+
+def unescape(value):
+    return re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n'
+                  else m.group(1), value)
+
+
+def render(samples=None):
+    """
+    Get samples, or current samples, in Prometheus text format.
+    """
+
+    if samples is None:
+        with _lock:
+            samples = dict(_samples)
+
+    by_metric = {}
+    for key, value in samples.items():
+        by_metric.setdefault(get_metric(key[0]), []).append((key, value))
+
+    lines = []
+    for name, (kind, help_text, _) in METRICS.items():
+        if name not in by_metric:
+            continue
+        lines.append('# HELP {0} {1}'.format(name, help_text))
+        lines.append('# TYPE {0} {1}'.format(name, kind))
+        for (sample_name, labels), value in sorted(by_metric[name]):
+            label_text = ','.join('{0}="{1}"'.format(k, escape(v))
+                                  for k, v in labels)
+            lines.append('{0}{1} {2}'.format(
+                sample_name, '{' + label_text + '}' if label_text else '',
+                format_value(value)))
+
+    return ''.join(line + '\n' for line in lines)
+
+
+def parse(text):
+    """
+    Get samples of known metrics from Prometheus text format.
+    """
+
+    samples = {}
+    for line in text.splitlines():
+        match = SAMPLE_RE.match(line)
+        if not match or not get_metric(match.group(1)):
+            continue
+        labels = tuple(sorted((k, unescape(v)) for k, v in
+                              LABEL_RE.findall(match.group(2) or '')))
+        samples[(match.group(1), labels)] = float(match.group(3))
+    return samples
+
+
+def write_textfile(path):
+    """
+    Write metrics to file read by textfile collector of node exporter.
+
+    Counters and histograms continue from values in the file, so they keep
+    growing across runs of separate processes. File is replaced at once so
+    it is never read half written, and processes writing it at the same
+    time take turns holding a lock file next to it.
+    """
+
+    with open(path + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+        with _lock:
+            current = dict(_samples)
+            written = _written.get(path, {})
+            _written[path] = current
+
+        try:
+            with open(path, 'r') as f:
+                samples = parse(f.read())
+        except FileNotFoundError:
+            samples = {}
+
+        for key, value in current.items():
+            if METRICS[get_metric(key[0])][0] == 'gauge':
+                samples[key] = value
+            else:
+                samples[key] = (samples.get(key, 0) + value -
+                                written.get(key, 0))
+
+        tmp_file = path + '.tmp'
+        with open(tmp_file, 'w') as f:
+            f.write(render(samples))
+        os.replace(tmp_file, path)
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serve current metrics at /metrics.
+    """
+
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+
+        content = render().encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server(port, host='127.0.0.1'):
+    """
+    Serve metrics on local port in background thread and return server.
+    """
+
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+
+"""
+Immutable models of tasks and task lists, created from API payloads or
+cache files.
+"""
+
+from . import sync
+
+
+class Task:
+    """
+    Task of a Google task list or calcurse todo list.
+
+    Tasks cannot be changed once created, so their hash is computed once and
+    the fingerprint syncs compare them by is kept once computed. Tasks of
+    calcurse only have a title, note and completion status, and only
+    subtasks have the ID of their parent.
+    """
+
+    __slots__ = ('id', 'title', 'note', 'updated', 'position', 'completed',
+                 'parent', '_hash', '_fingerprint')
+
+    def __init__(self, title, note=None, id=None, updated=None,
+                 position=None, completed=False, parent=None):
+        init = object.__setattr__
+        init(self, 'id', id)
+        init(self, 'title', title)
+        init(self, 'note', note)
+        init(self, 'updated', updated)
+        init(self, 'position', position)
+        init(self, 'completed', completed)
+        init(self, 'parent', parent)
+        init(self, '_hash', hash((id, title, note, updated, position,
+                                  completed, parent)))
+        init(self, '_fingerprint', None)
+
+    @classmethod
+    def from_item(cls, item):
+        """
+        Create task from task item received from server.
+        """
+
+        return cls(item['title'], item.get('notes'), item['id'],
+                   item['updated'], item['position'],
+                   item.get('status') == 'completed', item.get('parent'))
+
+    @classmethod
+    def from_dict(cls, task):
+        """
+        Create task from dictionary of cache file or sync journal.
+        """
+
+        return cls(task['title'], task.get('note'), task.get('id'),
+                   task.get('updated'), task.get('position'),
+                   task.get('completed', False), task.get('parent'))
+
+    def to_dict(self):
+        """
+        Get dictionary of all fields, as written to cache file.
+        """
+
+        return {'id': self.id, 'title': self.title, 'updated': self.updated,
+                'note': self.note, 'position': self.position,
+                'completed': self.completed, 'parent': self.parent}
+
+    def content(self):
+        """
+        Get dictionary of title, note and completion status, which syncs
+        compare.
+        """
+
+        task = {'title': self.title}
+        if self.note:
+            task['note'] = self.note
+        if self.completed:
+            task['completed'] = True
+        return task
+
+    def replace(self, **changes):
+        """
+        Get copy of task with given fields changed.
+        """
+
+        fields = {'title': self.title, 'note': self.note, 'id': self.id,
+                  'updated': self.updated, 'position': self.position,
+                  'completed': self.completed, 'parent': self.parent}
+        fields.update(changes)
+        return Task(**fields)
+
+    @property
+    def fingerprint(self):
+        if self._fingerprint is None:
+            object.__setattr__(self, '_fingerprint', sync.content_fingerprint(
+                self.title, self.note))
+        return self._fingerprint
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Task cannot be changed')
+
+    def __delattr__(self, name):
+        raise AttributeError('Task cannot be changed')
+
+    def __eq__(self, other):
+        if not isinstance(other, Task):
+            return NotImplemented
+        return (self._hash == other._hash and self.id == other.id and
+                self.title == other.title and self.note == other.note and
+                self.updated == other.updated and
+                self.position == other.position and
+                self.completed == other.completed and
+                self.parent == other.parent)
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        fields = ('{0}={1!r}'.format(name, getattr(self, name))
+                  for name in ('title', 'note', 'id', 'updated', 'position',
+                               'completed', 'parent')
+                  if getattr(self, name) not in (None, False))
+        return 'Task({0})'.format(', '.join(fields))
+
+
+class TaskList:
+    """
+    Task list and its tasks in position order.
+    """
+
+    __slots__ = ('id', 'title', 'updated', 'tasks', '_hash')
+
+    def __init__(self, id, title=None, updated=None, tasks=()):
+        init = object.__setattr__
+        init(self, 'id', id)
+        init(self, 'title', title)
+        init(self, 'updated', updated)
+        init(self, 'tasks', tuple(tasks))
+        init(self, '_hash', hash((id, title, updated, self.tasks)))
+
+    @classmethod
+    def from_item(cls, item, task_items):
+        """
+        Create task list from task list item and task items received from
+        server, which are sorted by position key instead of update time.
+        """
+
+        task_items = sorted(task_items, key=lambda item: item['position'])
+        return cls(item['id'], item.get('title'), item.get('updated'),
+                   map(Task.from_item, task_items))
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Task list cannot be changed')
+
+    def __delattr__(self, name):
+        raise AttributeError('Task list cannot be changed')
+
+    def __eq__(self, other):
+        if not isinstance(other, TaskList):
+            return NotImplemented
+        return (self._hash == other._hash and self.id == other.id and
+                self.title == other.title and
+                self.updated == other.updated and self.tasks == other.tasks)
+
+    def __hash__(self):
+        return self._hash
+
+    def __repr__(self):
+        return 'TaskList(id={0!r}, title={1!r}, tasks={2})'.format(
+            self.id, self.title, len(self.tasks))
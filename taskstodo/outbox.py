@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+
+"""
+Apply task changes to the cache right away and send them to the server
+later from a background worker.
+
+Changes are appended to an outbox file before commands return, so none are
+lost if a process exits. The worker sends them in order and replaces
+temporary IDs of created tasks with IDs given by the server.
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import fcntl
+import threading
+import datetime
+import contextlib
+import subprocess
+
+from . import api
+from . import tasklists
+
+from googleapiclient.errors import HttpError
+
+DATA_DIR = tasklists.DATA_DIR
+OUTBOX_FILE = os.path.join(DATA_DIR, 'outbox.jsonl')
+LOG_FILE = os.path.join(DATA_DIR, 'outbox.log')
+
+# Prefix of IDs of tasks not yet created on server
+LOCAL_ID_PREFIX = 'local-'
+
+# Attempts of requests failing with temporary errors, and seconds waited
+# before first retry, which doubles with each retry
+RETRIES = 5
+RETRY_DELAY = 1
+
+# Status codes of errors that may go away when request is sent again
+TRANSIENT_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+def is_local_id(task_id):
+    return task_id.startswith(LOCAL_ID_PREFIX)
+
+
+def get_update_time():
+    """
+    Get time of queued change in format of server, with microseconds so
+    changes queued within the same second differ.
+    """
+
+    return datetime.datetime.now(datetime.timezone.utc).strftime(
+        '%Y-%m-%dT%H:%M:%S.%fZ')
+
+
+@contextlib.contextmanager
+def file_lock(name, blocking=True):
+    """
+    Hold lock file in data directory, shared by threads and processes.
+
+    Yield False instead of waiting if lock is held elsewhere and blocking is
+    False.
+    """
+
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+
+    with open(os.path.join(DATA_DIR, name), 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | (0 if blocking else
+                                            fcntl.LOCK_NB))
+        except BlockingIOError:
+            yield False
+            return
+        yield True
+
+
+def append_records(records):
+    """
+    Append records to outbox file and wait until they are on disk.
+    """
+
+    with file_lock('outbox.lock'):
+        with open(OUTBOX_FILE, 'a') as f:
+            f.writelines(json.dumps(r) + '\n' for r in records)
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def load_outbox():
+    """
+    Read queued changes and their progress from outbox file.
+
+    Return tuple of list of changes, set of numbers of sent changes,
+    dictionary of completed change numbers and their results, and
+    dictionary of server IDs of created tasks by local ID, or None if there
+    is no outbox.
+    """
+
+    try:
+        with open(OUTBOX_FILE, 'r') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+
+    ops = []
+    sent = set()
+    done = {}
+    id_map = {}
+    for line in lines:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            # Skip last line if it was only partially written
+            continue
+        if 'op' in record:
+            ops.append(record)
+        elif 'sent' in record:
+            sent.add(record['sent'])
+        else:
+            done[record['done']] = record
+            if record.get('id'):
+                id_map[ops[record['done']]['id']] = record['id']
+
+    return ops, sent, done, id_map
+
+
+def get_pending():
+    """
+    Get queued changes not yet completed.
+
+    Return list of changes and dictionary of server IDs by local ID.
+    """
+
+    outbox = load_outbox()
+    if not outbox:
+        return [], {}
+
+    ops, _, done, id_map = outbox
+    return [op for i, op in enumerate(ops) if i not in done], id_map
+
+
+def apply_op(tasklists_cache, op, id_map):
+    """
+    Apply queued change to task lists loaded from cache file.
+    """
+
+    for tasklist in tasklists_cache:
+        if tasklist['id'] == op['list']:
+            break
+    else:
+        return
+
+    tasks = tasklist['tasks']
+    task_id = id_map.get(op['id'], op['id'])
+    if op['op'] == 'create':
+        # New tasks are added after previous task or parent, or else to top
+        # of task list
+        index = 0
+        previous = op.get('previous') or op.get('parent')
+        for i, task in enumerate(tasks):
+            if task['id'] in (previous, id_map.get(previous)):
+                index = i + 1
+        tasks.insert(index, {'id': op['id'], 'title': op['body']['title'],
+                             'updated': op.get('updated'),
+                             'note': op['body'].get('notes'),
+                             'position': None, 'parent': op.get('parent')})
+        return
+
+    for i, task in enumerate(tasks):
+        if task['id'] == task_id:
+            break
+    else:
+        return
+
+    if op['op'] == 'delete':
+        del tasks[i]
+    else:
+        # Changed time of update makes search index the new title and note
+        task = dict(task, updated=op.get('updated'))
+        if 'title' in op['body']:
+            task['title'] = op['body']['title']
+        if 'notes' in op['body']:
+            task['note'] = op['body']['notes']
+        tasks[i] = task
+
+
+def apply_pending(tasklists_cache):
+    """
+    Apply changes still waiting to be sent to task lists downloaded from
+    server, so they are not lost from cache file until they are sent.
+    """
+
+    ops, id_map = get_pending()
+    for op in ops:
+        apply_op(tasklists_cache, op, id_map)
+
+
+def enqueue(op):
+    """
+    Append change to outbox, apply it to cache file and start worker that
+    sends it.
+    """
+
+    append_records([op])
+
+    with tasklists.locked_cache():
+        tasklists_cache = tasklists.load_tasklist_cache()
+        if tasklists_cache:
+            _, id_map = get_pending()
+            apply_op(tasklists_cache, op, id_map)
+            tasklists.write_tasklist_cache(tasklists_cache)
+
+    start_worker()
+
+
+def select_cached_task(tasklist_id, task_num, task_id, match):
+    """
+    Select task of task list by number, ID or title from cache file, which
+    includes tasks not yet created on server.
+
+    Return task ID, or None if task could not be selected.
+    """
+
+    tasks = []
+    for tasklist in tasklists.load_tasklist_cache() or []:
+        if tasklist['id'] == tasklist_id:
+            tasks = tasklist['tasks']
+
+    if task_id is not None or match is not None:
+        matches = [t['id'] for t in tasks if t['id'] == task_id or
+                   (match is not None and t['title'] == match)]
+        if not matches:
+            print('Task does not exist')
+        elif len(matches) > 1:
+            from .tasks import print_duplicate_tasks
+
+            print_duplicate_tasks(matches)
+        else:
+            return matches[0]
+    elif task_num is None or task_num < 0 or task_num > len(tasks) - 1:
+        print('Invalid task number')
+    else:
+        return tasks[task_num]['id']
+
+
+def queue_create(creds, list_title, task_title, note, list_num, verbose,
+                 position=None, after=None, parent=None):
+    """
+    Queue new task for specified task list, placed like tasks created right
+    away.
+
+    Return local ID of task, which is replaced once it is created.
+    """
+
+    from .tasks import get_previous_id
+
+    tasklist_id = tasklists.get_tasklist_id(creds, list_title, list_num)
+    if tasklist_id is None:
+        return
+
+    previous = after
+    if position is not None:
+        previous = get_previous_id(creds, tasklist_id, position, parent)
+        if previous is False:
+            return
+
+    body = {'title': task_title}
+    if note:
+        body['notes'] = note
+
+    # Cached tasks with the same title are not taken for the new task when
+    # looking up whether it was created before worker stopped
+    existing = [t['id'] for tasklist in tasklists.load_tasklist_cache() or []
+                if tasklist['id'] == tasklist_id
+                for t in tasklist['tasks'] if t['title'] == task_title]
+
+    task_id = LOCAL_ID_PREFIX + uuid.uuid4().hex
+    enqueue({'op': 'create', 'list': tasklist_id, 'id': task_id,
+             'body': body, 'previous': previous, 'parent': parent,
+             'existing': existing, 'updated': get_update_time()})
+    if verbose:
+        print('Queued task: {0}'.format(task_id))
+
+    return task_id
+
+
+def queue_change(creds, list_title, task_num, list_num, verbose,
+                 task_id=None, match=None, delete=False, body=None):
+    """
+    Queue deletion of task, or change of its title or note as given by
+    body.
+
+    Return ID of changed task.
+    """
+
+    tasklist_id = tasklists.get_tasklist_id(creds, list_title, list_num)
+    if tasklist_id is None:
+        return
+
+    task_id = select_cached_task(tasklist_id, task_num, task_id, match)
+    if task_id is None:
+        return
+
+    if delete:
+        op = {'op': 'delete', 'list': tasklist_id, 'id': task_id}
+    else:
+        op = {'op': 'patch', 'list': tasklist_id, 'id': task_id,
+              'body': body, 'updated': get_update_time()}
+    enqueue(op)
+    if verbose:
+        print('Queued change of task: {0}'.format(task_id))
+
+    return task_id
+
+
+def is_transient(err):
+    """
+    Check if request failed with an error that may go away on retry.
+    """
+
+    import httplib2
+
+    if isinstance(err, HttpError):
+        return err.resp.status in TRANSIENT_STATUS
+    return isinstance(err, (OSError, httplib2.HttpLib2Error))
+
+
+def find_created_task(service, op, id_map):
+    """
+    Find task created by change that was sent before worker stopped without
+    recording its result. Tasks created by other changes, and those that
+    existed when the change was queued, are skipped.
+
+    Return task item, or None if task was not created.
+    """
+
+    known_ids = set(id_map.values()) | set(op.get('existing', []))
+    for item in tasklists.list_tasks(service, op['list']):
+        if (item['id'] not in known_ids and
+                item['title'] == op['body']['title'] and
+                item.get('notes') == op['body'].get('notes')):
+            return item
+
+
+def send_op(service, op, was_sent, id_map):
+    """
+    Send queued change to server and apply its result to cache file.
+
+    Return record of completed change.
+    """
+
+    record = {}
+    if op['op'] == 'create':
+        result = None
+        if was_sent:
+            result = find_created_task(service, op, id_map)
+        if result is None:
+            # Previous task or parent may have been queued as well
+            previous = op.get('previous')
+            parent = op.get('parent')
+            result = service.tasks().insert(
+                tasklist=op['list'], body=op['body'],
+                parent=id_map.get(parent, parent),
+                previous=id_map.get(previous, previous)).execute()
+        record['id'] = result['id']
+        # Created task takes place of its local copy
+        tasklists.update_cached_task(op['list'], result, deleted_id=op['id'])
+        return record
+
+    task_id = id_map.get(op['id'], op['id'])
+    if is_local_id(task_id):
+        # Task was never created
+        record['error'] = 'Task does not exist.'
+        return record
+
+    if op['op'] == 'delete':
+        try:
+            service.tasks().delete(tasklist=op['list'],
+                                   task=task_id).execute()
+        except HttpError as err:
+            # Task may have been deleted before worker stopped
+            if err.resp.status not in (404, 410):
+                raise
+        tasklists.update_cached_task(op['list'], deleted_id=task_id)
+    else:
+        result = service.tasks().patch(tasklist=op['list'], task=task_id,
+                                       body=op['body']).execute()
+        tasklists.update_cached_task(op['list'], result)
+
+    return record
+
+
+def send_pending(creds, verbose=False):
+    """
+    Send changes of outbox in order, retrying requests that fail with
+    temporary errors.
+
+    Return True once all changes are completed, or False if the server
+    could not be reached.
+    """
+
+    service = api.build_service(creds)
+    outbox = load_outbox()
+    if not outbox:
+        return True
+
+    ops, sent, done, id_map = outbox
+    for op_num, op in enumerate(ops):
+        if op_num in done:
+            continue
+
+        # Created tasks are looked up before sending them again, in case
+        # server received them but worker stopped before their result
+        was_sent = op_num in sent
+        append_records([{'sent': op_num}])
+        for attempt in range(RETRIES):
+            try:
+                record = send_op(service, op, was_sent, id_map)
+                break
+            except Exception as err:
+                if not is_transient(err):
+                    if not isinstance(err, HttpError):
+                        raise
+                    record = {'error': err._get_reason()}
+                    break
+                if attempt == RETRIES - 1:
+                    print(err, file=sys.stderr)
+                    return False
+                was_sent = True
+                time.sleep(RETRY_DELAY * 2 ** attempt)
+
+        if 'error' in record:
+            print('Failed to {0} task {1}: {2}'.format(
+                op['op'], op['id'], record['error']), file=sys.stderr)
+            if op['op'] == 'create':
+                tasklists.update_cached_task(op['list'],
+                                             deleted_id=op['id'])
+        elif verbose:
+            print('Sent: {0} task {1}'.format(op['op'], op['id']))
+        if 'id' in record:
+            id_map[op['id']] = record['id']
+
+        record['done'] = op_num
+        append_records([record])
+
+    # Remove outbox unless changes were added while sending
+    with file_lock('outbox.lock'):
+        outbox = load_outbox()
+        if outbox and len(outbox[2]) == len(outbox[0]):
+            os.remove(OUTBOX_FILE)
+            return True
+    return not outbox
+
+
+def push(creds, verbose=False, wait=True):
+    """
+    Send queued changes to server.
+
+    Only one worker sends changes at a time. If wait is False and another
+    worker is running, return None right away, as that worker sends new
+    changes before it stops.
+
+    Return True if no changes are left to send, or False if sending failed.
+    """
+
+    while True:
+        with file_lock('outbox.worker.lock', wait) as locked:
+            if not locked:
+                return None
+            if not send_pending(creds, verbose):
+                return False
+        # Changes may have been queued after worker checked for them, while
+        # worker of their command could not get the lock
+        if not get_pending()[0]:
+            return True
+
+
+def start_worker():
+    """
+    Start worker that sends queued changes in the background.
+
+    Worker is a detached process, so it keeps running once command returns.
+    Task lists of the in-memory backend only exist in the running process,
+    so they are sent from a thread of it instead.
+    """
+
+    if api.get_backend() == 'memory':
+        threading.Thread(target=push, args=(None, False, False),
+                         daemon=True).start()
+        return
+
+    from . import accounts
+
+    # Worker sends changes of account in use
+    env = dict(os.environ)
+    env.pop('TASKSTODO_ACCOUNT', None)
+    if accounts.get_account():
+        env['TASKSTODO_ACCOUNT'] = accounts.get_account()
+
+    with open(LOG_FILE, 'a') as log:
+        subprocess.Popen([sys.executable, '-m', 'taskstodo.outbox'],
+                         stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL,
+                         stderr=log, start_new_session=True, env=env)
+
+
+def print_status():
+    """
+    Print number of changes waiting to be sent.
+    """
+
+    ops, _ = get_pending()
+    print('Queued changes: {0}'.format(len(ops)))
+
+
+def main():
+    from . import accounts
+    from .taskstodo import load_stored_creds
+
+    accounts.use_account(os.environ.get('TASKSTODO_ACCOUNT'))
+
+    # Worker is detached from terminal, so user cannot login
+    creds = None
+    if api.uses_credentials():
+        from google.auth.exceptions import RefreshError
+
+        try:
+            creds = load_stored_creds(accounts.get_account())
+        except RefreshError as err:
+            print(err, file=sys.stderr)
+        if not creds:
+            print('No valid credentials, queued changes are kept until they '
+                  'are sent by a command after login.', file=sys.stderr)
+            sys.exit(1)
+
+    # Changes that could not be sent are kept for the next worker
+    if push(creds, wait=False) is False:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
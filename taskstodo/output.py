@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+
+"""
+Write records in machine-readable formats.
+"""
+
+import sys
+import json
+
+FORMATS = ['text', 'json', 'ndjson', 'tsv']
+
+
+def escape_tsv(value):
+    """
+    Escape value for use as field of tab-separated values.
+    """
+
+    if value is None:
+        return ''
+
+    return (str(value).replace('\\', '\\\\').replace('\t', '\\t')
+            .replace('\n', '\\n').replace('\r', '\\r'))
+
+
+def write_records(records, fmt, fields, file=None):
+    """
+    Write records to file one at a time as they are produced.
+
+    Records are dictionaries, of which only the given fields are written.
+    If producing records fails, records written so far are still valid
+    output when the error is raised.
+    """
+
+    if file is None:
+        file = sys.stdout
+
+    if fmt == 'json':
+        file.write('[')
+        try:
+            for i, record in enumerate(records):
+                if i:
+                    file.write(',')
+                file.write('\n' + json.dumps({f: record.get(f)
+                                              for f in fields}))
+        finally:
+            # Close array even if producing records failed
+            file.write('\n]\n')
+    elif fmt == 'ndjson':
+        for record in records:
+            file.write(json.dumps({f: record.get(f) for f in fields}) + '\n')
+    elif fmt == 'tsv':
+        file.write('\t'.join(fields) + '\n')
+        for record in records:
+            file.write('\t'.join(escape_tsv(record.get(f))
+                                 for f in fields) + '\n')
+
+    file.flush()
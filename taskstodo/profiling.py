@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+
+"""
+Profile CPU time or memory use of a command.
+"""
+
+import os
+import sys
+import io
+import pstats
+import cProfile
+import tracemalloc
+
+MODES = ['cpu', 'mem']
+
+# Number of functions or allocation sites in reports
+REPORT_SIZE = 30
+
+# Number of frames kept for each memory allocation
+TRACE_FRAMES = 25
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Profiling is not nested when the batch command runs other commands
+_active = False
+
+
+def run(func, mode, report_file=None):
+    """
+    Call func while profiling CPU time or memory use and write a report to
+    stderr or report file.
+
+    Only the calling thread is profiled for CPU time.
+    """
+
+    global _active
+
+    if _active:
+        return func()
+
+    _active = True
+    try:
+        if mode == 'cpu':
+            profiler = cProfile.Profile()
+            try:
+                return profiler.runcall(func)
+            finally:
+                write_cpu_report(profiler, report_file)
+        else:
+            tracemalloc.start(TRACE_FRAMES)
+            try:
+                return func()
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                write_memory_report(snapshot, peak, report_file)
+    finally:
+        _active = False
+
+
+def write_cpu_report(profiler, report_file=None):
+    """
+    Print functions of this package that took the most cumulative time, or
+    dump all statistics to report file for use with pstats.
+    """
+
+    if report_file:
+        profiler.dump_stats(report_file)
+        return
+
+    stats = pstats.Stats(profiler, stream=sys.stderr)
+    stats.sort_stats(pstats.SortKey.CUMULATIVE)
+    stats.print_stats(PACKAGE_DIR, REPORT_SIZE)
+
+
+def get_allocation_site(traceback):
+    """
+    Get innermost frame of this package that led to memory allocation, or
+    innermost frame if there is none.
+    """
+
+    for frame in reversed(traceback):
+        if frame.filename.startswith(PACKAGE_DIR):
+            return frame
+
+    return traceback[-1]
+
+
+def write_memory_report(snapshot, peak, report_file=None):
+    """
+    Print peak memory use and memory still allocated at exit by lines of
+    this package that caused the allocations.
+    """
+
+    sites = {}
+    for stat in snapshot.statistics('traceback'):
+        frame = get_allocation_site(stat.traceback)
+        key = (frame.filename, frame.lineno)
+        size, count = sites.get(key, (0, 0))
+        sites[key] = (size + stat.size, count + stat.count)
+
+    f = io.StringIO()
+    print('Peak memory: {0:.1f} KiB'.format(peak / 1024), file=f)
+    print('Allocated at exit: {0:.1f} KiB'.format(
+        sum(size for size, _ in sites.values()) / 1024), file=f)
+    print(file=f)
+    print('{0:>10} {1:>8}  {2}'.format('KiB', 'Blocks', 'Line'), file=f)
+    top_sites = sorted(sites.items(), key=lambda site: site[1][0],
+                       reverse=True)[:REPORT_SIZE]
+    for (filename, lineno), (size, count) in top_sites:
+        if filename.startswith(PACKAGE_DIR):
+            filename = os.path.relpath(filename, os.path.dirname(PACKAGE_DIR))
+        print('{0:>10.1f} {1:>8}  {2}:{3}'.format(
+            size / 1024, count, filename, lineno), file=f)
+
+    if report_file:
+        with open(report_file, 'w') as report:
+            report.write(f.getvalue())
+    else:
+        sys.stderr.write(f.getvalue())
@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+
+"""
+Record API requests and their responses to a directory, and replay them
+later without network access.
+"""
+
+import os
+import re
+import json
+import time
+import threading
+import collections
+import urllib.parse
+
+RECORD_FILE = 'requests.jsonl'
+
+# Headers that may hold tokens are not written to recordings
+REDACTED_HEADERS = {'authorization', 'cookie', 'set-cookie',
+                    'x-goog-iam-authorization-token'}
+
+BOUNDARY_RE = re.compile(r'boundary="?([^";]+)"?')
+CONTENT_ID_RE = re.compile(r'Content-ID: <([^>+]+) \+')
+
+# Replays shared by all services of the process, by directory
+_replays = {}
+_replays_lock = threading.Lock()
+
+
+def redact_headers(headers):
+    """
+    Get copy of headers with values that may hold tokens replaced.
+    """
+
+    return {k: '[REDACTED]' if k.lower() in REDACTED_HEADERS else v
+            for k, v in (headers or {}).items()}
+
+
+def to_text(body):
+    if body is None:
+        return ''
+    if isinstance(body, bytes):
+        return body.decode('utf-8')
+    return body
+
+
+def get_batch_ids(headers, body):
+    """
+    Get multipart boundary and base of content IDs of batch request, which
+    are chosen at random for each batch.
+    """
+
+    headers = {k.lower(): v for k, v in (headers or {}).items()}
+    match = BOUNDARY_RE.search(headers.get('content-type', ''))
+    boundary = match.group(1) if match else None
+    match = CONTENT_ID_RE.search(body)
+    base_id = match.group(1) if match else None
+    return boundary, base_id
+
+
+def request_key(method, uri, headers, body):
+    """
+    Get key that matches request to recorded requests, with random parts
+    of batch requests left out.
+    """
+
+    for part in get_batch_ids(headers, body):
+        if part:
+            body = body.replace(part, '')
+    return method, uri, body
+
+
+class RecordingHttp:
+    """
+    HTTP client that appends every request sent through it and its
+    response to a recording.
+    """
+
+    def __init__(self, http, directory):
+        self.http = http
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.record_file = os.path.join(directory, RECORD_FILE)
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        start_time = time.perf_counter()
+        resp, content = self.http.request(uri, method, body=body,
+                                          headers=headers, **kwargs)
+        latency = time.perf_counter() - start_time
+
+        record = {'method': method, 'uri': uri,
+                  'headers': redact_headers(headers), 'body': to_text(body),
+                  'status': resp.status,
+                  'response_headers': redact_headers(dict(resp)),
+                  'content': to_text(content), 'latency': latency}
+        with self.lock, open(self.record_file, 'a') as f:
+            f.write(json.dumps(record) + '\n')
+
+        return resp, content
+
+
+class ReplayHttp:
+    """
+    HTTP client that answers requests with responses from a recording.
+
+    Requests are matched to recorded requests with the same method, URI
+    and body, in the order they were recorded. Requests that changed since
+    recording get the next response to the same method and path instead.
+    Each response is delayed by its recorded latency, or given latency in
+    seconds.
+    """
+
+    def __init__(self, records, latency=None):
+        self.records = records
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.used = set()
+        self.by_key = collections.defaultdict(collections.deque)
+        self.by_path = collections.defaultdict(collections.deque)
+        for i, r in enumerate(records):
+            self.by_key[request_key(r['method'], r['uri'], r['headers'],
+                                    r['body'])].append(i)
+            self.by_path[self.path_key(r['method'], r['uri'])].append(i)
+
+    def path_key(self, method, uri):
+        return method, urllib.parse.urlsplit(uri).path
+
+    def next_record(self, queue):
+        while queue:
+            i = queue.popleft()
+            if i not in self.used:
+                self.used.add(i)
+                return self.records[i]
+        return None
+
+    def find_record(self, method, uri, headers, body):
+        """
+        Get recorded request and response that best match request, or None
+        if there are none left.
+        """
+
+        with self.lock:
+            return (self.next_record(self.by_key[request_key(
+                        method, uri, headers, body)]) or
+                    self.next_record(self.by_path[self.path_key(method,
+                                                                uri)]))
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        import httplib2
+
+        body = to_text(body)
+        record = self.find_record(method, uri, headers, body)
+        if record is None:
+            resp = httplib2.Response({'status': 501,
+                                      'content-type': 'application/json'})
+            content = json.dumps({'error': {
+                'code': 501, 'message': 'Request was not recorded.'}})
+            return resp, content.encode()
+
+        time.sleep(record['latency'] if self.latency is None
+                   else self.latency)
+
+        content = record['content']
+        # Responses to batch requests refer to parts by the IDs they had
+        # when recorded
+        old_id = get_batch_ids(record['headers'], record['body'])[1]
+        new_id = get_batch_ids(headers, body)[1]
+        if old_id and new_id:
+            content = content.replace(old_id, new_id)
+
+        resp = httplib2.Response(record['response_headers'])
+        resp.status = record['status']
+        return resp, content.encode()
+
+    def close(self):
+        pass
+
+
+def read_records(directory):
+    """
+    Read recorded requests and responses from directory.
+    """
+
+    record_file = os.path.join(directory, RECORD_FILE)
+    with open(record_file, 'r') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def get_replay(directory, latency=None):
+    """
+    Get HTTP client that replays recording in directory, shared by all
+    services of this process so each response is replayed once.
+    """
+
+    with _replays_lock:
+        if directory not in _replays:
+            _replays[directory] = ReplayHttp(read_records(directory),
+                                             latency)
+        return _replays[directory]
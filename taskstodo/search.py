@@ -0,0 +1,219 @@
+#!/usr/bin/env python3
+
+"""
+Search titles and notes of cached tasks without accessing the server.
+"""
+
+import os
+import sys
+import json
+import sqlite3
+
+from . import output
+from . import tasklists
+from . import trace
+
+DATA_DIR = os.path.expanduser('~/.local/share/taskstodo')
+CACHE_FILE = os.path.join(DATA_DIR, 'tasklists.json')
+INDEX_FILE = os.path.join(DATA_DIR, 'search.db')
+
+RESULT_FIELDS = ['list_title', 'list_num', 'task_num', 'id', 'title', 'note']
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS tasks (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT UNIQUE,
+    list_title TEXT,
+    list_num INTEGER,
+    task_num INTEGER,
+    updated TEXT,
+    title TEXT,
+    note TEXT
+);
+'''
+
+# Full-text index kept in sync with tasks table by triggers, which only
+# reindex tasks whose title or note changed, not those that were moved.
+# Trigger tasks_au of earlier versions reindexed tasks on any change.
+FTS_SCHEMA = '''
+CREATE VIRTUAL TABLE IF NOT EXISTS tasks_fts USING fts5(
+    title, note, content='tasks', content_rowid='rowid');
+CREATE TRIGGER IF NOT EXISTS tasks_ai AFTER INSERT ON tasks BEGIN
+    INSERT INTO tasks_fts(rowid, title, note)
+    VALUES (new.rowid, new.title, new.note);
+END;
+CREATE TRIGGER IF NOT EXISTS tasks_ad AFTER DELETE ON tasks BEGIN
+    INSERT INTO tasks_fts(tasks_fts, rowid, title, note)
+    VALUES ('delete', old.rowid, old.title, old.note);
+END;
+DROP TRIGGER IF EXISTS tasks_au;
+CREATE TRIGGER IF NOT EXISTS tasks_au_text AFTER UPDATE OF title, note ON tasks
+WHEN old.title IS NOT new.title OR old.note IS NOT new.note BEGIN
+    INSERT INTO tasks_fts(tasks_fts, rowid, title, note)
+    VALUES ('delete', old.rowid, old.title, old.note);
+    INSERT INTO tasks_fts(rowid, title, note)
+    VALUES (new.rowid, new.title, new.note);
+END;
+'''
+
+
+def open_index(index_file=None):
+    """
+    Open search index, creating it if needed.
+
+    Return tuple of database connection and whether full-text search is
+    supported by SQLite.
+    """
+
+    if index_file is None:
+        index_file = INDEX_FILE
+
+    db = sqlite3.connect(index_file)
+    db.executescript(SCHEMA)
+    try:
+        db.executescript(FTS_SCHEMA)
+        fts = True
+    except sqlite3.OperationalError:
+        # SQLite was built without FTS5
+        fts = False
+
+    return db, fts
+
+
+def update_index(db, cache_file=None):
+    """
+    Update search index with changes in task list cache.
+
+    Only tasks that were added, changed or moved since the last update are
+    written to the index.
+
+    Return False if there is no cache file.
+    """
+
+    if cache_file is None:
+        cache_file = CACHE_FILE
+
+    try:
+        mtime = str(os.stat(cache_file).st_mtime_ns)
+    except FileNotFoundError:
+        return False
+
+    row = db.execute("SELECT value FROM meta WHERE key = 'mtime'").fetchone()
+    trace.record_cache('search', bool(row and row[0] == mtime))
+    if row and row[0] == mtime:
+        return True
+
+    if cache_file == tasklists.CACHE_FILE:
+        # Reuse task lists loaded or written by this process
+        tasklists_cache = tasklists.load_tasklist_cache() or []
+    else:
+        with open(cache_file, 'r') as f:
+            tasklists_cache = json.load(f)
+
+    indexed = {}
+    for task_id, list_title, list_num, task_num, updated in db.execute(
+            'SELECT id, list_title, list_num, task_num, updated FROM tasks'):
+        indexed[task_id] = (list_title, list_num, task_num, updated)
+
+    with db:
+        list_nums = {}
+        for tasklist in tasklists_cache:
+            # Number task lists with duplicate titles like -l option
+            list_num = list_nums.get(tasklist['title'], 0) + 1
+            list_nums[tasklist['title']] = list_num
+
+            for i, task in enumerate(tasklist['tasks']):
+                key = (tasklist['title'], list_num, i + 1, task['updated'])
+                if indexed.pop(task['id'], None) == key:
+                    continue
+                db.execute('''INSERT INTO tasks (id, list_title, list_num,
+                              task_num, updated, title, note)
+                              VALUES (?, ?, ?, ?, ?, ?, ?)
+                              ON CONFLICT (id) DO UPDATE SET
+                              list_title = excluded.list_title,
+                              list_num = excluded.list_num,
+                              task_num = excluded.task_num,
+                              updated = excluded.updated,
+                              title = excluded.title,
+                              note = excluded.note''',
+                           (task['id'], *key, task['title'], task['note']))
+
+        # Remove tasks no longer in cache
+        db.executemany('DELETE FROM tasks WHERE id = ?',
+                       [(task_id,) for task_id in indexed])
+        db.execute("INSERT OR REPLACE INTO meta VALUES ('mtime', ?)",
+                   (mtime,))
+
+    return True
+
+
+def search_tasks(db, fts, query, max_results):
+    """
+    Search titles and notes of indexed tasks for all words of query.
+
+    Return list of dictionaries of matching tasks, best matches first.
+    """
+
+    words = query.split()
+    if not words:
+        return []
+
+    columns = 'tasks.' + ', tasks.'.join(RESULT_FIELDS)
+    if fts:
+        # Quote words to match them as prefixes instead of query syntax
+        match = ' '.join('"{0}"*'.format(w.replace('"', '""'))
+                         for w in words)
+        rows = db.execute('''SELECT {0} FROM tasks_fts
+                             JOIN tasks ON tasks.rowid = tasks_fts.rowid
+                             WHERE tasks_fts MATCH ?
+                             ORDER BY rank LIMIT ?'''.format(columns),
+                          (match, max_results))
+    else:
+        where = ' AND '.join(["(title LIKE ? OR IFNULL(note, '') LIKE ?)"]
+                             * len(words))
+        params = []
+        for word in words:
+            params += ['%{0}%'.format(word)] * 2
+        rows = db.execute('''SELECT {0} FROM tasks WHERE {1}
+                             ORDER BY list_title, list_num, task_num
+                             LIMIT ?'''.format(columns, where),
+                          (*params, max_results))
+
+    return [dict(zip(RESULT_FIELDS, row)) for row in rows]
+
+
+def print_search(query, max_results, verbose, fmt='text'):
+    """
+    Print out cached tasks matching query.
+    """
+
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+
+    db, fts = open_index()
+    with db:
+        if not update_index(db):
+            print('Task list cache does not exist, list tasks to create it',
+                  file=sys.stderr)
+            return
+        results = search_tasks(db, fts, query, max_results)
+    db.close()
+
+    if fmt != 'text':
+        output.write_records(results, fmt, RESULT_FIELDS)
+        return
+
+    if not results:
+        print('No tasks found.')
+        return
+
+    for result in results:
+        print('- {0}'.format(result['title']))
+        print('  List: {0} -l {1} -t {2}'.format(
+            result['list_title'], result['list_num'], result['task_num']))
+        if verbose:
+            if result['note']:
+                print('  Note: {0}'.format(
+                    result['note'].replace('\n', '\n        ')))
+            print('  ID: {0}'.format(result['id']))
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+
+"""
+Track sync state and journal planned sync operations so interrupted syncs
+can be resumed, and define local task stores that are synced.
+"""
+
+import os
+import json
+import hashlib
+
+FINGERPRINT_SIZE = 16
+# Records are a sign, a hex encoded fingerprint and a new line
+RECORD_SIZE = FINGERPRINT_SIZE * 2 + 2
+# Minimum number of stale records before state file is compacted
+COMPACT_MIN = 1000
+
+
+def content_fingerprint(title, note):
+    """
+    Return fixed-size fingerprint of title and note of a task.
+    """
+
+    data = '{0}\0{1}'.format(title, note or '')
+    return hashlib.blake2b(data.encode('utf-8'),
+                           digest_size=FINGERPRINT_SIZE).hexdigest()
+
+
+def fingerprint(task):
+    """
+    Return fixed-size fingerprint of task title and note.
+
+    Task is a dictionary or a task model, which keeps its fingerprint once
+    computed.
+    """
+
+    if isinstance(task, dict):
+        return content_fingerprint(task['title'], task.get('note'))
+    return task.fingerprint
+
+
+def completion_fingerprint(task):
+    """
+    Return fingerprint recorded in sync state for task that was synced as
+    completed.
+
+    It only depends on title and note, so it is the same whether the task
+    is completed now or not.
+    """
+
+    return content_fingerprint(task.title + '\0completed', task.note)
+
+
+class SyncAdapter:
+    """
+    Local store of tasks that a Google task list is synced with.
+
+    Subclasses set name and default data directory, read all tasks of the
+    store at once and apply all local changes of a sync at once, so each
+    sync reads and writes the store only once.
+    """
+
+    name = None
+    data_dir = None
+
+    def __init__(self, data_dir=None):
+        if data_dir is not None:
+            self.data_dir = data_dir
+
+    def read_tasks(self):
+        """
+        Read tasks of store and return them as list of task models.
+        """
+
+        raise NotImplementedError
+
+    def fingerprint(self, task):
+        """
+        Get fingerprint that tasks of both sides are matched by.
+        """
+
+        return fingerprint(task)
+
+    def apply_changes(self, old_tasks, new_tasks, status_tasks):
+        """
+        Delete old tasks, add new tasks and change completion status of
+        tasks to that of status tasks with the same title.
+        """
+
+        raise NotImplementedError
+
+
+def load_state(state_file):
+    """
+    Read fingerprints of synced tasks from state file.
+
+    Return set of fingerprints.
+    """
+
+    synced = set()
+    try:
+        with open(state_file, 'r') as f:
+            for record in f:
+                # Skip last record if it was only partially written
+                if len(record) != RECORD_SIZE:
+                    continue
+                if record[0] == '+':
+                    synced.add(record[1:-1])
+                else:
+                    synced.discard(record[1:-1])
+    except FileNotFoundError:
+        pass
+
+    return synced
+
+
+def update_state(state_file, synced, added, removed):
+    """
+    Record added and removed fingerprints in state file.
+
+    Changes are appended to the file so the cost of an update only depends
+    on the number of changes. The file is rewritten once most of its records
+    are stale.
+
+    Return updated set of fingerprints.
+    """
+
+    synced = (synced - set(removed)) | set(added)
+
+    try:
+        records = os.path.getsize(state_file) // RECORD_SIZE
+    except FileNotFoundError:
+        records = 0
+
+    if records + len(added) + len(removed) > 2 * len(synced) + COMPACT_MIN:
+        temp_file = state_file + '.tmp'
+        with open(temp_file, 'w') as f:
+            f.writelines('+{0}\n'.format(fp) for fp in synced)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, state_file)
+    else:
+        with open(state_file, 'a') as f:
+            f.writelines('-{0}\n'.format(fp) for fp in removed)
+            f.writelines('+{0}\n'.format(fp) for fp in added)
+            f.flush()
+            os.fsync(f.fileno())
+
+    return synced
+
+
+def load_sync_time(time_file):
+    """
+    Read time that last completed sync started at.
+
+    Return seconds since the epoch, or None if no sync was completed.
+    """
+
+    try:
+        with open(time_file, 'r') as f:
+            return float(f.read())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def save_sync_time(time_file, sync_time):
+    """
+    Record time that completed sync started at.
+    """
+
+    temp_file = time_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        f.write('{0}\n'.format(sync_time))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, time_file)
+
+
+def create_journal(journal_file, ops, state=None):
+    """
+    Write planned operations to journal file before any are performed.
+
+    Each operation is a list of the operation kind and its task. State is a
+    dictionary of fingerprints to add to and remove from the sync state once
+    all operations are completed.
+    """
+
+    if state is None:
+        state = {'add': [], 'remove': []}
+
+    temp_file = journal_file + '.tmp'
+    with open(temp_file, 'w') as f:
+        f.write(json.dumps({'ops': ops, 'state': state}) + '\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Only replace journal once it is completely written
+    os.replace(temp_file, journal_file)
+
+
+def load_journal(journal_file):
+    """
+    Read planned operations and completed operation numbers from journal.
+
+    Return tuple of operations list, sync state changes and set of completed
+    operation numbers, or None if there is no journal.
+    """
+
+    try:
+        with open(journal_file, 'r') as f:
+            lines = f.readlines()
+    except FileNotFoundError:
+        return None
+
+    journal = json.loads(lines[0])
+    done = set()
+    for line in lines[1:]:
+        try:
+            done.add(json.loads(line)['done'])
+        except ValueError:
+            # Skip last line if it was only partially written
+            pass
+
+    return journal['ops'], journal['state'], done
+
+
+def mark_done(journal_file, *op_nums):
+    """
+    Record operations as completed in journal file, syncing it to disk once.
+    """
+
+    with open(journal_file, 'a') as f:
+        f.write(''.join(json.dumps({'done': op_num}) + '\n'
+                        for op_num in op_nums))
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def remove_journal(journal_file):
+    """
+    Remove journal file once all operations are completed.
+    """
+
+    try:
+        os.remove(journal_file)
+    except FileNotFoundError:
+        pass
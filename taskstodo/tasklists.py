@@ -5,69 +5,277 @@ Create, read, update or delete task lists.
 """
 
 import os
+import sys
 import json
+import time
+import threading
+import contextlib
+import itertools
+
+from . import aio
+from . import api
+from . import metrics
+from . import models
+from . import output
+from . import trace
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 DATA_DIR = os.path.expanduser('~/.local/share/taskstodo')
 CACHE_FILE = os.path.join(DATA_DIR, 'tasklists.json')
 
+# Fields written in machine-readable formats
+TASKLIST_FIELDS = ['id', 'title', 'updated']
+TASK_FIELDS = ['id', 'title', 'note', 'updated', 'position']
+
+# Cache refreshes are deferred while running batches of commands
+_defer_refresh = False
+_refresh_pending = False
+
+# Modification time and contents of last loaded cache file
+_loaded_cache = None
+
+# Changes of single tasks collected while cache writes are deferred
+_pending_changes = None
+
+# Serializes changes to cache file made by concurrent threads
+_cache_lock = threading.RLock()
+
+
+def list_tasklists(service, page_size=100):
+    """
+    Get task lists from server one page at a time.
+
+    Yield task list items as they are received.
+    """
+
+    request = service.tasklists().list(maxResults=page_size)
+    while request is not None:
+        results = request.execute()
+        yield from results.get('items', [])
+        request = service.tasklists().list_next(request, results)
+
+
+def list_tasks(service, tasklist_id, show_hidden=False, show_completed=True,
+               completed_min=None):
+    """
+    Get tasks of task list from server one page at a time.
+
+    Completed tasks cleared from task list are hidden, and only returned if
+    show_hidden is True. If completed_min is given, only tasks completed
+    since that RFC 3339 timestamp are returned.
+
+    Yield task items as they are received, which is not in position order.
+    """
+
+    kwargs = {}
+    if completed_min:
+        kwargs['completedMin'] = completed_min
+    request = service.tasks().list(tasklist=tasklist_id, maxResults=100,
+                                   showCompleted=show_completed,
+                                   showHidden=show_hidden, **kwargs)
+    while request is not None:
+        results = request.execute()
+        yield from results.get('items', [])
+        request = service.tasks().list_next(request, results)
+
+
+async def fetch_all_tasks(creds):
+    """
+    Get task lists and then tasks of all task lists at the same time.
+
+    Return list of task list items and list of lists of their task items.
+    """
+
+    client = aio.Client(creds)
+    tasklist_items = await client.list_tasklists()
+    task_items = await aio.gather(*(client.list_tasks(item['id'])
+                                    for item in tasklist_items))
+    return tasklist_items, task_items
+
 
 def create_tasklist_cache(creds):
     """
     Get task list details from server and dump results to cache file.
 
+    Tasks of different task lists are downloaded concurrently.
+
     Return list of dictionaries of task lists.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
     try:
-        # Get task lists
-        tasklist_results = service.tasklists().list(maxResults=100).execute()
+        tasklist_items, all_task_items = aio.run(fetch_all_tasks(creds))
     except HttpError as err:
         print(err)
         return
 
-    tasklist_items = tasklist_results.get('items')
     tasklists = []
-    for tasklist_item in tasklist_items:
-        tasklist = {}
-        tasklist['id'] = tasklist_item['id']
-        tasklist['title'] = tasklist_item['title']
-        tasklist['updated'] = tasklist_item['updated']
+    for tasklist_item, task_items in zip(tasklist_items, all_task_items):
+        tasklist = models.TaskList.from_item(tasklist_item, task_items)
+        tasklist_item['tasks'] = [task.to_dict() for task in tasklist.tasks]
+        tasklists.append(tasklist_item)
 
-        try:
-            # Get tasks
-            task_results = service.tasks().list(
-                    tasklist=tasklist_item['id'], maxResults=100).execute()
-        except HttpError as err:
-            print(err)
+    # Keep changes not yet sent by background worker
+    from . import outbox
+    outbox.apply_pending(tasklists)
+
+    write_tasklist_cache(tasklists)
+
+    return tasklists
+
+
+@contextlib.contextmanager
+def locked_cache():
+    """
+    Hold lock of cache file, counting time waited for it.
+    """
+
+    start_time = time.perf_counter()
+    with _cache_lock:
+        metrics.observe('taskstodo_lock_wait_seconds',
+                        time.perf_counter() - start_time, lock='cache')
+        yield
+
+
+def write_tasklist_cache(tasklists):
+    """
+    Write task lists to cache file, replacing it atomically.
+
+    Written task lists are kept as loaded cache, so they are not read back.
+    """
+
+    global _loaded_cache
+
+    with locked_cache():
+        if not os.path.exists(DATA_DIR):
+            os.makedirs(DATA_DIR)
+
+        tmp_file = CACHE_FILE + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(tasklists, f, indent=4)
+            metrics.inc('taskstodo_cache_write_bytes_total', f.tell())
+        os.replace(tmp_file, CACHE_FILE)
+        _loaded_cache = (os.stat(CACHE_FILE).st_mtime_ns, tasklists)
+
+
+def update_cached_task(tasklist_id, task_item=None, deleted_id=None,
+                       moved=False, previous_id=None):
+    """
+    Apply change of a single task to cache file without downloading task
+    lists again.
+
+    Task item returned by server replaces cached task with the same ID, and
+    task with deleted ID is removed. New and moved tasks are placed after
+    task with previous ID, or at top of task list.
+
+    While cache writes are deferred, the change is only collected.
+    """
+
+    change = (tasklist_id, task_item, deleted_id, moved, previous_id)
+    with locked_cache():
+        if _pending_changes is not None:
+            _pending_changes.append(change)
             return
 
-        tasks = []
-        task_items = task_results.get('items')
-        # Sort task items by position key instead of update time
-        task_items.sort(key=lambda task_items: task_items['position'])
-        for task_item in task_items:
-            task = {}
-            task['id'] = task_item['id']
-            task['title'] = task_item['title']
-            task['updated'] = task_item['updated']
-            task['note'] = task_item.get('notes')
-            task['position'] = task_item['position']
-            tasks.append(task)
-
-        tasklist_item['tasks'] = tasks
-        tasklists.append(tasklist_item)
+        tasklists = load_tasklist_cache()
+        if tasklists:
+            apply_task_change(tasklists, *change)
+            write_tasklist_cache(tasklists)
 
-    if not os.path.exists(DATA_DIR):
-        os.mkdir(DATA_DIR)
 
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(tasklists, f, indent=4)
+@contextlib.contextmanager
+def deferred_cache_writes():
+    """
+    Collect changes of single tasks made in the block, and then apply them
+    to the cache file in order with a single write.
+    """
 
-    return tasklists
+    global _pending_changes
+
+    if _pending_changes is not None:
+        # Changes are written by outer block
+        yield
+        return
+
+    _pending_changes = []
+    try:
+        yield
+    finally:
+        with locked_cache():
+            changes = _pending_changes
+            _pending_changes = None
+            tasklists = load_tasklist_cache() if changes else None
+            if tasklists:
+                for change in changes:
+                    apply_task_change(tasklists, *change)
+                write_tasklist_cache(tasklists)
+
+
+def apply_task_change(tasklists, tasklist_id, task_item=None,
+                      deleted_id=None, moved=False, previous_id=None):
+    """
+    Apply change of a single task to loaded task lists of cache file.
+    """
+
+    for tasklist in tasklists:
+        if tasklist['id'] == tasklist_id:
+            break
+    else:
+        return
+
+    changed_ids = {deleted_id}
+    if task_item:
+        changed_ids.add(task_item['id'])
+
+    tasks = tasklist['tasks']
+    index = None
+    for i, task in enumerate(tasks):
+        if task['id'] in changed_ids:
+            index = i
+            del tasks[i]
+            break
+
+    if task_item:
+        # Positions of other tasks may change on server, so tasks are
+        # placed by their neighbour instead of sorted by position key
+        if index is None or moved:
+            index = 0
+            for i, task in enumerate(tasks):
+                if task['id'] == previous_id:
+                    index = i + 1
+        tasks.insert(index, models.Task.from_item(task_item).to_dict())
+
+
+def refresh_tasklist_cache(creds):
+    """
+    Update cache file after task lists or tasks were changed on server.
+    """
+
+    global _refresh_pending
+
+    if _defer_refresh:
+        _refresh_pending = True
+    else:
+        create_tasklist_cache(creds)
+
+
+@contextlib.contextmanager
+def deferred_cache_refresh(creds):
+    """
+    Defer cache refreshes until the end of the block and then refresh the
+    cache once if anything was changed.
+    """
+
+    global _defer_refresh, _refresh_pending
+
+    _defer_refresh = True
+    try:
+        yield
+    finally:
+        _defer_refresh = False
+        if _refresh_pending:
+            _refresh_pending = False
+            create_tasklist_cache(creds)
 
 
 def load_tasklist_cache():
@@ -77,14 +285,24 @@ def load_tasklist_cache():
     Return list of dictionaries of task lists.
     """
 
+    global _loaded_cache
+
     tasklists = []
     try:
+        # Reuse cache loaded earlier in long-running processes
+        mtime = os.stat(CACHE_FILE).st_mtime_ns
+        if _loaded_cache and _loaded_cache[0] == mtime:
+            trace.record_cache('tasklists', True)
+            return _loaded_cache[1]
+
         with open(CACHE_FILE, 'r') as f:
             tasklists = json.load(f)
 
+        trace.record_cache('tasklists', True)
+        _loaded_cache = (mtime, tasklists)
         return tasklists
     except FileNotFoundError:
-        pass
+        trace.record_cache('tasklists', False)
 
 
 def print_duplicates(tasklist_ids):
@@ -124,23 +342,75 @@ def get_tasklist_ids(creds, title):
     return tasklist_ids
 
 
-def print_all_tasklists(creds, num_lists, verbose):
+def get_cached_task_ids(creds, tasklist_id, parent=None):
+    """
+    Get IDs of tasks directly under parent, or of top-level tasks if no
+    parent is given, in position order from cache file.
+
+    Return None if task list does not exist.
+    """
+
+    tasklists = load_tasklist_cache()
+    for _ in range(2):
+        for tasklist in tasklists or []:
+            if tasklist['id'] == tasklist_id:
+                return [t['id'] for t in tasklist['tasks']
+                        if t.get('parent') == parent]
+        # Refresh cache and try again in case task list was added elsewhere
+        tasklists = create_tasklist_cache(creds)
+
+
+def get_task_ids_by_title(creds, tasklist_id, title):
+    """
+    Get IDs of tasks in task list matching title from cache file.
+
+    Return list of task IDs.
+    """
+
+    tasklists = load_tasklist_cache()
+    if not tasklists:
+        tasklists = create_tasklist_cache(creds) or []
+
+    task_ids = []
+    for tasklist in tasklists:
+        if tasklist['id'] == tasklist_id:
+            task_ids = [t['id'] for t in tasklist['tasks']
+                        if t['title'] == title]
+
+    if not task_ids:
+        # Refresh cache and try again in case task was added elsewhere
+        tasklists = create_tasklist_cache(creds) or []
+        for tasklist in tasklists:
+            if tasklist['id'] == tasklist_id:
+                task_ids = [t['id'] for t in tasklist['tasks']
+                            if t['title'] == title]
+
+    return task_ids
+
+
+def print_all_tasklists(creds, num_lists, verbose, fmt='text'):
     """
     Print out all task lists.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
+    # Get all task lists
+    items = itertools.islice(list_tasklists(service, min(num_lists, 100)),
+                             num_lists)
     try:
-        # Get all task lists
-        results = service.tasklists().list(maxResults=num_lists).execute()
+        if fmt != 'text':
+            output.write_records(items, fmt, TASKLIST_FIELDS)
+            return
+        items = list(items)
     except HttpError as err:
+        # Keep output of machine-readable formats valid
+        file = sys.stdout if fmt == 'text' else sys.stderr
         if verbose:
-            print(err)
+            print(err, file=file)
         else:
-            print(err._get_reason())
+            print(err._get_reason(), file=file)
         return
 
-    items = results.get('items')
     if not items:
         print('No task lists found.')
         return
@@ -152,12 +422,32 @@ def print_all_tasklists(creds, num_lists, verbose):
             print('  - Updated: {0}'.format(item['updated']))
 
 
+def get_tasklist_id(creds, title, list_num):
+    """
+    Get ID of task list matching title and number of duplicate task list.
+
+    Return None if there is no such task list.
+    """
+
+    tasklist_ids = get_tasklist_ids(creds, title)
+    if not tasklist_ids:
+        print('Task list does not exist')
+    elif len(tasklist_ids) > 1 and (list_num is None or list_num < 0
+                                    or list_num > len(tasklist_ids) - 1):
+        print_duplicates(tasklist_ids)
+    else:
+        if len(tasklist_ids) == 1 or list_num is None:
+            list_num = 0
+        return tasklist_ids[list_num]
+
+
 def get_tasklist(creds, title, list_num):
     """
-    Get specific task list and its tasks and return them as a dictionary.
+    Get specific task list and its tasks and return them as a task list
+    model.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = get_tasklist_ids(creds, title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -172,8 +462,7 @@ def get_tasklist(creds, title, list_num):
             tasklist_results = service.tasklists().get(
                     tasklist=tasklist_ids[list_num]).execute()
             # Get tasks for task list
-            task_results = service.tasks().list(
-                    tasklist=tasklist_ids[list_num], maxResults=100).execute()
+            task_items = list(list_tasks(service, tasklist_ids[list_num]))
         except HttpError as err:
             if err._get_reason() == 'Task list not found.':
                 # Update cache file and try again in case tasklist was
@@ -184,53 +473,54 @@ def get_tasklist(creds, title, list_num):
                 print(err._get_reason())
                 return
 
-        tasklist = {}
-        tasklist['id'] = tasklist_results.get('id')
-        tasklist['updated'] = tasklist_results.get('updated')
-
-        tasks = []
-        task_items = task_results.get('items')
-        # Sort task items by position key instead of update time
-        task_items.sort(key=lambda task_items: task_items['position'])
-        for task_item in task_items:
-            task = {}
-            task['id'] = task_item['id']
-            task['title'] = task_item['title']
-            task['updated'] = task_item['updated']
-            task['note'] = task_item.get('notes')
-            task['position'] = task_item['position']
-            tasks.append(task)
-
-        tasklist['tasks'] = tasks
-
-        return tasklist
+        return models.TaskList.from_item(tasklist_results, task_items)
 
 
-def print_tasklist(creds, title, list_num, verbose):
+def print_tasklist(creds, title, list_num, verbose, fmt='text'):
     """
     Print out specific task list and its tasks.
+
+    Machine-readable formats are written while tasks are received, so tasks
+    are not in position order.
     """
 
+    if fmt != 'text':
+        tasklist_id = get_tasklist_id(creds, title, list_num)
+        if tasklist_id is None:
+            return
+
+        service = api.build_service(creds)
+        try:
+            output.write_records(
+                    (models.Task.from_item(item).to_dict()
+                     for item in list_tasks(service, tasklist_id)),
+                    fmt, TASK_FIELDS)
+        except HttpError as err:
+            if verbose:
+                print(err, file=sys.stderr)
+            else:
+                print(err._get_reason(), file=sys.stderr)
+        return
+
     tasklist = get_tasklist(creds, title, list_num)
     if not tasklist:
         return
 
     if verbose:
-        print('ID: {0}'.format(tasklist['id']))
-        print('Updated: {0}'.format(tasklist['updated']))
+        print('ID: {0}'.format(tasklist.id))
+        print('Updated: {0}'.format(tasklist.updated))
         print()
 
     print('Tasks:')
-    tasks = tasklist.get('tasks')
-    for i, task in enumerate(tasks):
-        print('{0}. {1}'.format(i+1, task['title']))
+    for i, task in enumerate(tasklist.tasks):
+        print('{0}. {1}'.format(i+1, task.title))
 
-        if task['note']:
+        if task.note:
             print('  Note: {0}'.format(
-                task['note'].replace('\n', '\n        ')))
+                task.note.replace('\n', '\n        ')))
 
         if verbose:
-            print('  ID: {0}'.format(task['id']))
+            print('  ID: {0}'.format(task.id))
 
 
 def create_tasklist(creds, title, verbose):
@@ -238,7 +528,7 @@ def create_tasklist(creds, title, verbose):
     Create a new task list.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist = {"title": title}
     try:
         # Create task list
@@ -251,7 +541,7 @@ def create_tasklist(creds, title, verbose):
         return
 
     # Update cache file
-    create_tasklist_cache(creds)
+    refresh_tasklist_cache(creds)
 
 
 def delete_tasklist(creds, title, list_num, verbose):
@@ -259,7 +549,7 @@ def delete_tasklist(creds, title, list_num, verbose):
     Delete a task list.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = get_tasklist_ids(creds, title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -281,7 +571,7 @@ def delete_tasklist(creds, title, list_num, verbose):
             return
 
         # Update cache file
-        create_tasklist_cache(creds)
+        refresh_tasklist_cache(creds)
 
 
 def update_tasklist(creds, title, new_title, list_num, verbose):
@@ -289,7 +579,7 @@ def update_tasklist(creds, title, new_title, list_num, verbose):
     Update title of task list.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = get_tasklist_ids(creds, title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -312,4 +602,4 @@ def update_tasklist(creds, title, new_title, list_num, verbose):
             return
 
         # Update cache file
-        create_tasklist_cache(creds)
+        refresh_tasklist_cache(creds)
@@ -4,42 +4,113 @@
 Create, read, update or delete tasks.
 """
 
+from . import api
+from . import models
+from . import output
 from . import tasklists
 
-from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
 
-def get_task_id(creds, list_id, task_num):
+def get_task_ids(creds, list_id):
     """
-    Get task ID from specified task list.
+    Get IDs of all tasks in task list in position order.
+
+    Return None if tasks could not be read.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     try:
         # Get all tasks in list
-        results = service.tasks().list(
-                tasklist=list_id, maxResults=100).execute()
-
-        # Ensure task number is within range
-        if task_num is None or task_num > len(
-                results['items']) - 1 or task_num < 0:
-            return None
+        items = list(tasklists.list_tasks(service, list_id))
     except HttpError as err:
         print(err)
+        return
 
-    items = results.get('items')
     # Sort task items by position key instead of update time
     items.sort(key=lambda items: items['position'])
-    return items[task_num]['id']
+    return [item['id'] for item in items]
+
+
+def get_task_id(creds, list_id, task_num):
+    """
+    Get task ID from specified task list.
+    """
+
+    task_ids = get_task_ids(creds, list_id)
+
+    # Ensure task number is within range
+    if task_ids is None or task_num is None or task_num > len(
+            task_ids) - 1 or task_num < 0:
+        return None
+
+    return task_ids[task_num]
+
+
+def get_previous_id(creds, list_id, position, parent=None):
+    """
+    Get ID of task that a new task at position among tasks under parent,
+    or among top-level tasks if no parent is given, is placed after, from
+    cache file.
+
+    Return None if new task is placed first, or False if position is out
+    of range.
+    """
+
+    task_ids = tasklists.get_cached_task_ids(creds, list_id, parent)
+    if task_ids is None or position < 0 or position > len(task_ids):
+        print('Position is out of range')
+        return False
+
+    return task_ids[position - 1] if position else None
+
+
+def print_duplicate_tasks(task_ids):
+    """
+    Print tasks with duplicate titles.
+    """
+
+    print('Multiple tasks with duplicate titles found:')
+    for i, task_id in enumerate(task_ids):
+        print('{0}. ID: {1}'.format(i + 1, task_id))
+    print('\nUse -i option to select task ID')
+
+
+def select_task_id(creds, list_id, task_num, task_id=None, match=None):
+    """
+    Get ID of task selected by ID, title or number.
 
+    Titles are looked up in the cache file, so only selecting by number
+    downloads the task list.
 
-def get_task(creds, list_title, task_num, list_num, verbose):
+    Return None if no single task is selected.
+    """
+
+    if task_id is not None:
+        return task_id
+
+    if match is None:
+        task_id = get_task_id(creds, list_id, task_num)
+        if task_id is None:
+            print('Invalid task number')
+        return task_id
+
+    task_ids = tasklists.get_task_ids_by_title(creds, list_id, match)
+    if not task_ids:
+        print('Task does not exist')
+    elif len(task_ids) > 1:
+        print_duplicate_tasks(task_ids)
+    else:
+        return task_ids[0]
+
+
+def get_task(creds, list_title, task_num, list_num, verbose, fmt='text',
+             task_id=None, match=None):
     """
     Print out task details.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = tasklists.get_tasklist_ids(creds, list_title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -50,9 +121,9 @@ def get_task(creds, list_title, task_num, list_num, verbose):
         if len(tasklist_ids) == 1 or list_num is None:
             list_num = 0
 
-        task_id = get_task_id(creds, tasklist_ids[list_num], task_num)
+        task_id = select_task_id(creds, tasklist_ids[list_num], task_num,
+                                 task_id, match)
         if task_id is None:
-            print('Invalid task number')
             return
 
         try:
@@ -66,25 +137,36 @@ def get_task(creds, list_title, task_num, list_num, verbose):
                 print(err._get_reason())
             return
 
-        if verbose:
-            print('ID: {}'.format(task_id))
-        task_title = results.get('title')
-        task_updated = results.get('updated')
-        task_note = results.get('notes')
-        print('Title: {}'.format(task_title))
-        print('Updated: {}'.format(task_updated))
-        print('Note: {}'.format(task_note))
+        if fmt != 'text':
+            output.write_records([models.Task.from_item(results).to_dict()],
+                                 fmt, tasklists.TASK_FIELDS)
+        else:
+            if verbose:
+                print('ID: {}'.format(task_id))
+            task_title = results.get('title')
+            task_updated = results.get('updated')
+            task_note = results.get('notes')
+            print('Title: {}'.format(task_title))
+            print('Updated: {}'.format(task_updated))
+            print('Note: {}'.format(task_note))
 
         # Update cache file
-        tasklists.create_tasklist_cache(creds)
+        tasklists.update_cached_task(tasklist_ids[list_num], results)
 
 
-def create_task(creds, list_title, task_title, note, list_num, verbose):
+def create_task(creds, list_title, task_title, note, list_num, verbose,
+                position=None, after=None, parent=None):
     """
     Create new task on specified task list.
+
+    Task is placed at position, after task with ID given by after or as
+    first subtask of parent, or else at top of task list. It is created by
+    a single request.
+
+    Return created task, or None if it could not be created.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = tasklists.get_tasklist_ids(creds, list_title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -99,10 +181,19 @@ def create_task(creds, list_title, task_title, note, list_num, verbose):
 
         if len(tasklist_ids) == 1 or list_num is None:
             list_num = 0
+
+        previous = after
+        if position is not None:
+            previous = get_previous_id(creds, tasklist_ids[list_num],
+                                       position, parent)
+            if previous is False:
+                return
+
         try:
             # Create task
-            service.tasks().insert(tasklist=tasklist_ids[list_num],
-                                   body=task).execute()
+            result = service.tasks().insert(tasklist=tasklist_ids[list_num],
+                                            body=task, parent=parent,
+                                            previous=previous).execute()
         except HttpError as err:
             if verbose:
                 print(err)
@@ -110,16 +201,22 @@ def create_task(creds, list_title, task_title, note, list_num, verbose):
                 print(err._get_reason())
             return
 
-        # Update cache file
-        tasklists.create_tasklist_cache(creds)
+        # Update cache file, where subtasks follow their parent
+        tasklists.update_cached_task(tasklist_ids[list_num], result,
+                                     previous_id=previous or parent)
 
+        return result
 
-def delete_task(creds, list_title, task_num, list_num, verbose):
+
+def delete_task(creds, list_title, task_num, list_num, verbose,
+                task_id=None, match=None):
     """
     Delete task from specified task list.
+
+    Return True if task was deleted.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = tasklists.get_tasklist_ids(creds, list_title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -130,13 +227,13 @@ def delete_task(creds, list_title, task_num, list_num, verbose):
         if len(tasklist_ids) == 1 or list_num is None:
             list_num = 0
 
-        task_id = get_task_id(creds, tasklist_ids[list_num], task_num)
+        task_id = select_task_id(creds, tasklist_ids[list_num], task_num,
+                                 task_id, match)
         if task_id is None:
-            print('Invalid task number')
             return
 
         try:
-            # Get task
+            # Delete task
             service.tasks().delete(tasklist=tasklist_ids[list_num],
                                    task=task_id).execute()
         except HttpError as err:
@@ -147,15 +244,19 @@ def delete_task(creds, list_title, task_num, list_num, verbose):
             return
 
         # Update cache file
-        tasklists.create_tasklist_cache(creds)
+        tasklists.update_cached_task(tasklist_ids[list_num],
+                                     deleted_id=task_id)
 
+        return True
 
-def update_task(creds, list_title, task_title, task_num, list_num, verbose):
+
+def update_task(creds, list_title, task_title, task_num, list_num, verbose,
+                task_id=None, match=None):
     """
     Update task title from specified task list.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = tasklists.get_tasklist_ids(creds, list_title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -166,16 +267,17 @@ def update_task(creds, list_title, task_title, task_num, list_num, verbose):
         if len(tasklist_ids) == 1 or list_num is None:
             list_num = 0
 
-        task_id = get_task_id(creds, tasklist_ids[list_num], task_num)
+        task_id = select_task_id(creds, tasklist_ids[list_num], task_num,
+                                 task_id, match)
         if task_id is None:
-            print('Invalid task number')
             return
 
         new_task = {'title': task_title}
         try:
             # Update task
-            service.tasks().patch(tasklist=tasklist_ids[list_num],
-                                  task=task_id, body=new_task).execute()
+            result = service.tasks().patch(tasklist=tasklist_ids[list_num],
+                                           task=task_id,
+                                           body=new_task).execute()
         except HttpError as err:
             if verbose:
                 print(err)
@@ -184,18 +286,16 @@ def update_task(creds, list_title, task_title, task_num, list_num, verbose):
             return
 
         # Update cache file
-        tasklists.create_tasklist_cache(creds)
+        tasklists.update_cached_task(tasklist_ids[list_num], result)
 
 
-def move_task(creds, list_title, new_pos, task_num, list_num, verbose):
+def move_task(creds, list_title, new_pos, task_num, list_num, verbose,
+              task_id=None, match=None):
     """
     Move task to new position in task list.
     """
 
-    if new_pos == task_num:
-        return
-
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = tasklists.get_tasklist_ids(creds, list_title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -206,32 +306,46 @@ def move_task(creds, list_title, new_pos, task_num, list_num, verbose):
         if len(tasklist_ids) == 1 or list_num is None:
             list_num = 0
 
-        task_id = get_task_id(creds, tasklist_ids[list_num], task_num)
-        if task_id is None:
-            print('Invalid task number')
+        if task_id is None and match is not None:
+            task_id = select_task_id(creds, tasklist_ids[list_num], None,
+                                     None, match)
+            if task_id is None:
+                return
+
+        # Positions of all tasks are needed to find new previous task
+        task_ids = get_task_ids(creds, tasklist_ids[list_num])
+        if task_ids is None:
             return
 
-        out_of_range = False
-        if new_pos >= 0:
-            # Check if task is moving up or down
-            if new_pos < task_num:
-                new_pos = new_pos - 1
-            # ID of task that will be previous to moved task
-            prev_id = get_task_id(creds, tasklist_ids[list_num], new_pos)
+        if task_id is not None:
+            if task_id not in task_ids:
+                print('Task does not exist')
+                return
+            task_num = task_ids.index(task_id)
+        elif task_num is None or task_num < 0 or task_num > len(
+                task_ids) - 1:
+            print('Invalid task number')
+            return
+        task_id = task_ids[task_num]
 
-            if prev_id is None and new_pos != -1:
-                out_of_range = True
-        else:
-            out_of_range = True
+        if new_pos == task_num:
+            return
 
-        if out_of_range:
+        if new_pos < 0 or new_pos > len(task_ids) - 1:
             print("New position is out of range")
             return
 
+        # Check if task is moving up or down
+        if new_pos < task_num:
+            new_pos = new_pos - 1
+        # ID of task that will be previous to moved task
+        prev_id = task_ids[new_pos] if new_pos >= 0 else None
+
         try:
             # Move task
-            service.tasks().move(tasklist=tasklist_ids[list_num],
-                                 task=task_id, previous=prev_id).execute()
+            result = service.tasks().move(tasklist=tasklist_ids[list_num],
+                                          task=task_id,
+                                          previous=prev_id).execute()
         except HttpError as err:
             if verbose:
                 print(err)
@@ -240,15 +354,17 @@ def move_task(creds, list_title, new_pos, task_num, list_num, verbose):
             return
 
         # Update cache file
-        tasklists.create_tasklist_cache(creds)
+        tasklists.update_cached_task(tasklist_ids[list_num], result,
+                                     moved=True, previous_id=prev_id)
 
 
-def create_note(creds, list_title, note, task_num, list_num, verbose):
+def create_note(creds, list_title, note, task_num, list_num, verbose,
+                task_id=None, match=None):
     """
     Create note for specified task.
     """
 
-    service = build('tasks', 'v1', credentials=creds)
+    service = api.build_service(creds)
     tasklist_ids = tasklists.get_tasklist_ids(creds, list_title)
     if not tasklist_ids:
         print('Task list does not exist')
@@ -259,9 +375,9 @@ def create_note(creds, list_title, note, task_num, list_num, verbose):
         if len(tasklist_ids) == 1 or list_num is None:
             list_num = 0
 
-        task_id = get_task_id(creds, tasklist_ids[list_num], task_num)
+        task_id = select_task_id(creds, tasklist_ids[list_num], task_num,
+                                 task_id, match)
         if task_id is None:
-            print('Invalid task number')
             return
 
         # Accept new line character
@@ -269,8 +385,9 @@ def create_note(creds, list_title, note, task_num, list_num, verbose):
         new_task = {'notes': note}
         try:
             # Update task
-            service.tasks().patch(tasklist=tasklist_ids[list_num],
-                                  task=task_id, body=new_task).execute()
+            result = service.tasks().patch(tasklist=tasklist_ids[list_num],
+                                           task=task_id,
+                                           body=new_task).execute()
         except HttpError as err:
             if verbose:
                 print(err)
@@ -279,4 +396,4 @@ def create_note(creds, list_title, note, task_num, list_num, verbose):
             return
 
         # Update cache file
-        tasklists.create_tasklist_cache(creds)
+        tasklists.update_cached_task(tasklist_ids[list_num], result)
@@ -2,135 +2,343 @@
 
 import sys
 import os
+import io
 import argparse
+import functools
+import shlex
 
-from . import tasklists
-from . import tasks
-from . import calcurse
-
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from httplib2.error import ServerNotFoundError
+from . import output
 
 SCOPES = ['https://www.googleapis.com/auth/tasks']
-CMDS = ['show-lists', 'list', 'task', 'sync-calcurse']
-CFG_DIR = os.path.expanduser('~/.config/taskstodo')
+CMDS = ['show-lists', 'list', 'task', 'sync-calcurse', 'gc', 'batch',
+        'serve', 'search', 'export', 'import', 'push', 'sync-all']
+
+
+def create_parser():
+    """
+    Create parser of command line arguments.
+    """
+
+    parser = argparse.ArgumentParser(description="Manage Google Tasks")
+    parser.add_argument('--trace', action='store_true',
+                        default=bool(os.environ.get('TASKSTODO_TRACE')),
+                        help='print summary of API requests to stderr')
+    parser.add_argument('--trace-file', metavar='file',
+                        default=os.environ.get('TASKSTODO_TRACE_FILE'),
+                        help='append API requests to file as JSON lines')
+    parser.add_argument('--profile', choices=['cpu', 'mem'],
+                        help='print report of CPU time or memory use')
+    parser.add_argument('--profile-file', metavar='file',
+                        help='''write CPU statistics for pstats or memory
+                        report to file''')
+    parser.add_argument('--metrics-file', metavar='file',
+                        default=os.environ.get('TASKSTODO_METRICS_FILE'),
+                        help='''write metrics of syncs to file in Prometheus
+                        text format''')
+    parser.add_argument('--account', metavar='name',
+                        default=os.environ.get('TASKSTODO_ACCOUNT'),
+                        help='''use credentials, cache and sync state of named
+                        account''')
+    subparsers = parser.add_subparsers(dest='command')
+
+    parser_show_lists = subparsers.add_parser(CMDS[0],
+                                              help='show all task lists')
+    parser_show_lists.add_argument('-m', '--max-results', metavar='number',
+                                   default=10, type=int,
+                                   help='''max number of lists to return
+                                   (default: %(default)s)''')
+    parser_show_lists.add_argument('-f', '--format', default='text',
+                                   choices=output.FORMATS, dest='fmt',
+                                   help='output format (default: %(default)s)')
+    parser_show_lists.add_argument('-v', '--verbose', action='store_true',
+                                   help='show verbose messages')
+
+    parser_list = subparsers.add_parser(CMDS[1], help='manage a task list')
+    group_list = parser_list.add_mutually_exclusive_group()
+    group_list.add_argument('-c', '--create', action='store_true',
+                            help='create new task list')
+    group_list.add_argument('-d', '--delete', action='store_true',
+                            help='delete existing task list')
+    group_list.add_argument('-u', '--update', metavar='title', type=str,
+                            help='update title of task list')
+    parser_list.add_argument('-l', '--list', metavar='number', default=None,
+                             type=int, dest='list_num',
+                             help='select task list')
+    parser_list.add_argument('-f', '--format', default='text',
+                             choices=output.FORMATS, dest='fmt',
+                             help='output format (default: %(default)s)')
+    parser_list.add_argument('-v', '--verbose', action='store_true',
+                             help='show verbose messages')
+    parser_list.add_argument('list_title', type=str,
+                             help='title of task list to use')
+
+    parser_task = subparsers.add_parser(CMDS[2], help='manage tasks')
+    group_task = parser_task.add_mutually_exclusive_group()
+    group_task.add_argument('-c', '--create', metavar='title', type=str,
+                            help='create new task')
+    group_task.add_argument('-d', '--delete', action='store_true',
+                            help='delete existing task')
+    group_task.add_argument('-u', '--update', metavar='title', type=str,
+                            help='update title of task')
+    group_task.add_argument('-m', '--move', metavar='number', default=None,
+                            dest='new_pos', type=int,
+                            help='move task to new position')
+    parser_task.add_argument('-n', '--note', metavar='note', type=str,
+                             help='create note for task')
+    group_place = parser_task.add_mutually_exclusive_group()
+    group_place.add_argument('-p', '--position', metavar='number',
+                             default=None, type=int,
+                             help='create task at position')
+    group_place.add_argument('-a', '--after', metavar='id', default=None,
+                             type=str, help='create task after task ID')
+    parser_task.add_argument('--parent', metavar='id', default=None,
+                             type=str, help='create task as subtask of ID')
+    group_select = parser_task.add_mutually_exclusive_group()
+    group_select.add_argument('-t', '--task', metavar='number', default=None,
+                              dest='task_num', type=int, help='select task')
+    group_select.add_argument('-i', '--id', metavar='id', default=None,
+                              dest='task_id', type=str,
+                              help='select task by ID')
+    group_select.add_argument('-s', '--match', metavar='title', default=None,
+                              type=str, help='select task by title')
+    parser_task.add_argument('-l', '--list', metavar='number', default=None,
+                             dest='list_num', type=int,
+                             help='select task list')
+    parser_task.add_argument('-f', '--format', default='text',
+                             choices=output.FORMATS, dest='fmt',
+                             help='output format (default: %(default)s)')
+    parser_task.add_argument('-b', '--background', action='store_true',
+                             default=bool(os.environ.get(
+                                 'TASKSTODO_BACKGROUND')),
+                             help='''apply change to cached tasks and send it
+                             to server in background''')
+    parser_task.add_argument('-v', '--verbose', action='store_true',
+                             help='show verbose messages')
+    parser_task.add_argument('list_title', type=str,
+                             help='title of task list to use')
 
-# Parse command line arguments
-parser = argparse.ArgumentParser(description="Manage Google Tasks")
-subparsers = parser.add_subparsers()
+    parser_sync_calcurse = subparsers.add_parser(
+            CMDS[3], help='sync with calcurse tasks')
+    parser_sync_calcurse.add_argument('list_title', type=str,
+                                      help='title of task list to use')
+    parser_sync_calcurse.add_argument('-l', '--list', metavar='number',
+                                      default=None, type=int, dest='list_num',
+                                      help='select task list')
+    parser_sync_calcurse.add_argument('-p', '--plan', action='store_true',
+                                      help='''show planned changes and their
+                                      estimated cost without syncing''')
+    parser_sync_calcurse.add_argument('-c', '--calcurse-dir', metavar='dir',
+                                      help='use calcurse data directory')
+    parser_sync_calcurse.add_argument('-v', '--verbose', action='store_true',
+                                      help='show verbose messages')
 
-parser_show_lists = subparsers.add_parser(CMDS[0], help='show all task lists')
-parser_show_lists.add_argument('-m', '--max-results', metavar='number',
-                               default=10, type=int,
-                               help='''max number of lists to return
+    parser_gc = subparsers.add_parser(CMDS[4],
+                                      help='delete unused calcurse notes')
+    parser_gc.add_argument('-c', '--calcurse-dir', metavar='dir',
+                           help='use calcurse data directory')
+    parser_gc.add_argument('-v', '--verbose', action='store_true',
+                           help='show verbose messages')
+
+    parser_batch = subparsers.add_parser(
+            CMDS[5], help='run commands read from file, one per line')
+    parser_batch.add_argument('file', nargs='?', default='-', type=str,
+                              help='file of commands or - to read stdin')
+
+    parser_serve = subparsers.add_parser(
+            CMDS[6], help='run daemon that other commands are forwarded to')
+    parser_serve.add_argument('-p', '--metrics-port', metavar='port',
+                              type=int,
+                              help='serve metrics of syncs on local port')
+    parser_serve.add_argument('-v', '--verbose', action='store_true',
+                              help='show verbose messages')
+
+    parser_search = subparsers.add_parser(
+            CMDS[7], help='search titles and notes of cached tasks')
+    parser_search.add_argument('-m', '--max-results', metavar='number',
+                               default=20, type=int,
+                               help='''max number of tasks to return
                                (default: %(default)s)''')
-parser_show_lists.add_argument('-v', '--verbose', action='store_true',
+    parser_search.add_argument('-f', '--format', default='text',
+                               choices=output.FORMATS, dest='fmt',
+                               help='output format (default: %(default)s)')
+    parser_search.add_argument('-v', '--verbose', action='store_true',
+                               help='show verbose messages')
+    parser_search.add_argument('query', type=str,
+                               help='words to search for')
+
+    parser_export = subparsers.add_parser(
+            CMDS[8], help='export all task lists and tasks as JSON lines')
+    parser_export.add_argument('-z', '--gzip', action='store_true',
+                               dest='compress',
+                               help='compress export with gzip')
+    parser_export.add_argument('-v', '--verbose', action='store_true',
+                               help='show verbose messages')
+    parser_export.add_argument('file', nargs='?', default='-', type=str,
+                               help='file to write or - to write stdout')
+
+    parser_import = subparsers.add_parser(
+            CMDS[9], help='create task lists and tasks from export')
+    parser_import.add_argument('-v', '--verbose', action='store_true',
                                help='show verbose messages')
+    parser_import.add_argument('file', nargs='?', default='-', type=str,
+                               help='file to read or - to read stdin')
+
+    parser_push = subparsers.add_parser(
+            CMDS[10], help='send task changes made in background now')
+    parser_push.add_argument('-v', '--verbose', action='store_true',
+                             help='show verbose messages')
 
-parser_list = subparsers.add_parser(CMDS[1], help='manage a task list')
-group_list = parser_list.add_mutually_exclusive_group()
-group_list.add_argument('-c', '--create', action='store_true',
-                        help='create new task list')
-group_list.add_argument('-d', '--delete', action='store_true',
-                        help='delete existing task list')
-group_list.add_argument('-u', '--update', metavar='title', type=str,
-                        help='update title of task list')
-parser_list.add_argument('-l', '--list', metavar='number', default=None,
-                         type=int, dest='list_num', help='select task list')
-parser_list.add_argument('-v', '--verbose', action='store_true',
-                         help='show verbose messages')
-parser_list.add_argument('list_title', type=str,
-                         help='title of task list to use')
-
-parser_task = subparsers.add_parser(CMDS[2], help='manage tasks')
-group_task = parser_task.add_mutually_exclusive_group()
-group_task.add_argument('-c', '--create', metavar='title', type=str,
-                        help='create new task')
-group_task.add_argument('-d', '--delete', action='store_true',
-                        help='delete existing task')
-group_task.add_argument('-u', '--update', metavar='title', type=str,
-                        help='update title of task')
-group_task.add_argument('-m', '--move', metavar='number', default=None,
-                        dest='new_pos', type=int,
-                        help='move task to new position')
-parser_task.add_argument('-n', '--note', metavar='note', type=str,
-                         help='create note for task')
-parser_task.add_argument('-t', '--task', metavar='number', default=None,
-                         dest='task_num', type=int, help='select task')
-parser_task.add_argument('-l', '--list', metavar='number', default=None,
-                         dest='list_num', type=int, help='select task list')
-parser_task.add_argument('-v', '--verbose', action='store_true',
-                         help='show verbose messages')
-parser_task.add_argument('list_title', type=str,
-                         help='title of task list to use')
-
-parser_sync_calcurse = subparsers.add_parser(CMDS[3],
-                                             help='sync with calcurse tasks')
-parser_sync_calcurse.add_argument('list_title', type=str,
-                                  help='title of task list to use')
-parser_sync_calcurse.add_argument('-l', '--list', metavar='number',
-                                  default=None, type=int, dest='list_num',
-                                  help='select task list')
-parser_sync_calcurse.add_argument('-v', '--verbose', action='store_true',
-                                  help='show verbose messages')
-
-args = parser.parse_args()
-
-# Convert arguments to zero-based numbering
-if "list_num" in vars(args) and args.list_num is not None:
-    args.list_num = args.list_num - 1
-if "task_num" in vars(args) and args.task_num is not None:
-    args.task_num = args.task_num - 1
-if "new_pos" in vars(args) and args.new_pos is not None:
-    args.new_pos = args.new_pos - 1
+    parser_sync_all = subparsers.add_parser(
+            CMDS[11], help='sync task lists of several accounts in parallel')
+    parser_sync_all.add_argument('-c', '--calcurse-dir', metavar='dir',
+                                 help='''use calcurse data directory, in which
+                                 {account} is replaced by account name''')
+    parser_sync_all.add_argument('-j', '--jobs', metavar='number', type=int,
+                                 dest='workers',
+                                 help='''max number of syncs run at the same
+                                 time (default: number of CPUs)''')
+    parser_sync_all.add_argument('-v', '--verbose', action='store_true',
+                                 help='show verbose messages')
+    parser_sync_all.add_argument('jobs', nargs='+',
+                                 metavar='[account:]list_title',
+                                 help='task list to sync and its account')
+
+    return parser
+
+
+def parse_args(argv=None):
+    """
+    Parse command line arguments.
+    """
+
+    parser = create_parser()
+    args = parser.parse_args(argv)
+
+    if args.account:
+        from . import accounts
+
+        try:
+            accounts.check_account(args.account)
+        except ValueError as err:
+            parser.error(str(err))
+
+    # Convert arguments to zero-based numbering
+    if "list_num" in vars(args) and args.list_num is not None:
+        args.list_num = args.list_num - 1
+    if "task_num" in vars(args) and args.task_num is not None:
+        args.task_num = args.task_num - 1
+    if "new_pos" in vars(args) and args.new_pos is not None:
+        args.new_pos = args.new_pos - 1
+    if "position" in vars(args) and args.position is not None:
+        args.position = args.position - 1
+
+    return args
 
 
 def auth_user():
     """
-    Authenticate user with credentials.
+    Authenticate user of account in use with credentials.
     Return valid credentials for use with services.
     """
 
-    if not os.path.exists(CFG_DIR):
-        os.mkdir(CFG_DIR)
+    from . import accounts
+
+    return load_creds(accounts.get_account())
 
-    token_file = os.path.join(CFG_DIR, 'token.json')
-    creds_file = os.path.join(CFG_DIR, 'credentials.json')
 
-    creds = None
-    if os.path.exists(token_file):
-        creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+@functools.lru_cache(maxsize=None)
+def load_creds(account):
+    """
+    Load credentials of account, letting user login if needed.
+
+    Credentials are only loaded once per process and account, and not at
+    all if the API backend does not need them. Accounts share the client
+    credentials of the default account unless they have their own.
+    """
+
+    from . import api
+    from . import accounts
+
+    if not api.uses_credentials():
+        return None
+
+    creds = load_stored_creds(account)
     # If there are no valid credentials available, let user login
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists(creds_file):
-                print('Credentials file does not exist.', file=sys.stderr)
-                print('Setup credentials on Google Cloud and create:',
-                      creds_file, file=sys.stderr)
-                sys.exit(1)
+    if not creds:
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        cfg_dir = accounts.get_dirs(account)[0]
+        creds_file = os.path.join(cfg_dir, 'credentials.json')
+        if not os.path.exists(creds_file):
+            creds_file = os.path.join(accounts.CFG_DIR, 'credentials.json')
+
+        if not os.path.exists(creds_file):
+            print('Credentials file does not exist.', file=sys.stderr)
+            print('Setup credentials on Google Cloud and create:',
+                  creds_file, file=sys.stderr)
+            sys.exit(1)
+
+        flow = InstalledAppFlow.from_client_secrets_file(creds_file, SCOPES)
+        creds = flow.run_local_server(port=0)
+        save_creds(account, creds)
+
+    return creds
+
+
+def load_stored_creds(account):
+    """
+    Load saved credentials of account without letting user login,
+    refreshing them if they expired.
+
+    Return None if there are no valid credentials.
+    """
+
+    from google.auth.transport.requests import Request
+    from google.oauth2.credentials import Credentials
 
-            flow = InstalledAppFlow.from_client_secrets_file(creds_file,
-                                                             SCOPES)
-            creds = flow.run_local_server(port=0)
+    from . import accounts
 
-        # Save credentials for next run
-        with open(token_file, 'w') as token:
-            token.write(creds.to_json())
+    token_file = os.path.join(accounts.get_dirs(account)[0], 'token.json')
+    if not os.path.exists(token_file):
+        return None
+
+    creds = Credentials.from_authorized_user_file(token_file, SCOPES)
+    if not creds.valid:
+        if not (creds.expired and creds.refresh_token):
+            return None
+        creds.refresh(Request())
+        save_creds(account, creds)
 
     return creds
 
 
-def show_lists():
+def save_creds(account, creds):
+    """
+    Save credentials of account for next run.
+    """
+
+    from . import accounts
+
+    cfg_dir = accounts.get_dirs(account)[0]
+    if not os.path.exists(cfg_dir):
+        os.makedirs(cfg_dir)
+
+    with open(os.path.join(cfg_dir, 'token.json'), 'w') as token:
+        token.write(creds.to_json())
+
+
+def show_lists(args):
+    from . import tasklists
+
     creds = auth_user()
-    tasklists.print_all_tasklists(creds, args.max_results, args.verbose)
+    tasklists.print_all_tasklists(creds, args.max_results, args.verbose,
+                                  args.fmt)
     return
 
 
-def manage_lists():
+def manage_lists(args):
+    from . import tasklists
+
     creds = auth_user()
     if args.create:
         tasklists.create_tasklist(creds, args.list_title, args.verbose)
@@ -142,57 +350,306 @@ def manage_lists():
                                   args.list_num, args.verbose)
     else:
         tasklists.print_tasklist(creds, args.list_title, args.list_num,
-                                 args.verbose)
+                                 args.verbose, args.fmt)
     return
 
 
-def manage_tasks():
+def manage_tasks(args):
+    from . import tasklists
+    from . import tasks
+
     creds = auth_user()
-    if args.create:
+    if args.background and (args.create or args.delete or args.update
+                            or args.note):
+        queue_task_change(creds, args)
+    elif args.create:
         tasks.create_task(creds, args.list_title, args.create, args.note,
-                          args.list_num, args.verbose)
+                          args.list_num, args.verbose, args.position,
+                          args.after, args.parent)
     elif args.delete:
         tasks.delete_task(creds, args.list_title, args.task_num, args.list_num,
-                          args.verbose)
+                          args.verbose, args.task_id, args.match)
     elif args.update:
         tasks.update_task(creds, args.list_title, args.update, args.task_num,
-                          args.list_num, args.verbose)
+                          args.list_num, args.verbose, args.task_id,
+                          args.match)
     elif args.note:
         tasks.create_note(creds, args.list_title, args.note, args.task_num,
-                          args.list_num, args.verbose)
+                          args.list_num, args.verbose, args.task_id,
+                          args.match)
     elif args.new_pos is not None:
         tasks.move_task(creds, args.list_title, args.new_pos, args.task_num,
-                        args.list_num, args.verbose)
-    elif args.task_num is not None:
+                        args.list_num, args.verbose, args.task_id, args.match)
+    elif (args.task_num is not None or args.task_id is not None
+          or args.match is not None):
         tasks.get_task(creds, args.list_title, args.task_num, args.list_num,
-                       args.verbose)
+                       args.verbose, args.fmt, args.task_id, args.match)
     else:
         tasklists.print_tasklist(creds, args.list_title, args.list_num,
-                                 args.verbose)
+                                 args.verbose, args.fmt)
     return
 
 
-def sync_calcurse():
+def queue_task_change(creds, args):
+    from . import outbox
+
+    if args.create:
+        outbox.queue_create(creds, args.list_title, args.create, args.note,
+                            args.list_num, args.verbose, args.position,
+                            args.after, args.parent)
+        return
+
+    if args.delete:
+        body = None
+    elif args.update:
+        body = {'title': args.update}
+    else:
+        # Accept new line character
+        body = {'notes': args.note.replace('\\n', '\n')}
+    outbox.queue_change(creds, args.list_title, args.task_num, args.list_num,
+                        args.verbose, args.task_id, args.match,
+                        args.delete, body)
+
+
+def sync_calcurse(args):
+    from . import engine
+
     creds = auth_user()
-    calcurse.sync_tasks(creds, args.list_title, args.list_num, args.verbose)
+    adapter = engine.get_adapter('calcurse', args.calcurse_dir)
+    if args.plan:
+        engine.print_sync_plan(creds, args.list_title, args.list_num,
+                               args.verbose, adapter)
+    else:
+        from . import metrics
+
+        try:
+            metrics.record_requests(lambda: engine.sync_tasks(
+                creds, args.list_title, args.list_num, args.verbose,
+                adapter))
+        finally:
+            if args.metrics_file:
+                metrics.write_textfile(args.metrics_file)
+
+
+def collect_garbage(args):
+    from . import calcurse
+
+    calcurse.delete_unused_notes(args.calcurse_dir or calcurse.CALCURSE_DIR,
+                                 args.verbose)
+
+
+def run_batch(args):
+    from . import tasklists
+    from . import batch
+
+    if args.file == '-':
+        lines = sys.stdin.readlines()
+    else:
+        with open(args.file, 'r') as f:
+            lines = f.readlines()
+
+    # Check all commands before running any of them
+    commands = []
+    for i, line in enumerate(lines):
+        argv = shlex.split(line, comments=True)
+        if not argv:
+            continue
+        if argv[0].startswith('-'):
+            print('Global options are only accepted before batch command, '
+                  'not on line {0}: {1}'.format(i + 1, line.strip()),
+                  file=sys.stderr)
+            sys.exit(1)
+        try:
+            if argv[0] == CMDS[5]:
+                raise ValueError
+            command = parse_args(argv)
+        except (SystemExit, ValueError):
+            print('Invalid command on line {0}: {1}'.format(
+                i + 1, line.strip()), file=sys.stderr)
+            sys.exit(1)
+
+        # Commands use account and metrics file of batch, and are traced
+        # and profiled with it
+        command.account = args.account
+        command.metrics_file = args.metrics_file
+        command.trace = False
+        command.trace_file = None
+        command.profile = None
+        commands.append(command)
+
+    creds = auth_user()
+    with tasklists.deferred_cache_refresh(creds):
+        batch.run_commands(creds, commands, run_command)
+
+
+def serve(args):
+    from . import daemon
+
+    if daemon.is_running():
+        print('Daemon is already running.', file=sys.stderr)
+        sys.exit(1)
+
+    # Load credentials before serving commands
+    auth_user()
+
+    if args.metrics_port:
+        from . import metrics
+
+        metrics.start_server(args.metrics_port)
+        if args.verbose:
+            print('Serving metrics on http://127.0.0.1:{0}/metrics'.format(
+                args.metrics_port), flush=True)
+    daemon.serve(lambda argv: run_command(parse_args(argv)), args.verbose)
+
+
+def search_tasks(args):
+    from . import search
+
+    search.print_search(args.query, args.max_results, args.verbose, args.fmt)
+
+
+def export_tasks(args):
+    from . import transfer
+
+    creds = auth_user()
+    transfer.export_tasks(creds, args.file, args.compress, args.verbose)
+
+
+def import_tasks(args):
+    from . import transfer
+
+    creds = auth_user()
+    transfer.import_tasks(creds, args.file, args.verbose)
+
+
+def push_changes(args):
+    from . import outbox
+
+    creds = auth_user()
+    if not outbox.push(creds, args.verbose):
+        print('Failed to send all changes, run again to retry.',
+              file=sys.stderr)
+    outbox.print_status()
+
+
+def sync_all(args):
+    from . import accounts
+    from . import metrics
+
+    jobs = [accounts.get_sync_argv(spec, args.calcurse_dir, args.verbose)
+            for spec in args.jobs]
+    try:
+        success = accounts.sync_all(jobs, args.workers)
+    finally:
+        if args.metrics_file:
+            metrics.write_textfile(args.metrics_file)
+    if not success:
+        sys.exit(1)
+
+
+def run_command(args):
+    from . import accounts
+    from . import trace
+
+    accounts.use_account(args.account)
+    tracing = (args.trace or args.trace_file) and trace.start()
+    try:
+        if args.profile:
+            from . import profiling
+
+            profiling.run(lambda: dispatch_command(args), args.profile,
+                          args.profile_file)
+        else:
+            dispatch_command(args)
+    finally:
+        if tracing:
+            records = trace.stop()
+            if args.trace_file:
+                trace.write_records(records, args.trace_file)
+            if args.trace:
+                trace.write_summary(records)
+
+
+def dispatch_command(args):
+    if args.command == CMDS[0]:
+        show_lists(args)
+    elif args.command == CMDS[1]:
+        manage_lists(args)
+    elif args.command == CMDS[2]:
+        manage_tasks(args)
+    elif args.command == CMDS[3]:
+        sync_calcurse(args)
+    elif args.command == CMDS[4]:
+        collect_garbage(args)
+    elif args.command == CMDS[5]:
+        run_batch(args)
+    elif args.command == CMDS[6]:
+        serve(args)
+    elif args.command == CMDS[7]:
+        search_tasks(args)
+    elif args.command == CMDS[8]:
+        export_tasks(args)
+    elif args.command == CMDS[9]:
+        import_tasks(args)
+    elif args.command == CMDS[10]:
+        push_changes(args)
+    elif args.command == CMDS[11]:
+        sync_all(args)
+
+
+def get_daemon_argv(args, argv):
+    """
+    Get command line arguments of command forwarded to daemon, with options
+    set by environment variables of this process added.
+    """
+
+    if args.account:
+        argv = ['--account', args.account] + argv
+    if args.metrics_file:
+        argv = ['--metrics-file', args.metrics_file] + argv
+    if args.trace_file:
+        argv = ['--trace-file', args.trace_file] + argv
+    if args.trace:
+        argv = ['--trace'] + argv
+    if getattr(args, 'background', False):
+        argv = argv + ['--background']
+    return argv
 
 
 def main():
     if len(sys.argv) == 1:
-        parser.print_usage()
+        create_parser().print_usage()
     else:
+        args = parse_args()
+        # Exports and imports are streamed, and syncs of several accounts
+        # run in their own worker processes, instead of being sent through
+        # daemon
+        if (args.command not in (CMDS[6], CMDS[8], CMDS[9], CMDS[11])
+                and not os.environ.get('TASKSTODO_NO_DAEMON')):
+            from . import daemon
+
+            stdin = None
+            if args.command == CMDS[5] and args.file == '-':
+                stdin = sys.stdin.read()
+
+            # Forward command to daemon if it is running
+            status = daemon.send_command(get_daemon_argv(args, sys.argv[1:]),
+                                         stdin)
+            if status is not None:
+                sys.exit(status)
+            if stdin is not None:
+                sys.stdin = io.StringIO(stdin)
+
         try:
-            if sys.argv[1] == CMDS[0]:
-                show_lists()
-            elif sys.argv[1] == CMDS[1]:
-                manage_lists()
-            elif sys.argv[1] == CMDS[2]:
-                manage_tasks()
-            elif sys.argv[1] == CMDS[3]:
-                sync_calcurse()
-        except ServerNotFoundError:
-            print('Failed to connect to server.', file=sys.stderr)
-            sys.exit(1)
+            run_command(args)
+        except Exception as err:
+            # HTTP library is only loaded by commands that use the network
+            httplib2_error = sys.modules.get('httplib2.error')
+            if httplib2_error and isinstance(
+                    err, httplib2_error.ServerNotFoundError):
+                print('Failed to connect to server.', file=sys.stderr)
+                sys.exit(1)
+            raise
 
 
 if __name__ == '__main__':
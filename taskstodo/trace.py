@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+"""
+Record API requests and cache lookups of a command and report their
+latency and size.
+"""
+
+import re
+import sys
+import json
+import time
+import threading
+import collections
+
+# Records of current trace, or None if tracing is disabled
+_records = None
+_lock = threading.Lock()
+
+# Method of request being executed by each thread
+_local = threading.local()
+
+TASKLIST_RE = re.compile(r'/lists/([^/?]+)')
+
+
+def is_enabled():
+    """
+    Check if requests are being traced.
+    """
+
+    return _records is not None
+
+
+def start():
+    """
+    Start recording requests.
+
+    Return False if a trace was already started, for example by the batch
+    command that runs this command.
+    """
+
+    global _records
+
+    if _records is not None:
+        return False
+
+    _records = []
+    return True
+
+
+def stop():
+    """
+    Stop recording requests.
+
+    Return list of dictionaries of records.
+    """
+
+    global _records
+
+    records = _records or []
+    _records = None
+    return records
+
+
+def get_records():
+    """
+    Get copy of records of current trace so far.
+    """
+
+    with _lock:
+        return list(_records or [])
+
+
+def record(**fields):
+    """
+    Add record with time it was made to current trace.
+    """
+
+    if _records is None:
+        return
+
+    fields['time'] = time.time()
+    with _lock:
+        _records.append(fields)
+
+
+def record_cache(name, hit):
+    """
+    Record lookup in cache with name.
+    """
+
+    record(type='cache', cache=name, hit=hit)
+
+
+class TracedHttp:
+    """
+    HTTP client that records every request sent through it, including
+    retries.
+    """
+
+    def __init__(self, http):
+        self.http = http
+
+    def __getattr__(self, name):
+        return getattr(self.http, name)
+
+    def request(self, uri, method='GET', body=None, headers=None, **kwargs):
+        attempt = getattr(_local, 'attempt', 0)
+        _local.attempt = attempt + 1
+
+        start_time = time.perf_counter()
+        status = None
+        content = b''
+        try:
+            resp, content = self.http.request(uri, method, body=body,
+                                              headers=headers, **kwargs)
+            status = resp.status
+            return resp, content
+        finally:
+            match = TASKLIST_RE.search(uri)
+            record(type='request',
+                   method=getattr(_local, 'method', None) or 'batch',
+                   tasklist=match.group(1) if match else None,
+                   status=status,
+                   latency=time.perf_counter() - start_time,
+                   request_bytes=len(body or ''),
+                   response_bytes=len(content or b''),
+                   retry=attempt > 0)
+
+
+def build_args(creds, http=None):
+    """
+    Get keyword arguments for building a service that traces its requests.
+
+    Requests are sent with given HTTP client, or one authorized with
+    credentials.
+    """
+
+    import google_auth_httplib2
+    from googleapiclient.http import HttpRequest, build_http
+
+    class TracedRequest(HttpRequest):
+        """
+        API request that names the requests recorded while executing it.
+        """
+
+        def execute(self, http=None, num_retries=0):
+            _local.method = self.methodId
+            _local.attempt = 0
+            try:
+                return super().execute(http=http, num_retries=num_retries)
+            finally:
+                _local.method = None
+                _local.attempt = 0
+
+    if http is None:
+        http = google_auth_httplib2.AuthorizedHttp(creds, http=build_http())
+    return {'http': TracedHttp(http), 'requestBuilder': TracedRequest}
+
+
+def write_summary(records, file=None):
+    """
+    Print table of requests by method and summary of cache lookups.
+    """
+
+    if file is None:
+        file = sys.stderr
+
+    requests = collections.OrderedDict()
+    caches = collections.OrderedDict()
+    for r in records:
+        if r['type'] == 'cache':
+            hits = caches.setdefault(r['cache'], [0, 0])
+            hits[0 if r['hit'] else 1] += 1
+            continue
+
+        stats = requests.setdefault(r['method'], {
+            'calls': 0, 'retries': 0, 'errors': 0, 'total': 0.0, 'max': 0.0,
+            'bytes': 0})
+        stats['calls'] += 1
+        stats['retries'] += r['retry']
+        stats['errors'] += r['status'] is None or r['status'] >= 300
+        stats['total'] += r['latency']
+        stats['max'] = max(stats['max'], r['latency'])
+        stats['bytes'] += r['response_bytes']
+
+    row = '{0:<28} {1:>6} {2:>7} {3:>6} {4:>10} {5:>8} {6:>10}'
+    print(row.format('Method', 'Calls', 'Retries', 'Errors', 'Total ms',
+                     'Max ms', 'Bytes'), file=file)
+    total = {'calls': 0, 'total': 0.0, 'bytes': 0}
+    for method, stats in requests.items():
+        print(row.format(method, stats['calls'], stats['retries'],
+                         stats['errors'],
+                         '{0:.1f}'.format(stats['total'] * 1000),
+                         '{0:.1f}'.format(stats['max'] * 1000),
+                         stats['bytes']), file=file)
+        for key in total:
+            total[key] += stats[key]
+    print(row.format('Total', total['calls'], '', '',
+                     '{0:.1f}'.format(total['total'] * 1000), '',
+                     total['bytes']), file=file)
+
+    for name, (hits, misses) in caches.items():
+        print('Cache {0}: {1} hits, {2} misses'.format(name, hits, misses),
+              file=file)
+
+
+def write_records(records, trace_file):
+    """
+    Append records to trace file as JSON lines.
+    """
+
+    with open(trace_file, 'a') as f:
+        for r in records:
+            f.write(json.dumps(r) + '\n')
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+
+"""
+Export all task lists and tasks as JSON lines and import them into an
+account.
+"""
+
+import os
+import sys
+import io
+import gzip
+import json
+import contextlib
+import collections
+
+from . import api
+from . import batch
+from . import tasklists
+
+from googleapiclient.errors import HttpError
+
+DATA_DIR = os.path.expanduser('~/.local/share/taskstodo')
+STATE_FILE = os.path.join(DATA_DIR, 'import.state')
+
+GZIP_MAGIC = b'\x1f\x8b'
+
+# Fields of task items that are set when tasks are created
+TASK_BODY_FIELDS = ['title', 'notes', 'status', 'due', 'completed']
+
+
+@contextlib.contextmanager
+def open_export(path, mode, compress=False):
+    """
+    Open export file, or stdin or stdout if path is -, as text stream.
+
+    Written exports are compressed with gzip if requested or the file name
+    ends with .gz, and compressed exports are detected when read.
+    """
+
+    if path == '-':
+        raw = sys.stdin.buffer if mode == 'r' else sys.stdout.buffer
+    else:
+        raw = open(path, mode + 'b')
+
+    try:
+        if mode == 'r':
+            compress = raw.peek(2)[:2] == GZIP_MAGIC
+        else:
+            compress = compress or path.endswith('.gz')
+        stream = gzip.GzipFile(fileobj=raw, mode=mode + 'b') if compress \
+            else raw
+
+        text = io.TextIOWrapper(stream, encoding='utf-8')
+        try:
+            yield text
+        finally:
+            if mode == 'w':
+                text.flush()
+            # Leave closing of underlying streams to this function
+            text.detach()
+            if compress:
+                stream.close()
+    finally:
+        if path == '-':
+            if mode == 'w':
+                raw.flush()
+        else:
+            raw.close()
+
+
+def export_tasks(creds, path, compress, verbose):
+    """
+    Write all task lists and their tasks, including hidden tasks, as JSON
+    lines.
+
+    Every task list is followed by its tasks, which are written one page at a
+    time as they are received.
+    """
+
+    service = api.build_service(creds)
+    num_lists = 0
+    num_tasks = 0
+    try:
+        with open_export(path, 'w', compress) as f:
+            for tasklist_item in tasklists.list_tasklists(service):
+                f.write(json.dumps(tasklist_item) + '\n')
+                num_lists += 1
+                for task_item in tasklists.list_tasks(
+                        service, tasklist_item['id'], show_hidden=True):
+                    task_item['tasklist'] = tasklist_item['id']
+                    f.write(json.dumps(task_item) + '\n')
+                    num_tasks += 1
+    except HttpError as err:
+        if verbose:
+            print(err, file=sys.stderr)
+        else:
+            print(err._get_reason(), file=sys.stderr)
+        return
+
+    if verbose:
+        print('Exported {0} task lists and {1} tasks.'.format(
+            num_lists, num_tasks), file=sys.stderr)
+
+
+def read_export(f):
+    """
+    Read task lists from export one at a time.
+
+    Yield tuples of task list item and list of its task items.
+    """
+
+    tasklist_item = None
+    task_items = []
+    for line in f:
+        if not line.strip():
+            continue
+        item = json.loads(line)
+        if 'tasklist' in item:
+            task_items.append(item)
+            continue
+        if tasklist_item is not None:
+            yield tasklist_item, task_items
+        tasklist_item = item
+        task_items = []
+
+    if tasklist_item is not None:
+        yield tasklist_item, task_items
+
+
+def load_import_state(state_file, source):
+    """
+    Load progress of interrupted import of source.
+
+    Return tuple of dictionary of created IDs by exported ID and set of IDs
+    of exported task lists that were completely imported.
+    """
+
+    ids = {}
+    done = set()
+    try:
+        with open(state_file, 'r') as f:
+            header = f.readline()
+            if not header or json.loads(header)['source'] != source:
+                return ids, done
+            for line in f:
+                fields = line.split()
+                # Last line may be cut off if import was interrupted
+                if len(fields) != 2:
+                    continue
+                if fields[0] == 'done':
+                    done.add(fields[1])
+                else:
+                    ids[fields[0]] = fields[1]
+    except FileNotFoundError:
+        pass
+
+    return ids, done
+
+
+def get_task_order(task_items):
+    """
+    Group task items by parent and sort them by position.
+
+    Return dictionary of lists of task items by parent ID, where top level
+    tasks have parent None.
+    """
+
+    task_ids = {item['id'] for item in task_items}
+    children = collections.defaultdict(list)
+    for item in task_items:
+        parent = item.get('parent')
+        children[parent if parent in task_ids else None].append(item)
+
+    for siblings in children.values():
+        siblings.sort(key=lambda item: item['position'])
+
+    return children
+
+
+def import_tasklist(service, tasklist_item, task_items, ids, state):
+    """
+    Create task list and its tasks in order, skipping those created before.
+
+    Tasks are inserted in batch requests, each placed after the previous
+    task that already exists, and tasks out of order are moved afterwards.
+
+    Return number of moved tasks, or None if import failed.
+    """
+
+    new_list_id = ids.get(tasklist_item['id'])
+    if new_list_id is None:
+        result = service.tasklists().insert(
+                body={'title': tasklist_item['title']}).execute()
+        new_list_id = result['id']
+        ids[tasklist_item['id']] = new_list_id
+        state.write('{0} {1}\n'.format(tasklist_item['id'], new_list_id))
+        state.flush()
+
+    # Parents come before their children, and siblings are in order
+    children = get_task_order(task_items)
+    ordered = []
+    stack = list(reversed(children[None]))
+    while stack:
+        item = stack.pop()
+        ordered.append(item)
+        stack.extend(reversed(children.get(item['id'], [])))
+
+    previous = {}
+    for siblings in children.values():
+        for i in range(1, len(siblings)):
+            previous[siblings[i]['id']] = siblings[i - 1]['id']
+
+    errors = []
+
+    def callback(request_id, response, err):
+        if err:
+            errors.append(err)
+            return
+        ids[request_id] = response['id']
+        state.write('{0} {1}\n'.format(request_id, response['id']))
+
+    pending = [item for item in ordered if item['id'] not in ids]
+    start = 0
+    while start < len(pending):
+        # Batch ends before children of tasks created in the same batch
+        chunk = []
+        chunk_ids = set()
+        for item in pending[start:start + batch.BATCH_SIZE]:
+            if item.get('parent') in chunk_ids:
+                break
+            chunk.append(item)
+            chunk_ids.add(item['id'])
+        start += len(chunk)
+
+        # Tasks placed after the same existing task are inserted in reverse
+        # so each one pushes down the ones after it
+        request = service.new_batch_http_request(callback=callback)
+        for item in reversed(chunk):
+            anchor = previous.get(item['id'])
+            while anchor in chunk_ids:
+                anchor = previous.get(anchor)
+            body = {f: item[f] for f in TASK_BODY_FIELDS if f in item}
+            request.add(service.tasks().insert(
+                tasklist=new_list_id, body=body,
+                parent=ids.get(item.get('parent')),
+                previous=ids.get(anchor)), request_id=item['id'])
+        request.execute()
+
+        state.flush()
+        os.fsync(state.fileno())
+        if errors:
+            print(errors[0]._get_reason(), file=sys.stderr)
+            return None
+
+    # Check order on server, which may run batched requests in any order
+    server_items = list(tasklists.list_tasks(service, new_list_id,
+                                             show_hidden=True))
+    server_order = get_task_order(server_items)
+    moved = 0
+    for parent, siblings in children.items():
+        expected = [ids[item['id']] for item in siblings]
+        actual = [item['id'] for item in server_order.get(ids.get(parent),
+                                                          [])]
+        for i, task_id in enumerate(expected):
+            if i < len(actual) and actual[i] == task_id:
+                continue
+            service.tasks().move(
+                tasklist=new_list_id, task=task_id,
+                parent=ids.get(parent),
+                previous=expected[i - 1] if i else None).execute()
+            if task_id in actual:
+                actual.remove(task_id)
+            actual.insert(i, task_id)
+            moved += 1
+
+    state.write('done {0}\n'.format(tasklist_item['id']))
+    state.flush()
+    os.fsync(state.fileno())
+
+    return moved
+
+
+def import_tasks(creds, path, verbose, state_file=None):
+    """
+    Create task lists and tasks read from export.
+
+    Created IDs are recorded as they are received, so an interrupted import
+    resumes where it stopped when run again with the same file. Only one
+    task list is kept in memory at a time.
+    """
+
+    if state_file is None:
+        state_file = STATE_FILE
+
+    if not os.path.exists(DATA_DIR):
+        os.makedirs(DATA_DIR)
+
+    source = path if path == '-' else os.path.abspath(path)
+    ids, done = load_import_state(state_file, source)
+    if ids and verbose:
+        print('Resuming import, {0} task lists and tasks were created.'
+              .format(len(ids)), file=sys.stderr)
+
+    mode = 'a' if ids or done else 'w'
+    service = api.build_service(creds)
+    num_lists = 0
+    num_tasks = 0
+    completed = False
+    with open(state_file, mode) as state:
+        if mode == 'w':
+            state.write(json.dumps({'source': source}) + '\n')
+
+        try:
+            with open_export(path, 'r') as f:
+                for tasklist_item, task_items in read_export(f):
+                    if tasklist_item['id'] in done:
+                        continue
+                    moved = import_tasklist(service, tasklist_item,
+                                            task_items, ids, state)
+                    if moved is None:
+                        break
+                    num_lists += 1
+                    num_tasks += len(task_items)
+                    if verbose:
+                        print('Imported {0} ({1} tasks, {2} moved).'.format(
+                            tasklist_item['title'], len(task_items), moved),
+                            file=sys.stderr)
+                else:
+                    completed = True
+        except HttpError as err:
+            if verbose:
+                print(err, file=sys.stderr)
+            else:
+                print(err._get_reason(), file=sys.stderr)
+        finally:
+            if num_lists or ids:
+                # Update cache file
+                tasklists.refresh_tasklist_cache(creds)
+
+    if not completed:
+        print('Import was not completed, run again to resume.',
+              file=sys.stderr)
+        return
+
+    os.remove(state_file)
+    if verbose:
+        print('Imported {0} task lists and {1} tasks.'.format(
+            num_lists, num_tasks), file=sys.stderr)
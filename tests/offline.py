@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+
+"""
+Base class of tests that run against the in-memory backend instead of
+Google, with task list cache in a temporary directory.
+"""
+
+import unittest
+import os
+import tempfile
+
+from taskstodo import api
+from taskstodo import memory
+from taskstodo import tasklists
+
+from unittest import mock
+
+
+class OfflineTestCase(unittest.TestCase):
+    """Test with in-memory backend and empty temporary directory."""
+
+    def setUp(self):
+        """Setup test environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.t_data_dir = os.path.join(self.tmp_dir.name, 'taskstodo')
+        self.start_patches([
+            mock.patch.dict(os.environ, {'TASKSTODO_BACKEND': 'memory'}),
+            mock.patch.object(tasklists, 'DATA_DIR', self.t_data_dir),
+            mock.patch.object(tasklists, 'CACHE_FILE', os.path.join(
+                self.t_data_dir, 'tasklists.json')),
+            mock.patch.object(tasklists, '_loaded_cache', None),
+        ])
+
+        self.store = memory.get_store()
+        self.store.reset()
+        self.service = api.build_service(None)
+
+    def start_patches(self, patches):
+        """Start patches, which are stopped once test is done."""
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def add_tasklist(self, title='test list'):
+        """Create task list on server and return its ID."""
+        return self.service.tasklists().insert(
+            body={'title': title}).execute()['id']
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import contextlib
+
+from taskstodo import accounts
+from taskstodo import engine
+from taskstodo import outbox
+from taskstodo import search
+from taskstodo import tasklists
+from taskstodo import taskstodo
+from taskstodo import transfer
+
+import offline
+
+from io import StringIO
+from unittest import mock
+
+
+class TestAccountsFunctions(offline.OfflineTestCase):
+    """Test accounts and their syncs with in-memory backend."""
+
+    def setUp(self):
+        """Setup test environment."""
+        super().setUp()
+        self.start_patches([
+            mock.patch.object(accounts, 'CFG_DIR', os.path.join(
+                self.tmp_dir.name, 'config')),
+            mock.patch.object(accounts, 'DATA_DIR', self.t_data_dir),
+            mock.patch.object(accounts, '_account', None),
+        ])
+        # Restore paths changed by switching accounts
+        for module, names in [
+                (tasklists, ['DATA_DIR', 'CACHE_FILE']),
+                (search, ['DATA_DIR', 'CACHE_FILE', 'INDEX_FILE']),
+                (transfer, ['DATA_DIR', 'STATE_FILE']),
+                (outbox, ['DATA_DIR', 'OUTBOX_FILE', 'LOG_FILE']),
+                (engine, ['TASKSTODO_DIR'])]:
+            self.start_patches([mock.patch.object(module, name,
+                                                  getattr(module, name))
+                                for name in names])
+
+        self.add_tasklist()
+
+    def write_todo(self, account, content):
+        c_data_dir = os.path.join(self.tmp_dir.name, 'calcurse', account)
+        os.makedirs(c_data_dir)
+        with open(os.path.join(c_data_dir, 'todo'), 'w') as f:
+            f.write(content)
+
+    def read_todo(self, account):
+        with open(os.path.join(self.tmp_dir.name, 'calcurse', account,
+                               'todo')) as f:
+            return f.read()
+
+    def test_use_account(self):
+        """Keep cache and sync state of accounts in own directories."""
+        accounts.use_account('work')
+        work_dir = os.path.join(self.t_data_dir, 'accounts', 'work')
+        self.assertEqual(os.path.join(work_dir, 'tasklists.json'),
+                         tasklists.CACHE_FILE)
+        self.assertEqual(os.path.join(work_dir, 'outbox.jsonl'),
+                         outbox.OUTBOX_FILE)
+        self.assertEqual(work_dir, engine.TASKSTODO_DIR)
+
+        accounts.use_account(None)
+        self.assertEqual(os.path.join(self.t_data_dir, 'search.db'),
+                         search.INDEX_FILE)
+
+        for account in ['../work', '.work', 'work/home', '']:
+            with self.assertRaises(ValueError):
+                accounts.get_dirs(account)
+
+    def test_batch_account(self):
+        """Run commands of batch with its account only."""
+        batch_file = os.path.join(self.tmp_dir.name, 'batch')
+        with open(batch_file, 'w') as f:
+            f.write("task -c 'new task' 'test list'\nshow-lists\n")
+        with contextlib.redirect_stdout(StringIO()):
+            taskstodo.run_command(taskstodo.parse_args(
+                ['--account', 'work', 'batch', batch_file]))
+        self.assertEqual('work', accounts.get_account())
+        self.assertTrue(os.path.exists(os.path.join(
+            self.t_data_dir, 'accounts', 'work', 'tasklists.json')))
+        self.assertFalse(os.path.exists(os.path.join(
+            self.t_data_dir, 'tasklists.json')))
+
+        with open(batch_file, 'w') as f:
+            f.write("--account home task -c 'new task' 'test list'\n")
+        with contextlib.redirect_stderr(StringIO()) as stderr, \
+                self.assertRaises(SystemExit):
+            taskstodo.run_command(taskstodo.parse_args(['batch',
+                                                        batch_file]))
+        self.assertIn('Global options', stderr.getvalue())
+
+    def test_group_jobs(self):
+        """Run jobs sharing account or calcurse directory in sequence."""
+        jobs = [accounts.get_sync_argv(spec, '/calcurse/{account}')
+                for spec in ['work:list 1', 'home:list', 'work:list 2']]
+        jobs.append(accounts.get_sync_argv('other:list'))
+        jobs.append(accounts.get_sync_argv('list'))
+        self.assertEqual(['--account', 'work', 'sync-calcurse', 'list 1',
+                          '--calcurse-dir', '/calcurse/work'], jobs[0])
+        self.assertEqual([[0, 2], [1], [3, 4]], accounts.group_jobs(jobs))
+
+    def test_sync_all(self):
+        """Sync task list with calcurse of each account."""
+        self.write_todo('work', '[0] work task\n')
+        self.write_todo('home', '[0] home task\n')
+        jobs = [accounts.get_sync_argv(spec, os.path.join(
+                    self.tmp_dir.name, 'calcurse', '{account}'))
+                for spec in ['work:test list', 'home:test list']]
+
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            self.assertTrue(accounts.sync_all(jobs, 1))
+        self.assertIn('==> --account home sync-calcurse test list',
+                      stdout.getvalue())
+
+        g_titles = sorted(t.title for t in engine.get_google_tasks(
+            None, 'test list', None))
+        self.assertEqual(['home task', 'work task'], g_titles)
+        # Home account had not synced task of work account before
+        self.assertEqual('[0] home task\n[0] work task\n',
+                         self.read_todo('home'))
+        for account in ['work', 'home']:
+            self.assertTrue(os.path.exists(os.path.join(
+                self.t_data_dir, 'accounts', account, 'calcurse-sync.state')))
+
+
+if __name__ == '__main__':
+    unittest.main()
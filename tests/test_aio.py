@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+import unittest
+import asyncio
+import contextlib
+
+from taskstodo import aio
+from taskstodo import api
+from taskstodo import engine
+from taskstodo import models
+from taskstodo import tasklists
+
+import offline
+
+from io import StringIO
+from googleapiclient.errors import HttpError
+
+
+class TestAsyncClient(offline.OfflineTestCase):
+    """Test concurrent API requests with in-memory backend."""
+
+    def test_cache_all_tasklists(self):
+        """Get tasks of all task lists in order."""
+        with self.store.lock:
+            for i in range(5):
+                tasklist = self.store.add_tasklist('list {0}'.format(i))
+                for j in reversed(range(150)):
+                    self.store.add_task(tasklist['id'],
+                                        {'title': 'task {0}'.format(j)})
+
+        cache = tasklists.create_tasklist_cache(None)
+        self.assertEqual(['list {0}'.format(i) for i in range(5)],
+                         [tasklist['title'] for tasklist in cache])
+        self.assertEqual(['task {0}'.format(j) for j in range(150)],
+                         [task['title'] for task in cache[4]['tasks']])
+
+    def test_cancel_on_error(self):
+        """Cancel remaining requests after one fails."""
+        client = aio.Client(None)
+
+        async def run():
+            started = []
+
+            async def get(tasklist_id):
+                started.append(tasklist_id)
+                return await client.execute(
+                    lambda service: service.tasklists().get(
+                        tasklist=tasklist_id))
+
+            async def wait():
+                await asyncio.sleep(10)
+                started.append('waited')
+
+            with self.assertRaises(HttpError):
+                await aio.gather(get('missing'), wait())
+            return started
+
+        self.assertEqual(['missing'], aio.run(run()))
+
+    def test_add_google_tasks(self):
+        """Add tasks concurrently in order above existing tasks."""
+        service = api.build_service(None)
+        tasklist = service.tasklists().insert(
+            body={'title': 'test list'}).execute()
+        service.tasks().insert(tasklist=tasklist['id'],
+                               body={'title': 'old task'}).execute()
+
+        new_tasks = [models.Task('new task {0}'.format(i)) for i in range(20)]
+        done = []
+        with contextlib.redirect_stdout(StringIO()):
+            tasklists.create_tasklist_cache(None)
+            engine.add_google_tasks(None, 'test list', None, new_tasks,
+                                    done.append)
+
+        self.assertEqual(list(range(20)), sorted(done))
+        titles = [t.title for t in
+                  tasklists.get_tasklist(None, 'test list', None).tasks]
+        self.assertEqual([t.title for t in new_tasks] + ['old task'],
+                         titles)
+        cached = tasklists.load_tasklist_cache()[0]['tasks']
+        self.assertEqual(titles, [t['title'] for t in cached])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -5,13 +5,22 @@ import os
 import sys
 import hashlib
 import shutil
+import tempfile
 import time
+import contextlib
 
 from taskstodo import tasklists
 from taskstodo import tasks
 from taskstodo import calcurse
+from taskstodo import engine
+from taskstodo import models
+from taskstodo import sync
+from taskstodo import taskstodo
+
+import offline
 
 from io import StringIO
+from unittest import mock
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
@@ -85,94 +94,107 @@ class TestCalcurseFunctions(unittest.TestCase):
     def test_get_calcurse_tasks(self):
         """Get tasks from calcurse."""
         calcurse_tasks = calcurse.get_calcurse_tasks(CALCURSE_DIR)
-        calcurse_task = {'title': 'test task 1'}
+        calcurse_task = models.Task('test task 1')
         self.assertIn(calcurse_task, calcurse_tasks)
-        self.assertEqual('test note', calcurse_tasks[2]['note'])
+        self.assertEqual('test note', calcurse_tasks[2].note)
 
     def test_add_calcurse_tasks(self):
         """Add tasks to calcurse."""
         task_note = 'test note'
-        new_task = [{'title': 'test task 4', 'note': task_note}]
+        new_task = [models.Task('test task 4', task_note)]
         calcurse.add_calcurse_tasks(new_task, CALCURSE_DIR)
 
         calcurse_tasks = calcurse.get_calcurse_tasks(CALCURSE_DIR)
         self.assertIn(new_task[0], calcurse_tasks)
-        self.assertEqual(task_note, calcurse_tasks[3]['note'])
+        self.assertEqual(task_note, calcurse_tasks[3].note)
 
     def test_delete_calcurse_tasks(self):
         """Delete tasks from calcurse."""
-        old_task = [{'title': 'test task 2'}]
+        old_task = [models.Task('test task 2')]
         calcurse.delete_calcurse_tasks(old_task, CALCURSE_DIR)
 
         calcurse_tasks = calcurse.get_calcurse_tasks(CALCURSE_DIR)
         self.assertNotIn(old_task[0], calcurse_tasks)
 
+    def test_delete_unused_notes(self):
+        """Delete calcurse notes no longer used by tasks."""
+        notes_dir = os.path.join(CALCURSE_DIR, 'notes')
+        unused_hash = hashlib.sha1(b'unused note').hexdigest()
+        with open(os.path.join(notes_dir, unused_hash), 'w') as f:
+            f.write('unused note\n')
+
+        calcurse.delete_unused_notes(CALCURSE_DIR)
+
+        self.assertNotIn(unused_hash, os.listdir(notes_dir))
+        self.assertEqual('test note', calcurse.get_calcurse_tasks(
+            CALCURSE_DIR)[2].note)
+
     def test_get_google_tasks(self):
         """Get tasks from Google."""
-        google_tasks = calcurse.get_google_tasks(self.creds, self.list_title,
-                                                 None)
+        google_tasks = [t.content() for t in engine.get_google_tasks(
+            self.creds, self.list_title, None)]
         google_task = {'title': 'test task 0', 'note': 'test note'}
         self.assertIn(google_task, google_tasks)
 
     def test_add_google_tasks(self):
         """Add tasks to Google."""
 
-        new_task_1 = {'title': 'test task 5'}
-        new_task_2 = {'title': 'test task 6', 'note': 'test note'}
+        new_task_1 = models.Task('test task 5')
+        new_task_2 = models.Task('test task 6', 'test note')
         new_tasks = [new_task_1, new_task_2]
 
-        calcurse.add_google_tasks(self.creds, self.list_title, None, new_tasks)
+        engine.add_google_tasks(self.creds, self.list_title, None, new_tasks)
         time.sleep(2)
         self.assertIn(new_task_1, new_tasks)
         self.assertIn(new_task_2, new_tasks)
 
     def test_delete_google_tasks(self):
         """Delete tasks from Google."""
-        old_task = [{'title': 'test task 0'}]
-        calcurse.delete_google_tasks(self.creds, self.list_title, old_task)
+        old_task = [models.Task('test task 0')]
+        engine.delete_google_tasks(self.creds, self.list_title, old_task)
 
-        google_tasks = calcurse.get_google_tasks(self.creds, self.list_title,
-                                                 None)
-        self.assertNotIn(old_task[0], google_tasks)
+        google_tasks = [t.content() for t in engine.get_google_tasks(
+            self.creds, self.list_title, None)]
+        self.assertNotIn(old_task[0].content(), google_tasks)
 
     def test_sync_tasks(self):
         """Sync Google and calcurse tasks."""
 
-        new_g_task = [{'title': 'google task'}]
-        new_c_task = [{'title': 'calcurse task'}]
+        new_g_task = [models.Task('google task')]
+        new_c_task = [models.Task('calcurse task')]
 
         # Test syncing added tasks
         calcurse.add_calcurse_tasks(new_c_task, CALCURSE_DIR)
-        calcurse.add_google_tasks(self.creds, self.list_title, None,
-                                  new_g_task)
+        engine.add_google_tasks(self.creds, self.list_title, None,
+                                new_g_task)
         time.sleep(2)
         calcurse.sync_tasks(self.creds, self.list_title, None, False,
                             TASKSTODO_DIR, CALCURSE_DIR)
         time.sleep(2)
-        google_tasks = calcurse.get_google_tasks(self.creds, self.list_title,
-                                                 None)
+        google_tasks = [t.content() for t in engine.get_google_tasks(
+            self.creds, self.list_title, None)]
         time.sleep(2)
         calcurse_tasks = calcurse.get_calcurse_tasks(CALCURSE_DIR)
         self.assertIn(new_g_task[0], calcurse_tasks)
-        self.assertIn(new_g_task[0], google_tasks)
+        self.assertIn(new_g_task[0].content(), google_tasks)
         self.assertIn(new_c_task[0], calcurse_tasks)
-        self.assertIn(new_c_task[0], google_tasks)
+        self.assertIn(new_c_task[0].content(), google_tasks)
 
         # Test syncing deleted tasks
         calcurse.delete_calcurse_tasks(new_c_task, CALCURSE_DIR)
-        calcurse.delete_google_tasks(self.creds, self.list_title, new_g_task)
+        engine.delete_google_tasks(self.creds, self.list_title, new_g_task)
         time.sleep(2)
         calcurse.sync_tasks(self.creds, self.list_title, None, False,
                             TASKSTODO_DIR, CALCURSE_DIR)
         time.sleep(2)
-        google_tasks = calcurse.get_google_tasks(self.creds, self.list_title,
-                                                 None)
+        google_tasks = [t.content() for t in engine.get_google_tasks(
+            self.creds, self.list_title, None)]
         time.sleep(2)
         calcurse_tasks = calcurse.get_calcurse_tasks(CALCURSE_DIR)
         self.assertNotIn(new_g_task[0], calcurse_tasks)
-        self.assertNotIn(new_g_task[0], google_tasks)
+        self.assertNotIn(new_g_task[0].content(), google_tasks)
         self.assertNotIn(new_c_task[0], calcurse_tasks)
-        self.assertNotIn(new_c_task[0], google_tasks)
+        self.assertNotIn(new_c_task[0].content(), google_tasks)
 
     def tearDown(self):
         """Cleanup test environment."""
@@ -192,5 +214,210 @@ class TestCalcurseFunctions(unittest.TestCase):
         shutil.rmtree(TEMP_DIR)
 
 
+class TestCalcurseFiles(unittest.TestCase):
+    """Test calcurse functions that do not access the server."""
+
+    def setUp(self):
+        """Setup test environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.c_data_dir = self.tmp_dir.name
+        os.mkdir(os.path.join(self.c_data_dir, 'notes'))
+        with open(os.path.join(self.c_data_dir, 'todo'), 'w') as f:
+            f.write('[0] test task 1\n[0] test task 2\n')
+
+    def test_update_calcurse_tasks(self):
+        """Delete and add calcurse tasks together."""
+        old_task = [models.Task('test task 1')]
+        new_task = [models.Task('test task 4')]
+        calcurse.update_calcurse_tasks(old_task, new_task, self.c_data_dir)
+
+        calcurse_tasks = calcurse.get_calcurse_tasks(self.c_data_dir)
+        self.assertNotIn(old_task[0], calcurse_tasks)
+        self.assertIn(new_task[0], calcurse_tasks)
+        self.assertFalse(os.path.exists(os.path.join(self.c_data_dir,
+                                                     'todo.tmp')))
+
+    def test_gc_command(self):
+        """Delete unused notes of given calcurse directory."""
+        notes_dir = os.path.join(self.c_data_dir, 'notes')
+        unused_hash = hashlib.sha1(b'unused note').hexdigest()
+        with open(os.path.join(notes_dir, unused_hash), 'w') as f:
+            f.write('unused note\n')
+
+        taskstodo.collect_garbage(taskstodo.parse_args(
+            ['gc', '--calcurse-dir', self.c_data_dir]))
+        self.assertEqual([], os.listdir(notes_dir))
+
+    def test_plan_sync(self):
+        """Plan sync without changing tasks."""
+        g_tasks = [models.Task('google task'), models.Task('synced task')]
+        c_tasks = [models.Task('calcurse task')]
+        synced = {sync.fingerprint(models.Task('synced task'))}
+
+        ops, state = engine.plan_sync(g_tasks, c_tasks, synced)
+        self.assertEqual([['delete_google', g_tasks[1]],
+                          ['add_local', g_tasks[0]],
+                          ['add_google', c_tasks[0]]], ops)
+
+        cost = engine.estimate_sync_cost(ops)
+        self.assertEqual(2 + 2 + 1 + 2, cost['requests'])
+        self.assertEqual({'requests', 'file_writes', 'quota'}, set(cost))
+
+
+class TestStatusSync(offline.OfflineTestCase):
+    """Test syncs of tasks and their status with in-memory backend."""
+
+    def setUp(self):
+        """Setup test environment."""
+        super().setUp()
+        self.c_data_dir = os.path.join(self.tmp_dir.name, 'calcurse')
+        os.makedirs(os.path.join(self.c_data_dir, 'notes'))
+        self.tasklist_id = self.add_tasklist()
+        self.task_id = self.service.tasks().insert(
+            tasklist=self.tasklist_id, body={'title': 'task'}).execute()['id']
+
+    def write_todo(self, content):
+        with open(os.path.join(self.c_data_dir, 'todo'), 'w') as f:
+            f.write(content)
+
+    def read_todo(self):
+        with open(os.path.join(self.c_data_dir, 'todo')) as f:
+            return f.read()
+
+    def sync(self):
+        with contextlib.redirect_stdout(StringIO()):
+            calcurse.sync_tasks(None, 'test list', None, False,
+                                self.t_data_dir, self.c_data_dir)
+
+    def get_status(self):
+        return self.service.tasks().get(tasklist=self.tasklist_id,
+                                        task=self.task_id).execute()['status']
+
+    def test_get_completed_tasks(self):
+        """Read completed calcurse tasks by negative priority."""
+        self.write_todo('[-3] done task\n[2] open task\n')
+        self.assertEqual([models.Task('done task', completed=True),
+                          models.Task('open task')],
+                         calcurse.get_calcurse_tasks(self.c_data_dir))
+
+    def test_status_priority(self):
+        """Keep priority of tasks completed and reopened in calcurse."""
+        for line in ['[0] task\n', '[3] task\n', '[0]>{0} task\n'.format(
+                '0' * 40)]:
+            completed = calcurse.set_completed(line, True)
+            self.assertTrue(completed.startswith('[-'))
+            self.assertEqual(completed, calcurse.set_completed(completed,
+                                                               True))
+            self.assertEqual(line, calcurse.set_completed(completed, False))
+
+    def test_update_status_by_note(self):
+        """Only change status of task with same title and note."""
+        tasks = [models.Task('task', 'note 1'), models.Task('task', 'note 2')]
+        self.write_todo('')
+        calcurse.add_calcurse_tasks(tasks, self.c_data_dir)
+        calcurse.update_calcurse_tasks(
+            [], [], self.c_data_dir, [tasks[1].replace(completed=True)])
+        self.assertEqual([tasks[0], tasks[1].replace(completed=True)],
+                         calcurse.get_calcurse_tasks(self.c_data_dir))
+
+    def test_plan_status(self):
+        """Change status on side that did not change since last sync."""
+        g_tasks = [models.Task('task 1', completed=True),
+                   models.Task('task 2')]
+        c_tasks = [models.Task('task 1'),
+                   models.Task('task 2', completed=True)]
+        synced = {sync.fingerprint(t) for t in c_tasks}
+        synced.add(sync.completion_fingerprint(c_tasks[1]))
+
+        ops, state = engine.plan_sync(g_tasks, c_tasks, synced)
+        self.assertEqual([['status_local', c_tasks[0].replace(
+                              completed=True)],
+                          ['status_local', c_tasks[1].replace(
+                              completed=False)]], ops)
+        self.assertEqual({'add': [sync.completion_fingerprint(c_tasks[0])],
+                          'remove': [sync.completion_fingerprint(
+                              c_tasks[1])]}, state)
+
+    def test_sync_status(self):
+        """Complete and reopen tasks without deleting them."""
+        self.write_todo('[3] task\n')
+        self.sync()
+
+        self.service.tasks().patch(tasklist=self.tasklist_id,
+                                   task=self.task_id,
+                                   body={'status': 'completed'}).execute()
+        self.sync()
+        self.assertEqual('[-3] task\n', self.read_todo())
+
+        self.write_todo('[3] task\n')
+        self.sync()
+        self.assertEqual('needsAction', self.get_status())
+
+        self.write_todo('[-3] task\n')
+        self.sync()
+        self.assertEqual('completed', self.get_status())
+
+        # Completed tasks cleared from Google are kept in calcurse
+        self.service.tasks().clear(tasklist=self.tasklist_id).execute()
+        self.sync()
+        self.assertEqual('[-3] task\n', self.read_todo())
+        self.assertEqual([self.task_id], [
+            t['id'] for t in self.service.tasks().list(
+                tasklist=self.tasklist_id, showHidden=True).execute()[
+                    'items']])
+
+    def test_sync_new_completed(self):
+        """Add task completed before it was synced as completed task."""
+        self.write_todo('[-3] done locally\n')
+        self.sync()
+        self.sync()
+        self.assertIn('[-3] done locally\n', self.read_todo())
+        statuses = {item['title']: item['status'] for item in
+                    self.service.tasks().list(tasklist=self.tasklist_id,
+                                              showHidden=True).execute()[
+                                                  'items']}
+        self.assertEqual('completed', statuses['done locally'])
+
+    def test_resume_sync(self):
+        """Resume interrupted sync from journal."""
+        self.write_todo('')
+        journal_file = os.path.join(self.t_data_dir, 'calcurse-sync.journal')
+        os.makedirs(self.t_data_dir)
+        new_c_task = models.Task('journal task 1')
+        new_g_task = models.Task('journal task 2')
+        sync.create_journal(journal_file,
+                            [['add_calcurse', new_c_task.content()],
+                             ['add_google', new_g_task.content()]])
+        sync.mark_done(journal_file, 0)
+
+        self.sync()
+        google_tasks = [t.content() for t in engine.get_google_tasks(
+            None, 'test list', None)]
+        calcurse_tasks = calcurse.get_calcurse_tasks(self.c_data_dir)
+        self.assertNotIn(new_c_task, calcurse_tasks)
+        self.assertIn(new_g_task.content(), google_tasks)
+        self.assertFalse(os.path.exists(journal_file))
+
+    def test_sync_hidden_completed(self):
+        """Complete tasks that Google hid once completed."""
+        self.write_todo('[3] task\n')
+        self.sync()
+
+        self.service.tasks().patch(tasklist=self.tasklist_id,
+                                   task=self.task_id,
+                                   body={'status': 'completed'}).execute()
+        self.assertEqual([], self.service.tasks().list(
+            tasklist=self.tasklist_id).execute()['items'])
+        self.sync()
+        self.assertEqual('[-3] task\n', self.read_todo())
+        self.assertEqual('completed', self.get_status())
+
+        # Task is kept once it is no longer read as recently completed
+        with mock.patch.object(engine, 'SYNC_TIME_MARGIN', -3600):
+            self.sync()
+        self.assertEqual('[-3] task\n', self.read_todo())
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import contextlib
+
+from taskstodo import calcurse
+from taskstodo import engine
+from taskstodo import models
+from taskstodo import sync
+from taskstodo import tasklists
+
+import offline
+
+from io import StringIO
+from unittest import mock
+
+
+class ListAdapter(sync.SyncAdapter):
+    """
+    Adapter of tasks kept in a list.
+    """
+
+    name = 'list'
+
+    def __init__(self, tasks):
+        super().__init__()
+        self.tasks = list(tasks)
+        self.writes = 0
+
+    def read_tasks(self):
+        return list(self.tasks)
+
+    def apply_changes(self, old_tasks, new_tasks, status_tasks):
+        old_titles = {t.title for t in old_tasks}
+        statuses = {t.title: t.completed for t in status_tasks}
+        self.tasks = [t.replace(completed=statuses.get(t.title, t.completed))
+                      for t in self.tasks if t.title not in old_titles]
+        self.tasks.extend(new_tasks)
+        self.writes += 1
+
+
+class TestEngineFunctions(offline.OfflineTestCase):
+    """Test sync engine with in-memory backend."""
+
+    def setUp(self):
+        """Setup test environment."""
+        super().setUp()
+        self.tasklist_id = self.add_tasklist()
+        self.service.tasks().insert(tasklist=self.tasklist_id,
+                                    body={'title': 'google task'}).execute()
+
+    def sync(self, adapter):
+        with contextlib.redirect_stdout(StringIO()):
+            engine.sync_tasks(None, 'test list', None, False, adapter,
+                              self.t_data_dir)
+
+    def get_google_titles(self):
+        return sorted(t.title for t in engine.get_google_tasks(
+            None, 'test list', None))
+
+    def test_sync_adapter(self):
+        """Sync tasks of any adapter with a single write per sync."""
+        adapter = ListAdapter([models.Task('local task')])
+        self.sync(adapter)
+        self.assertEqual(['google task', 'local task'],
+                         sorted(t.title for t in adapter.tasks))
+        self.assertEqual(['google task', 'local task'],
+                         self.get_google_titles())
+        self.assertEqual(1, adapter.writes)
+        self.assertTrue(os.path.exists(os.path.join(self.t_data_dir,
+                                                    'list-sync.state')))
+
+        adapter.tasks = [t for t in adapter.tasks if t.title != 'google task']
+        self.sync(adapter)
+        self.assertEqual(['local task'], self.get_google_titles())
+        self.assertEqual(1, adapter.writes)
+
+    def test_single_cache_write(self):
+        """Write changes of sync to task list cache once."""
+        tasklists.create_tasklist_cache(None)
+        adapter = ListAdapter([models.Task('local task {0}'.format(i))
+                               for i in range(5)])
+        with mock.patch.object(tasklists, 'write_tasklist_cache',
+                               wraps=tasklists.write_tasklist_cache) as write:
+            self.sync(adapter)
+        self.assertEqual(1, write.call_count)
+        cached = tasklists.load_tasklist_cache()[0]['tasks']
+        self.assertEqual(['local task {0}'.format(i) for i in range(5)] +
+                         ['google task'], [t['title'] for t in cached])
+
+    def test_journal_writes(self):
+        """Record completed operations in journal once per step."""
+        adapter = ListAdapter([models.Task('local task {0}'.format(i))
+                               for i in range(5)])
+        with mock.patch.object(sync, 'mark_done',
+                               wraps=sync.mark_done) as mark_done:
+            self.sync(adapter)
+        # Task added locally, and tasks added on Google
+        self.assertEqual([1, 5], [len(call.args) - 1
+                                  for call in mark_done.call_args_list])
+
+    def test_legacy_journal(self):
+        """Resume journal written with operation kinds of calcurse."""
+        adapter = ListAdapter([])
+        journal_file = os.path.join(self.t_data_dir, 'list-sync.journal')
+        os.makedirs(self.t_data_dir)
+        sync.create_journal(journal_file,
+                            [['add_calcurse', {'title': 'journal task'}]])
+
+        self.sync(adapter)
+        self.assertEqual([models.Task('journal task')], adapter.tasks)
+        self.assertFalse(os.path.exists(journal_file))
+
+    def test_get_adapter(self):
+        """Look up adapters by name."""
+        adapter = engine.get_adapter('calcurse', self.tmp_dir.name)
+        self.assertIsInstance(adapter, calcurse.Adapter)
+        self.assertEqual(self.tmp_dir.name, adapter.data_dir)
+        self.assertEqual(calcurse.CALCURSE_DIR,
+                         engine.get_adapter('calcurse').data_dir)
+        with self.assertRaises(ValueError):
+            engine.get_adapter('unknown')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+
+import unittest
+import contextlib
+
+from taskstodo import batch
+from taskstodo import tasklists
+from taskstodo import tasks
+from taskstodo import taskstodo
+
+import offline
+
+from io import StringIO
+from googleapiclient.errors import HttpError
+
+
+class TestMemoryBackend(offline.OfflineTestCase):
+    """Test in-memory backend of Tasks API."""
+
+    def setUp(self):
+        """Setup test environment."""
+        super().setUp()
+        self.tasklist_id = self.add_tasklist()
+
+    def test_task_commands(self):
+        """Create, move and delete tasks without credentials."""
+        with contextlib.redirect_stdout(StringIO()):
+            tasklists.create_tasklist_cache(None)
+            for title in ['task 1', 'task 2', 'task 3']:
+                tasks.create_task(None, 'test list', title, None, None, False)
+            tasks.move_task(None, 'test list', 0, None, None, False,
+                            match='task 1')
+            tasks.delete_task(None, 'test list', None, None, False,
+                              match='task 2')
+
+        output = StringIO()
+        with contextlib.redirect_stdout(output):
+            tasklists.print_tasklist(None, 'test list', None, False)
+
+        self.assertEqual(['Tasks:', '1. task 1', '2. task 3'],
+                         output.getvalue().splitlines())
+
+    def test_create_at_position(self):
+        """Create tasks at position, after task or as subtask."""
+        store = self.store
+        with contextlib.redirect_stdout(StringIO()):
+            tasklists.create_tasklist_cache(None)
+            for title in ['task 3', 'task 1']:
+                tasks.create_task(None, 'test list', title, None, None, False)
+            store.reset_counters()
+            second = tasks.create_task(None, 'test list', 'task 2', None,
+                                       None, False, position=1)
+            self.assertEqual(1, store.api_calls)
+            tasks.create_task(None, 'test list', 'task 4', None, None, False,
+                              after=second['id'])
+            tasks.create_task(None, 'test list', 'subtask 2', None, None,
+                              False, parent=second['id'])
+            # Positions count subtasks of parent or top-level tasks only
+            tasks.create_task(None, 'test list', 'subtask 1', None, None,
+                              False, position=0, parent=second['id'])
+            tasks.create_task(None, 'test list', 'subtask 3', None, None,
+                              False, position=2, parent=second['id'])
+            tasks.create_task(None, 'test list', 'task 5', None, None,
+                              False, position=4)
+            self.assertIsNone(tasks.create_task(None, 'test list', 'task 9',
+                                                None, None, False,
+                                                position=6))
+
+        titles = ['task 1', 'task 2', 'subtask 1', 'subtask 2', 'subtask 3',
+                  'task 4', 'task 3', 'task 5']
+        cached = tasklists.load_tasklist_cache()[0]['tasks']
+        self.assertEqual(titles, [t['title'] for t in cached])
+        items = [store.tasks[task_id] for task_id, _ in
+                 store.walk_tasks(self.tasklist_id)]
+        self.assertEqual(titles, [item['title'] for item in items])
+        self.assertEqual([second['id']] * 3,
+                         [item.get('parent') for item in items[2:5]])
+
+    def test_positions_and_etags(self):
+        """Insert tasks after previous task and reject stale changes."""
+        first = self.service.tasks().insert(
+            tasklist=self.tasklist_id, body={'title': 'first'}).execute()
+        second = self.service.tasks().insert(
+            tasklist=self.tasklist_id, body={'title': 'second'},
+            previous=first['id']).execute()
+        self.assertLess(first['position'], second['position'])
+
+        updated = self.service.tasks().patch(
+            tasklist=self.tasklist_id, task=first['id'],
+            body={'status': 'completed'}).execute()
+        self.assertNotEqual(first['etag'], updated['etag'])
+        self.assertIn('completed', updated)
+
+        request = self.service.tasks().patch(
+            tasklist=self.tasklist_id, task=first['id'],
+            body={'title': 'stale'})
+        request.headers['If-Match'] = first['etag']
+        with self.assertRaises(HttpError) as cm:
+            request.execute()
+        self.assertEqual(412, cm.exception.resp.status)
+
+    def test_batch_and_paging(self):
+        """Insert tasks in batch requests and list them in pages."""
+        for start in range(0, 150, 50):
+            batch = self.service.new_batch_http_request()
+            for i in range(start, start + 50):
+                batch.add(self.service.tasks().insert(
+                    tasklist=self.tasklist_id, body={'title': str(i)}))
+            batch.execute()
+
+        titles = [t['title'] for t in
+                  tasklists.list_tasks(self.service, self.tasklist_id)]
+        self.assertEqual([str(i) for i in reversed(range(150))], titles)
+
+        with self.assertRaises(HttpError) as cm:
+            self.service.tasks().get(tasklist=self.tasklist_id,
+                                     task='missing').execute()
+        self.assertEqual(404, cm.exception.resp.status)
+
+    def test_batch_command_order(self):
+        """Keep order of tasks created in batch run in any order."""
+        store = self.store
+        store.reverse_batches = True
+        self.service.tasks().insert(tasklist=self.tasklist_id,
+                                    body={'title': 'old task'}).execute()
+        commands = [['task', '-c', 'task 3', 'test list'],
+                    ['task', '-c', 'task 2', 'test list'],
+                    ['task', '-c', 'task 1', 'test list'],
+                    ['task', '-u', 'task 0', '-t', '1', 'test list']]
+        with contextlib.redirect_stdout(StringIO()):
+            batch.run_commands(None, [taskstodo.parse_args(argv)
+                                      for argv in commands], None)
+
+        titles = [item['title'] for item in
+                  sorted(tasklists.list_tasks(self.service,
+                                              self.tasklist_id),
+                         key=lambda item: item['position'])]
+        self.assertEqual(['task 0', 'task 2', 'task 3', 'old task'], titles)
+
+
+if __name__ == '__main__':
+    unittest.main()
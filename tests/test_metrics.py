@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import contextlib
+import multiprocessing
+import urllib.request
+
+from taskstodo import calcurse
+from taskstodo import metrics
+
+import offline
+
+from io import StringIO
+from unittest import mock
+
+
+def count_runs(metrics_file, runs):
+    """Count runs and write each of them to metrics file."""
+    for _ in range(runs):
+        metrics.inc('taskstodo_sync_runs_total', result='success')
+        metrics.write_textfile(metrics_file)
+
+
+class TestMetricsFunctions(offline.OfflineTestCase):
+    """Test metrics of syncs."""
+
+    def setUp(self):
+        """Setup test environment."""
+        super().setUp()
+        self.metrics_file = os.path.join(self.tmp_dir.name, 'taskstodo.prom')
+        self.start_patches([
+            mock.patch.object(metrics, '_samples', {}),
+            mock.patch.object(metrics, '_written', {}),
+        ])
+
+    def test_textfile(self):
+        """Continue counters of earlier runs and replace gauges."""
+        metrics.inc('taskstodo_sync_runs_total', result='success')
+        metrics.observe('taskstodo_sync_duration_seconds', 3)
+        metrics.set_gauge('taskstodo_sync_last_success_timestamp_seconds', 1)
+        metrics.write_textfile(self.metrics_file)
+        # Writing again does not count the same samples twice
+        metrics.write_textfile(self.metrics_file)
+
+        # Next run in a new process
+        metrics._samples.clear()
+        metrics._written.clear()
+        metrics.inc('taskstodo_sync_runs_total', result='success')
+        metrics.observe('taskstodo_sync_duration_seconds', 20)
+        metrics.set_gauge('taskstodo_sync_last_success_timestamp_seconds', 2)
+        metrics.write_textfile(self.metrics_file)
+
+        with open(self.metrics_file) as f:
+            lines = f.read().splitlines()
+        self.assertIn('# TYPE taskstodo_sync_runs_total counter', lines)
+        self.assertIn('taskstodo_sync_runs_total{result="success"} 2', lines)
+        self.assertIn('taskstodo_sync_duration_seconds_bucket{le="5"} 1',
+                      lines)
+        self.assertIn('taskstodo_sync_duration_seconds_bucket{le="+Inf"} 2',
+                      lines)
+        self.assertIn('taskstodo_sync_duration_seconds_sum 23', lines)
+        self.assertIn('taskstodo_sync_last_success_timestamp_seconds 2',
+                      lines)
+
+    def test_textfile_processes(self):
+        """Keep counts of processes writing to the same file together."""
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=count_runs,
+                                   args=(self.metrics_file, 20))
+                   for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        with open(self.metrics_file) as f:
+            self.assertIn('taskstodo_sync_runs_total{result="success"} 80',
+                          f.read().splitlines())
+
+    def test_sync_metrics(self):
+        """Count tasks and API requests of sync."""
+        c_data_dir = os.path.join(self.tmp_dir.name, 'calcurse')
+        os.mkdir(c_data_dir)
+        with open(os.path.join(c_data_dir, 'todo'), 'w') as f:
+            f.write('[0] calcurse task\n')
+
+        self.add_tasklist()
+        with contextlib.redirect_stdout(StringIO()):
+            metrics.record_requests(lambda: calcurse.sync_tasks(
+                None, 'test list', None, False, self.t_data_dir, c_data_dir))
+
+        lines = metrics.render().splitlines()
+        self.assertIn('taskstodo_sync_runs_total{result="success"} 1', lines)
+        self.assertIn('taskstodo_sync_tasks_total{change="added",'
+                      'side="google"} 1', lines)
+        self.assertIn('taskstodo_api_requests_total{code="200",'
+                      'method="tasks.tasks.insert"} 1', lines)
+        self.assertTrue(any(line.startswith('taskstodo_lock_wait_seconds')
+                            for line in lines))
+
+    def test_server(self):
+        """Serve metrics over HTTP."""
+        metrics.inc('taskstodo_sync_runs_total', result='failed')
+        server = metrics.start_server(0)
+        self.addCleanup(server.shutdown)
+
+        with urllib.request.urlopen('http://127.0.0.1:{0}/metrics'.format(
+                server.server_port)) as response:
+            content = response.read().decode()
+        self.assertIn('taskstodo_sync_runs_total{result="failed"} 1',
+                      content.splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
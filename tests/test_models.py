@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+
+import unittest
+
+from taskstodo import models
+from taskstodo import sync
+
+
+class TestModels(unittest.TestCase):
+    """Test task and task list models."""
+
+    def test_task_from_item(self):
+        """Create task from task item and convert it to cache format."""
+        item = {'id': 'task1', 'title': 'buy bread', 'notes': 'whole grain',
+                'updated': '2024-01-01T00:00:00.000Z',
+                'position': '00000000000000000001'}
+        task = models.Task.from_item(item)
+        self.assertEqual('whole grain', task.note)
+        self.assertEqual(task, models.Task.from_dict(task.to_dict()))
+        self.assertEqual({'title': 'buy bread', 'note': 'whole grain'},
+                         task.content())
+        self.assertEqual({'title': 'buy bread'},
+                         models.Task('buy bread').content())
+
+    def test_task_immutable(self):
+        """Refuse changes to tasks and return changed copies instead."""
+        task = models.Task('buy bread', id='task1')
+        with self.assertRaises(AttributeError):
+            task.title = 'buy milk'
+        with self.assertRaises(AttributeError):
+            task.done = True
+
+        changed = task.replace(title='buy milk')
+        self.assertEqual('buy bread', task.title)
+        self.assertEqual(('buy milk', 'task1'), (changed.title, changed.id))
+        self.assertEqual(1, len({task, models.Task('buy bread', id='task1')}))
+
+    def test_task_fingerprint(self):
+        """Match fingerprint of task dictionary with same content."""
+        task = models.Task('buy bread', 'whole grain', id='task1')
+        self.assertEqual(sync.fingerprint({'title': 'buy bread',
+                                           'note': 'whole grain'}),
+                         sync.fingerprint(task))
+
+    def test_tasklist_from_item(self):
+        """Sort tasks of task list by position."""
+        task_items = [
+            {'id': 'task{0}'.format(i), 'title': 'task {0}'.format(i),
+             'updated': '2024-01-01T00:00:00.000Z',
+             'position': '{0:020d}'.format(i)} for i in (2, 0, 1)]
+        tasklist = models.TaskList.from_item(
+            {'id': 'list1', 'title': 'test list'}, task_items)
+        self.assertEqual(['task0', 'task1', 'task2'],
+                         [t.id for t in tasklist.tasks])
+        with self.assertRaises(AttributeError):
+            tasklist.title = 'other list'
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import contextlib
+
+from taskstodo import accounts
+from taskstodo import outbox
+from taskstodo import tasklists
+from taskstodo import search
+
+import offline
+
+from io import StringIO
+from unittest import mock
+from googleapiclient.errors import HttpError
+
+
+class TestOutboxFunctions(offline.OfflineTestCase):
+    """Test task changes sent in background with in-memory backend."""
+
+    def setUp(self):
+        """Setup test environment."""
+        super().setUp()
+        self.start_patches([
+            mock.patch.object(outbox, 'DATA_DIR', self.t_data_dir),
+            mock.patch.object(outbox, 'OUTBOX_FILE', os.path.join(
+                self.t_data_dir, 'outbox.jsonl')),
+            mock.patch.object(outbox, 'RETRY_DELAY', 0),
+            # Changes are sent by tests instead of worker
+            mock.patch.object(outbox, 'start_worker'),
+        ])
+
+        self.tasklist = self.service.tasklists().insert(
+            body={'title': 'test list'}).execute()
+        self.service.tasks().insert(tasklist=self.tasklist['id'],
+                                    body={'title': 'old task'}).execute()
+        tasklists.create_tasklist_cache(None)
+
+    def get_cached_titles(self):
+        return [t['title'] for t in
+                tasklists.load_tasklist_cache()[0]['tasks']]
+
+    def get_server_titles(self):
+        return [t.title for t in
+                tasklists.get_tasklist(None, 'test list', None).tasks]
+
+    def test_queue_changes(self):
+        """Apply changes to cache before sending them in order."""
+        task_id = outbox.queue_create(None, 'test list', 'new task', None,
+                                      None, False)
+        outbox.queue_change(None, 'test list', None, None, False,
+                            match='new task', body={'notes': 'new note'})
+        outbox.queue_change(None, 'test list', 1, None, False, delete=True)
+
+        self.assertTrue(outbox.is_local_id(task_id))
+        self.assertEqual(['new task'], self.get_cached_titles())
+        self.assertEqual(['old task'], self.get_server_titles())
+
+        # Queued changes survive cache refresh
+        tasklists.create_tasklist_cache(None)
+        self.assertEqual(['new task'], self.get_cached_titles())
+
+        self.assertTrue(outbox.push(None))
+        self.assertFalse(os.path.exists(outbox.OUTBOX_FILE))
+        tasklist = tasklists.get_tasklist(None, 'test list', None)
+        self.assertEqual([('new task', 'new note')],
+                         [(t.title, t.note) for t in tasklist.tasks])
+        cached = tasklists.load_tasklist_cache()[0]['tasks']
+        self.assertEqual([tasklist.tasks[0].id], [t['id'] for t in cached])
+
+    def test_queue_create_after(self):
+        """Create task after queued task once that is created."""
+        first_id = outbox.queue_create(None, 'test list', 'first task', None,
+                                       None, False, position=1)
+        outbox.queue_create(None, 'test list', 'second task', None, None,
+                            False, after=first_id)
+        titles = ['old task', 'first task', 'second task']
+        self.assertEqual(titles, self.get_cached_titles())
+
+        self.assertTrue(outbox.push(None))
+        self.assertEqual(titles, self.get_server_titles())
+        self.assertEqual(titles, self.get_cached_titles())
+
+    def test_retry(self):
+        """Keep changes queued until server can be reached."""
+        outbox.queue_create(None, 'test list', 'new task', None, None, False)
+
+        unavailable = HttpError(mock.Mock(status=503), b'')
+        with mock.patch.object(outbox, 'send_op', side_effect=unavailable), \
+                contextlib.redirect_stderr(StringIO()):
+            self.assertFalse(outbox.push(None))
+        self.assertEqual(1, len(outbox.get_pending()[0]))
+
+        self.assertTrue(outbox.push(None))
+        self.assertEqual(['new task', 'old task'], self.get_server_titles())
+
+    def test_worker_failure(self):
+        """Exit worker with error status if server cannot be reached."""
+        outbox.queue_create(None, 'test list', 'new task', None, None, False)
+
+        unavailable = HttpError(mock.Mock(status=503), b'')
+        with mock.patch.object(outbox, 'send_op', side_effect=unavailable), \
+                mock.patch.object(accounts, 'CFG_DIR', self.tmp_dir.name), \
+                mock.patch.object(accounts, '_account', None), \
+                contextlib.redirect_stderr(StringIO()), \
+                self.assertRaises(SystemExit) as context:
+            outbox.main()
+        self.assertEqual(1, context.exception.code)
+        self.assertEqual(1, len(outbox.get_pending()[0]))
+
+    def test_search_queued_change(self):
+        """Find new title of task in search index before it is sent."""
+        db, fts = search.open_index(os.path.join(self.tmp_dir.name,
+                                                 'search.db'))
+        self.addCleanup(db.close)
+        search.update_index(db, tasklists.CACHE_FILE)
+
+        for title in ['new title', 'newer title']:
+            outbox.queue_change(None, 'test list', 0, None, False,
+                                body={'title': title})
+            search.update_index(db, tasklists.CACHE_FILE)
+            results = search.search_tasks(db, fts, title, 10)
+            self.assertEqual([title], [r['title'] for r in results])
+
+    def test_resume_sent_create(self):
+        """Do not create task again if it was sent before worker stopped."""
+        task_id = outbox.queue_create(None, 'test list', 'new task', None,
+                                      None, False)
+        outbox.append_records([{'sent': 0}])
+        self.service.tasks().insert(tasklist=self.tasklist['id'],
+                                    body={'title': 'new task'}).execute()
+
+        self.assertTrue(outbox.push(None))
+        self.assertEqual(['new task', 'old task'], self.get_server_titles())
+        cached = tasklists.load_tasklist_cache()[0]['tasks']
+        self.assertNotIn(task_id, [t['id'] for t in cached])
+
+    def test_resume_unsent_create(self):
+        """Do not take existing task with same title for created task."""
+        outbox.queue_create(None, 'test list', 'old task', None, None, False)
+        outbox.append_records([{'sent': 0}])
+
+        self.assertTrue(outbox.push(None))
+        self.assertEqual(['old task', 'old task'], self.get_server_titles())
+
+    def test_failed_change(self):
+        """Drop changes of tasks the server does not have."""
+        outbox.queue_change(None, 'test list', 0, None, False,
+                            body={'title': 'new title'})
+        self.service.tasks().delete(
+            tasklist=self.tasklist['id'],
+            task=tasklists.load_tasklist_cache()[0]['tasks'][0]['id']
+        ).execute()
+
+        with contextlib.redirect_stderr(StringIO()) as stderr:
+            self.assertTrue(outbox.push(None))
+        self.assertIn('Failed to patch task', stderr.getvalue())
+        self.assertEqual([], self.get_server_titles())
+
+    def test_worker_without_creds(self):
+        """Keep changes queued if worker has no stored credentials."""
+        outbox.queue_create(None, 'test list', 'new task', None, None, False)
+
+        flow = 'google_auth_oauthlib.flow.InstalledAppFlow'
+        with mock.patch.dict(os.environ, {'TASKSTODO_BACKEND': 'google'}), \
+                mock.patch.object(accounts, 'CFG_DIR', self.tmp_dir.name), \
+                mock.patch.object(accounts, '_account', None), \
+                mock.patch(flow) as login, \
+                contextlib.redirect_stderr(StringIO()) as stderr, \
+                self.assertRaises(SystemExit):
+            os.environ.pop('TASKSTODO_ACCOUNT', None)
+            outbox.main()
+        login.assert_not_called()
+        self.assertIn('No valid credentials', stderr.getvalue())
+        self.assertEqual(1, len(outbox.get_pending()[0]))
+
+
+if __name__ == '__main__':
+    unittest.main()
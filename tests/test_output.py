@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+
+from taskstodo import output
+
+from io import StringIO
+
+
+class TestOutputFunctions(unittest.TestCase):
+    """Test machine-readable output functions."""
+
+    def setUp(self):
+        """Setup test environment."""
+        self.records = [{'title': 'test task 1', 'note': None},
+                        {'title': 'test\ttask 2', 'note': 'test\nnote'}]
+        self.fields = ['title', 'note']
+        self.output = StringIO()
+
+    def test_write_json(self):
+        """Write records as JSON array."""
+        output.write_records(iter(self.records), 'json', self.fields,
+                             self.output)
+        self.assertEqual(self.records, json.loads(self.output.getvalue()))
+
+    def test_write_json_error(self):
+        """Close JSON array if records cannot be produced."""
+        def records():
+            yield self.records[0]
+            raise OSError('test error')
+
+        with self.assertRaises(OSError):
+            output.write_records(records(), 'json', self.fields,
+                                 self.output)
+        self.assertEqual(self.records[:1], json.loads(self.output.getvalue()))
+
+    def test_write_ndjson(self):
+        """Write records as one JSON object per line."""
+        output.write_records(iter(self.records), 'ndjson', self.fields,
+                             self.output)
+        lines = self.output.getvalue().splitlines()
+        self.assertEqual(self.records, [json.loads(line) for line in lines])
+
+    def test_write_tsv(self):
+        """Write records as tab-separated values."""
+        output.write_records(iter(self.records), 'tsv', self.fields,
+                             self.output)
+        self.assertEqual(['title\tnote', 'test task 1\t',
+                          'test\\ttask 2\ttest\\nnote'],
+                         self.output.getvalue().splitlines())
+
+
+if __name__ == '__main__':
+    unittest.main()
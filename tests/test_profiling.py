@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import pstats
+import tempfile
+
+from taskstodo import profiling
+from taskstodo import sync
+
+from io import StringIO
+from contextlib import redirect_stderr
+
+
+class TestProfilingFunctions(unittest.TestCase):
+    """Test profiling of commands."""
+
+    def setUp(self):
+        """Setup test environment."""
+        self.tasks = [{'title': 'test task {0}'.format(i)}
+                      for i in range(100)]
+
+    def run_command(self):
+        """Run function of package to profile."""
+        return [sync.fingerprint(task) for task in self.tasks]
+
+    def test_cpu_profile(self):
+        """Write statistics of package functions to file."""
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            report_file = os.path.join(tmp_dir, 'profile.out')
+            result = profiling.run(self.run_command, 'cpu', report_file)
+            stats = pstats.Stats(report_file)
+
+        self.assertEqual(100, len(result))
+        functions = [func[2] for func in stats.stats]
+        self.assertIn('fingerprint', functions)
+
+    def test_memory_profile(self):
+        """Report memory allocated by lines of package."""
+        output = StringIO()
+        with redirect_stderr(output):
+            profiling.run(self.run_command, 'mem')
+
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[0].startswith('Peak memory:'))
+        self.assertTrue(any('taskstodo/' in line for line in lines[4:]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import json
+import tempfile
+
+from taskstodo import memory
+from taskstodo import replay
+
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+
+
+class TestReplayFunctions(unittest.TestCase):
+    """Test recording and replaying of API requests."""
+
+    def setUp(self):
+        """Setup test environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        """Remove test files."""
+        self.tmp_dir.cleanup()
+
+    def run_requests(self, service):
+        """Create task list and tasks in batch, and list them."""
+        tasklist = service.tasklists().insert(
+            body={'title': 'test list'}).execute()
+
+        results = []
+        batch = service.new_batch_http_request(
+            callback=lambda request_id, response, exception:
+                results.append(response['title']))
+        for title in ['task 1', 'task 2']:
+            batch.add(service.tasks().insert(tasklist=tasklist['id'],
+                                             body={'title': title}))
+        batch.execute()
+
+        items = service.tasks().list(tasklist=tasklist['id']).execute()
+        return results, [item['title'] for item in items['items']]
+
+    def test_record_and_replay(self):
+        """Replay responses to the same requests without a server."""
+        http = replay.RecordingHttp(memory.MemoryHttp(memory.MemoryTasks()),
+                                    self.tmp_dir.name)
+        recorded = self.run_requests(build('tasks', 'v1', http=http))
+
+        http = replay.ReplayHttp(replay.read_records(self.tmp_dir.name), 0)
+        replayed = self.run_requests(build('tasks', 'v1', http=http))
+        self.assertEqual(recorded, replayed)
+        self.assertEqual((['task 1', 'task 2'], ['task 2', 'task 1']),
+                         replayed)
+
+        with self.assertRaises(HttpError) as cm:
+            build('tasks', 'v1', http=http).tasklists().list().execute()
+        self.assertEqual(501, cm.exception.resp.status)
+
+    def test_redact_tokens(self):
+        """Leave tokens out of recorded headers."""
+        class TokenHttp(memory.MemoryHttp):
+            def request(self, uri, method='GET', body=None, headers=None,
+                        **kwargs):
+                resp, content = super().request(uri, method, body, headers)
+                resp['set-cookie'] = 'secret'
+                return resp, content
+
+        http = replay.RecordingHttp(TokenHttp(memory.MemoryTasks()),
+                                    self.tmp_dir.name)
+        service = build('tasks', 'v1', http=http)
+        request = service.tasklists().list()
+        request.headers['Authorization'] = 'Bearer secret'
+        request.execute()
+
+        with open(os.path.join(self.tmp_dir.name, replay.RECORD_FILE)) as f:
+            record = json.loads(f.readline())
+        self.assertNotIn('secret', json.dumps(record))
+        self.assertEqual('[REDACTED]', record['headers']['Authorization'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import json
+import shutil
+
+from taskstodo import search
+
+TEMP_DIR = os.path.join(os.getcwd(), 'temp')
+
+
+class TestSearchFunctions(unittest.TestCase):
+    """Test search index functions."""
+
+    def setUp(self):
+        """Setup test environment."""
+        try:
+            os.mkdir(TEMP_DIR)
+        except FileExistsError:
+            pass
+
+        self.cache_file = os.path.join(TEMP_DIR, 'tasklists.json')
+        self.tasklists = [
+            {'id': 'list1', 'title': 'test list', 'tasks': [
+                {'id': 'task1', 'title': 'buy milk', 'note': None,
+                 'updated': '1'},
+                {'id': 'task2', 'title': 'call bank', 'note': 'about loan',
+                 'updated': '1'}]},
+            {'id': 'list2', 'title': 'test list', 'tasks': [
+                {'id': 'task3', 'title': 'milk cow', 'note': None,
+                 'updated': '1'}]}]
+        self.writeCache()
+
+        self.db, self.fts = search.open_index(os.path.join(TEMP_DIR,
+                                                           'search.db'))
+
+    def writeCache(self):
+        """Write task list cache file."""
+        with open(self.cache_file, 'w') as f:
+            json.dump(self.tasklists, f)
+
+    def test_search_tasks(self):
+        """Find tasks by title and note."""
+        search.update_index(self.db, self.cache_file)
+
+        results = search.search_tasks(self.db, self.fts, 'milk', 10)
+        self.assertEqual({'task1', 'task3'}, {r['id'] for r in results})
+
+        results = search.search_tasks(self.db, self.fts, 'loa', 10)
+        self.assertEqual(1, len(results))
+        self.assertEqual(('test list', 1, 2), (results[0]['list_title'],
+                                               results[0]['list_num'],
+                                               results[0]['task_num']))
+
+    def test_update_index(self):
+        """Update index with changed and deleted tasks."""
+        search.update_index(self.db, self.cache_file)
+
+        self.tasklists[0]['tasks'][0] = {'id': 'task1', 'title': 'buy bread',
+                                         'note': None, 'updated': '2'}
+        del self.tasklists[1]
+        self.writeCache()
+        os.utime(self.cache_file, ns=(0, 0))
+        search.update_index(self.db, self.cache_file)
+
+        self.assertEqual([], search.search_tasks(self.db, self.fts, 'milk',
+                                                 10))
+        results = search.search_tasks(self.db, self.fts, 'bread', 10)
+        self.assertEqual(['task1'], [r['id'] for r in results])
+
+    def test_move_not_reindexed(self):
+        """Only update positions of moved tasks in index."""
+        if not self.fts:
+            self.skipTest('SQLite was built without FTS5')
+        search.update_index(self.db, self.cache_file)
+        segments = self.db.execute(
+            'SELECT COUNT(*) FROM tasks_fts_data').fetchone()
+
+        self.tasklists[0]['tasks'].reverse()
+        self.writeCache()
+        os.utime(self.cache_file, ns=(0, 0))
+        search.update_index(self.db, self.cache_file)
+
+        self.assertEqual(segments, self.db.execute(
+            'SELECT COUNT(*) FROM tasks_fts_data').fetchone())
+        results = search.search_tasks(self.db, self.fts, 'bank', 10)
+        self.assertEqual([1], [r['task_num'] for r in results])
+
+    def tearDown(self):
+        """Cleanup test environment."""
+        self.db.close()
+        shutil.rmtree(TEMP_DIR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import shutil
+
+from taskstodo import sync
+
+TEMP_DIR = os.path.join(os.getcwd(), 'temp')
+
+
+class TestSyncFunctions(unittest.TestCase):
+    """Test sync state and journal functions."""
+
+    def setUp(self):
+        """Setup test environment."""
+        try:
+            os.mkdir(TEMP_DIR)
+        except FileExistsError:
+            pass
+
+        self.state_file = os.path.join(TEMP_DIR, 'sync.state')
+        self.journal_file = os.path.join(TEMP_DIR, 'sync.journal')
+
+    def test_fingerprint(self):
+        """Fingerprint tasks by title and note."""
+        task = {'title': 'test task'}
+        task_none = {'title': 'test task', 'note': None}
+        task_note = {'title': 'test task', 'note': 'test note'}
+        self.assertEqual(sync.fingerprint(task), sync.fingerprint(task_none))
+        self.assertNotEqual(sync.fingerprint(task),
+                            sync.fingerprint(task_note))
+
+    def test_update_state(self):
+        """Add and remove fingerprints from state file."""
+        fp_1 = sync.fingerprint({'title': 'test task 1'})
+        fp_2 = sync.fingerprint({'title': 'test task 2'})
+        synced = sync.update_state(self.state_file, set(), [fp_1, fp_2], [])
+        synced = sync.update_state(self.state_file, synced, [], [fp_1])
+
+        self.assertEqual({fp_2}, synced)
+        self.assertEqual({fp_2}, sync.load_state(self.state_file))
+
+    def test_resume_journal(self):
+        """Load planned and completed operations from journal."""
+        ops = [['add_google', {'title': 'test task 1'}],
+               ['add_google', {'title': 'test task 2'}]]
+        sync.create_journal(self.journal_file, ops)
+        sync.mark_done(self.journal_file, 1)
+
+        # Simulate partially written record
+        with open(self.journal_file, 'a') as f:
+            f.write('{"do')
+
+        journal_ops, state, done = sync.load_journal(self.journal_file)
+        self.assertEqual(ops, journal_ops)
+        self.assertEqual({1}, done)
+
+        sync.remove_journal(self.journal_file)
+        self.assertIsNone(sync.load_journal(self.journal_file))
+
+    def tearDown(self):
+        """Cleanup test environment."""
+        shutil.rmtree(TEMP_DIR)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,10 +3,14 @@
 import unittest
 import os
 import sys
+import json
+import contextlib
 
 from taskstodo import tasklists
 from taskstodo import tasks
 
+import offline
+
 from io import StringIO
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
@@ -126,5 +130,23 @@ class TestTasklistFunctions(unittest.TestCase):
             tasklists.delete_tasklist(self.creds, self.title, 0, False)
 
 
+class TestOfflineTasklists(offline.OfflineTestCase):
+    """Test task list functions with in-memory backend."""
+
+    def test_get_tasklist_ndjson(self):
+        """Get task list as one JSON object per task."""
+        self.add_tasklist()
+        for title in ['task 2', 'task 1']:
+            tasks.create_task(None, 'test list', title, None, None, False)
+
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            tasklists.print_tasklist(None, 'test list', None, False,
+                                     'ndjson')
+
+        lines = stdout.getvalue().splitlines()
+        self.assertEqual(['task 1', 'task 2'],
+                         [json.loads(line)['title'] for line in lines])
+
+
 if __name__ == '__main__':
     unittest.main()
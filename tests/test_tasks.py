@@ -3,9 +3,14 @@
 import unittest
 import os
 import sys
+import contextlib
 
 from taskstodo import tasklists
 from taskstodo import tasks
+from taskstodo import batch
+from taskstodo import taskstodo
+
+import offline
 
 from io import StringIO
 from google.auth.transport.requests import Request
@@ -133,5 +138,73 @@ class TestTaskFunctions(unittest.TestCase):
             tasklists.delete_tasklist(self.creds, self.list_title, 0, False)
 
 
+class TestOfflineTasks(offline.OfflineTestCase):
+    """Test task functions with in-memory backend."""
+
+    def setUp(self):
+        """Setup test environment."""
+        super().setUp()
+        self.tasklist_id = self.add_tasklist()
+
+    def get_server_titles(self):
+        return [t.title for t in
+                tasklists.get_tasklist(None, 'test list', None).tasks]
+
+    def test_select_task(self):
+        """Update tasks selected by title and ID."""
+        tasks.create_task(None, 'test list', 'other task', None, None, False)
+        result = tasks.create_task(None, 'test list', 'test task', None, None,
+                                   False)
+
+        new_title = 'new test task'
+        tasks.update_task(None, 'test list', new_title, None, None, False,
+                          match='test task')
+
+        note = 'test note'
+        tasks.create_note(None, 'test list', note, None, None, False,
+                          task_id=result['id'])
+
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            tasklists.print_tasklist(None, 'test list', None, False)
+
+        lines = stdout.getvalue().splitlines()
+        self.assertIn(f'1. {new_title}', lines)
+        self.assertIn(f'  Note: {note}', lines)
+        self.assertIn('2. other task', lines)
+
+    def test_batch_changes(self):
+        """Create, place and update tasks in batch requests."""
+        tasks.create_task(None, 'test list', 'test task', None, None, False)
+
+        commands = [['task', '-c', 'new test task', 'test list'],
+                    ['task', '-u', 'updated task', '-t', '2', 'test list'],
+                    ['task', '-c', 'placed task', '-p', '2', 'test list']]
+        commands = [taskstodo.parse_args(argv) for argv in commands]
+        with contextlib.redirect_stdout(StringIO()):
+            batch.run_commands(None, commands, taskstodo.run_command)
+
+        titles = ['new test task', 'placed task', 'updated task']
+        self.assertEqual(titles, self.get_server_titles())
+        self.assertEqual(titles, [t['title'] for t in
+                                  tasklists.load_tasklist_cache()[0]['tasks']])
+
+    def test_batch_position(self):
+        """Place task at position among tasks created earlier in batch."""
+        batch_file = os.path.join(self.tmp_dir.name, 'batch')
+        with open(batch_file, 'w') as f:
+            f.write("task -c 'task 3' 'test list'\n"
+                    "task -c 'task 1' 'test list'\n"
+                    "task -c 'task 2' -p 2 'test list'\n")
+        with contextlib.redirect_stdout(StringIO()) as stdout:
+            taskstodo.run_command(taskstodo.parse_args(['batch',
+                                                        batch_file]))
+
+        self.assertNotIn('out of range', stdout.getvalue())
+        titles = ['task 1', 'task 2', 'task 3']
+        self.assertEqual(titles, self.get_server_titles())
+        self.assertEqual(titles, [t['title'] for t in
+                                  tasklists.load_tasklist_cache()[0]['tasks']])
+
+
 if __name__ == '__main__':
     unittest.main()
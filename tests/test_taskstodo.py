@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import subprocess
+import sys
+
+from taskstodo import daemon
+from taskstodo import taskstodo
+
+from unittest import mock
+
+# Budget for importing the command-line entry point in microseconds
+IMPORT_TIME_BUDGET = 100000
+
+HEAVY_MODULES = ['googleapiclient', 'google_auth_oauthlib', 'google.oauth2',
+                 'httplib2']
+
+
+class TestStartup(unittest.TestCase):
+    """Test start up time of command-line entry point."""
+
+    def test_import_time(self):
+        """Import entry point within time budget."""
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                                 'import taskstodo.taskstodo'],
+                                capture_output=True, text=True, check=True)
+
+        import_time = None
+        for line in result.stderr.splitlines():
+            fields = line.split('|')
+            if fields[-1].strip() == 'taskstodo.taskstodo':
+                import_time = int(fields[1])
+
+        self.assertIsNotNone(import_time)
+        self.assertLess(import_time, IMPORT_TIME_BUDGET)
+
+    def test_help_skips_google_modules(self):
+        """Show help without loading Google modules."""
+        code = ('import sys\n'
+                'from taskstodo import taskstodo\n'
+                'sys.argv = ["taskstodo", "--help"]\n'
+                'try:\n'
+                '    taskstodo.main()\n'
+                'except SystemExit:\n'
+                '    pass\n'
+                'print(*sys.modules, file=sys.stderr)\n')
+        result = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+
+        self.assertIn('usage:', result.stdout)
+        modules = result.stderr.split()
+        for module in HEAVY_MODULES:
+            self.assertNotIn(module, modules)
+
+    def test_calcurse_skips_engine(self):
+        """Import calcurse functions without loading sync engine."""
+        code = ('import sys\n'
+                'from taskstodo import calcurse\n'
+                'print(*sys.modules, file=sys.stderr)\n')
+        result = subprocess.run([sys.executable, '-c', code],
+                                capture_output=True, text=True, check=True)
+
+        modules = result.stderr.split()
+        for module in HEAVY_MODULES + ['taskstodo.engine', 'asyncio',
+                                       'http.server']:
+            self.assertNotIn(module, modules)
+
+
+class TestDaemon(unittest.TestCase):
+    """Test running commands in daemon."""
+
+    def test_run_request(self):
+        """Capture output and exit status of command."""
+
+        def run_argv(argv):
+            print(' '.join(argv))
+            print(os.getcwd(), file=sys.stderr)
+            sys.exit(2)
+
+        request = {'argv': ['list', 'test list'], 'cwd': '/'}
+        response = daemon.run_request(request, run_argv)
+        self.assertEqual('list test list\n', response['stdout'])
+        self.assertEqual('/\n', response['stderr'])
+        self.assertEqual(2, response['status'])
+
+    def test_invalid_request(self):
+        """Answer malformed requests with failed status."""
+        for line in [b'{"argv": ', b'{"cwd": "/"}\n', b'[]\n',
+                     b'{"argv": ["list"], "cwd": "/missing"}\n']:
+            response = daemon.handle_request(line, None)
+            self.assertEqual(1, response['status'])
+            self.assertIn('Invalid request', response['stderr'])
+
+        response = daemon.handle_request(b'{"argv": null}\n', None)
+        self.assertEqual(0, response['status'])
+
+    def test_daemon_argv(self):
+        """Pass options set by environment variables to daemon."""
+        argv = ['task', '-c', 'new task', 'test list']
+        with mock.patch.dict(os.environ, {'TASKSTODO_BACKGROUND': '1',
+                                          'TASKSTODO_ACCOUNT': 'work'}):
+            args = taskstodo.parse_args(argv)
+        daemon_argv = taskstodo.get_daemon_argv(args, argv)
+        self.assertEqual(['--account', 'work'] + argv + ['--background'],
+                         daemon_argv)
+        with mock.patch.dict(os.environ, {}, clear=True):
+            self.assertTrue(taskstodo.parse_args(daemon_argv).background)
+
+
+if __name__ == '__main__':
+    unittest.main()
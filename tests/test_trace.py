@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+
+import unittest
+import json
+
+from taskstodo import trace
+
+from io import StringIO
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import HttpMockSequence
+
+
+class TestTraceFunctions(unittest.TestCase):
+    """Test tracing of API requests."""
+
+    def setUp(self):
+        """Setup test environment."""
+        trace.start()
+
+    def tearDown(self):
+        """Stop tracing."""
+        trace.stop()
+
+    def test_trace_requests(self):
+        """Record method, task list and size of requests."""
+        body = json.dumps({'items': [{'id': 'task1'}]})
+        http = HttpMockSequence([({'status': '200'}, body),
+                                 ({'status': '404'}, '{}')])
+        service = build('tasks', 'v1', **trace.build_args(None, http))
+
+        service.tasks().list(tasklist='list1').execute()
+        with self.assertRaises(HttpError):
+            service.tasks().get(tasklist='list1', task='task2').execute()
+        trace.record_cache('tasklists', True)
+
+        records = trace.stop()
+        requests = [r for r in records if r['type'] == 'request']
+        self.assertEqual(['tasks.tasks.list', 'tasks.tasks.get'],
+                         [r['method'] for r in requests])
+        self.assertEqual(['list1', 'list1'],
+                         [r['tasklist'] for r in requests])
+        self.assertEqual([200, 404], [r['status'] for r in requests])
+        self.assertEqual(len(body), requests[0]['response_bytes'])
+
+        output = StringIO()
+        trace.write_summary(records, output)
+        lines = output.getvalue().splitlines()
+        self.assertTrue(lines[1].startswith('tasks.tasks.list'))
+        self.assertIn('Cache tasklists: 1 hits, 0 misses', lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+import unittest
+import os
+import json
+import tempfile
+
+from taskstodo import transfer
+
+
+class TestTransferFunctions(unittest.TestCase):
+    """Test export and import functions."""
+
+    def setUp(self):
+        """Setup test environment."""
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.items = [
+            {'id': 'list1', 'title': 'test list 1'},
+            {'id': 'task2', 'title': 'task 2', 'position': '2',
+             'tasklist': 'list1'},
+            {'id': 'task1', 'title': 'task 1', 'position': '1',
+             'tasklist': 'list1'},
+            {'id': 'task3', 'title': 'task 3', 'position': '0',
+             'parent': 'task1', 'tasklist': 'list1'},
+            {'id': 'list2', 'title': 'test list 2'},
+        ]
+
+    def tearDown(self):
+        """Remove test files."""
+        self.tmp_dir.cleanup()
+
+    def test_compressed_export(self):
+        """Read task lists from gzip compressed export."""
+        export_file = os.path.join(self.tmp_dir.name, 'export.ndjson.gz')
+        with transfer.open_export(export_file, 'w') as f:
+            for item in self.items:
+                f.write(json.dumps(item) + '\n')
+
+        with open(export_file, 'rb') as f:
+            self.assertEqual(transfer.GZIP_MAGIC, f.read(2))
+
+        with transfer.open_export(export_file, 'r') as f:
+            tasklists = list(transfer.read_export(f))
+
+        self.assertEqual(['list1', 'list2'],
+                         [t[0]['id'] for t in tasklists])
+        self.assertEqual(['task2', 'task1', 'task3'],
+                         [t['id'] for t in tasklists[0][1]])
+        self.assertEqual([], tasklists[1][1])
+
+    def test_task_order(self):
+        """Group tasks by parent in position order."""
+        children = transfer.get_task_order(self.items[1:4])
+        self.assertEqual(['task1', 'task2'],
+                         [t['id'] for t in children[None]])
+        self.assertEqual(['task3'], [t['id'] for t in children['task1']])
+
+    def test_load_import_state(self):
+        """Resume import only for same source."""
+        state_file = os.path.join(self.tmp_dir.name, 'import.state')
+        with open(state_file, 'w') as f:
+            f.write(json.dumps({'source': '/export.ndjson'}) + '\n')
+            f.write('list1 new1\ntask1 new2\ndone list1\ntask2')
+
+        ids, done = transfer.load_import_state(state_file, '/export.ndjson')
+        self.assertEqual({'list1': 'new1', 'task1': 'new2'}, ids)
+        self.assertEqual({'list1'}, done)
+
+        ids, done = transfer.load_import_state(state_file, '/other.ndjson')
+        self.assertEqual(({}, set()), (ids, done))
+
+
+if __name__ == '__main__':
+    unittest.main()